@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Gemini の構造化JSON出力
+=====================
+response_mime_type="application/json" と response_schema で、
+マッチング結果とカテゴリ一覧を型付きJSONとして受け取る。
+
+応答はローカルで修復・検証し、不正なキーがあればそのキーだけを
+1回だけ聞き直す（全体の再実行はしない）。
+"""
+
+import re
+import json
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import google.generativeai as genai
+
+from records import Category
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Schemas
+# ============================================================================
+MAPPING_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "No": {"type": "integer"},
+            "Group": {"type": "integer"},
+        },
+        "required": ["No", "Group"],
+    },
+}
+
+# 確信度付きのマッチング結果（カスケードで使う）
+MAPPING_CONFIDENCE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "No": {"type": "integer"},
+            "Group": {"type": "integer"},
+            "Confidence": {"type": "number"},
+        },
+        "required": ["No", "Group", "Confidence"],
+    },
+}
+
+CATEGORY_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "No": {"type": "integer"},
+            "Category": {"type": "string"},
+            "SubItems": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["No", "Category"],
+    },
+}
+
+
+def json_config(schema: Dict) -> genai.GenerationConfig:
+    """構造化JSON出力用の GenerationConfig"""
+    return genai.GenerationConfig(response_mime_type="application/json", response_schema=schema)
+
+
+# ============================================================================
+# Parse & Repair
+# ============================================================================
+_TRAILING_COMMA = re.compile(r',\s*([\]}])')
+
+
+def parse_json_lenient(text: str):
+    """
+    JSONを読み取る（コードブロック・前後の説明文・末尾カンマを修復）
+
+    Raises:
+        ValueError: 修復しても読めない場合
+    """
+    text = (text or "").strip()
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    # 最初の [ / { から対応する最後の ] / } までを取り出す
+    starts = [i for i in (text.find('['), text.find('{')) if i >= 0]
+    if starts:
+        start = min(starts)
+        end = text.rfind(']' if text[start] == '[' else '}')
+        if end > start:
+            candidate = _TRAILING_COMMA.sub(r'\1', text[start:end + 1])
+            try:
+                return json.loads(candidate)
+            except ValueError:
+                pass
+    raise ValueError(f"JSONとして解析できません: {text[:200]}")
+
+
+def _as_int(value) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and re.fullmatch(r'\s*-?\d+\s*', value):
+        return int(value)
+    return None
+
+
+def _mapping_pairs(raw) -> List[Tuple[object, object]]:
+    """[{"No", "Group"}] 形式と {"1": 3} 形式の両方を (No, Group) の列にする"""
+    if isinstance(raw, dict):
+        return list(raw.items())
+    pairs = []
+    if isinstance(raw, list):
+        for item in raw:
+            if isinstance(item, dict):
+                pairs.append((item.get('No'), item.get('Group')))
+    return pairs
+
+
+def validate_mapping(raw, category_nos: Sequence[int], group_count: int) -> Tuple[Dict[int, int], List[int]]:
+    """
+    マッチング結果を検証
+
+    Returns:
+        (mapping, invalid_nos):
+            mapping: {pdf_no: group_index}（マッチなし -1 は含めない）
+            invalid_nos: 欠落・範囲外・重複割り当てで聞き直しが必要な No
+    """
+    wanted = set(category_nos)
+    answered = {}
+    for no, group in _mapping_pairs(raw):
+        no, group = _as_int(no), _as_int(group)
+        if no in wanted and no not in answered:
+            answered[no] = group
+
+    mapping = {}
+    invalid = []
+    used_groups = set()
+    for no in category_nos:
+        group = answered.get(no)
+        if group is None or group < -1 or group >= group_count:
+            invalid.append(no)
+        elif group >= 0:
+            if group in used_groups:
+                # 1つのグループは1つのカテゴリにのみ割り当てる
+                invalid.append(no)
+            else:
+                used_groups.add(group)
+                mapping[no] = group
+    return mapping, invalid
+
+
+def collect_confidences(raw, mapping: Dict[int, int], category_nos: Sequence[int],
+                        confidences: Dict[int, float]):
+    """
+    有効な回答（mapping の割り当てと、マッチなし -1 の回答）の確信度を confidences に入れる
+    確信度が無い・読めない場合は 0
+    """
+    wanted = set(category_nos)
+    for item in raw if isinstance(raw, list) else []:
+        if not isinstance(item, dict):
+            continue
+        no, group = _as_int(item.get('No')), _as_int(item.get('Group'))
+        if no not in wanted or no in confidences:
+            continue
+        if mapping.get(no, -1) != group:
+            continue
+        try:
+            value = float(item.get('Confidence'))
+        except (TypeError, ValueError):
+            value = 0.0
+        confidences[no] = min(1.0, max(0.0, value))
+
+
+# ============================================================================
+# Requests
+# ============================================================================
+def request_mapping(model, prompt: str, category_nos: Sequence[int], group_count: int,
+                    on_response=None, confidences: Optional[Dict[int, float]] = None) -> Dict[int, int]:
+    """
+    構造化JSONでマッチングを依頼し、検証する
+    不正なキーがあれば、そのキーだけを1回だけ聞き直す
+
+    Args:
+        on_response: 応答ごとに呼ばれるコールバック（トークン数のログ等）
+        confidences: 指定した場合は確信度付きで依頼し、有効な回答の {No: 確信度} を入れる
+    """
+    config = json_config(MAPPING_SCHEMA if confidences is None else MAPPING_CONFIDENCE_SCHEMA)
+    response = model.generate_content(prompt, generation_config=config)
+    if on_response:
+        on_response(response)
+    logger.info(f"AI応答: {response.text.strip()}")
+
+    try:
+        raw = parse_json_lenient(response.text)
+    except ValueError as e:
+        logger.warning(f"{e}")
+        raw = []
+    mapping, invalid = validate_mapping(raw, category_nos, group_count)
+    if confidences is not None:
+        collect_confidences(raw, mapping, [no for no in category_nos if no not in invalid], confidences)
+
+    if not invalid:
+        return mapping
+
+    logger.warning(f"不正・欠落したキーを再質問します: {invalid}")
+    taken = sorted(set(mapping.values()))
+    reask = f"""{prompt}
+
+## 再質問
+前回の回答のうち、次のカテゴリNoの値が欠落しているか不正でした: {invalid}
+これらのNoについてのみ回答してください。
+使用できるグループインデックスは 0〜{group_count - 1}、マッチなしは -1 です。
+既に他のカテゴリに割り当て済みのグループ {taken} は使わないでください。
+"""
+    try:
+        response = model.generate_content(reask, generation_config=config)
+        if on_response:
+            on_response(response)
+        raw = parse_json_lenient(response.text)
+    except Exception as e:
+        logger.warning(f"再質問に失敗しました: {e}")
+        return mapping
+
+    # 再質問の回答は、既存の割り当てと重複しないものだけを採用
+    fixed, still_invalid = validate_mapping(raw, invalid, group_count)
+    used = set(mapping.values())
+    for no, group in list(fixed.items()):
+        if group not in used:
+            mapping[no] = group
+            used.add(group)
+        else:
+            del fixed[no]
+            still_invalid.append(no)
+    if confidences is not None:
+        collect_confidences(raw, fixed, [no for no in invalid if no not in still_invalid], confidences)
+    if still_invalid:
+        logger.warning(f"再質問後も不正なキー（マッチなし扱い）: {still_invalid}")
+    return mapping
+
+
+def validate_categories(raw) -> Tuple[List[Category], int]:
+    """カテゴリ一覧を検証。(有効なカテゴリ, 不正な要素数) を返す"""
+    categories = []
+    seen = set()
+    invalid = 0
+    for item in raw if isinstance(raw, list) else []:
+        no = _as_int(item.get('No')) if isinstance(item, dict) else None
+        name = item.get('Category', item.get('MainCategory')) if isinstance(item, dict) else None
+        if no is None or not isinstance(name, str) or not name.strip():
+            invalid += 1
+            continue
+        if no in seen:
+            continue
+        seen.add(no)
+        sub_items = [s for s in item.get('SubItems') or [] if isinstance(s, str) and s.strip()]
+        categories.append(Category(no, name.strip(), sub_items))
+    categories.sort(key=lambda x: x.no)
+    return categories, invalid
+
+
+def request_categories(model, prompt_parts: list) -> List[Category]:
+    """
+    構造化JSONでカテゴリ一覧の抽出を依頼し、検証する
+    読めない／不正な要素がある場合は1回だけ聞き直す
+    """
+    config = json_config(CATEGORY_SCHEMA)
+    response = model.generate_content(prompt_parts, generation_config=config)
+    try:
+        categories, invalid = validate_categories(parse_json_lenient(response.text))
+    except ValueError as e:
+        logger.warning(f"{e}")
+        categories, invalid = [], 1
+
+    if not invalid and categories:
+        return categories
+
+    logger.warning(f"カテゴリ一覧が不完全なため再質問します（不正 {invalid} 件）")
+    reask = ("前回の回答に不正な要素がありました。"
+             "No（整数）と Category（文字列）を必ず含めて、全カテゴリを回答し直してください。")
+    try:
+        response = model.generate_content(list(prompt_parts) + [reask], generation_config=config)
+        retried, _ = validate_categories(parse_json_lenient(response.text))
+    except Exception as e:
+        logger.warning(f"再質問に失敗しました: {e}")
+        return categories
+
+    # 再質問で得られたNoで補完（既存の有効な要素を優先）
+    known = {c.no for c in categories}
+    categories.extend(c for c in retried if c.no not in known)
+    categories.sort(key=lambda x: x.no)
+    return categories
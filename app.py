@@ -11,16 +11,39 @@ Features:
 """
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import tempfile
+import shutil
 import os
-import io
-import re
-import json
+import time
+import uuid
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pdfplumber
-from pptx import Presentation
-import google.generativeai as genai
+
+from criteria_parser import parse_category_tables, parse_category_rows, merge_categories
+from template_digest import load_template_digest, template_digest_key
+from slide_grouping import GROUPING_TITLE, GROUPING_STRUCTURE, group_slides, offset_groups
+from prompt_builder import DEFAULT_TOKEN_BUDGET, build_matching_lists, log_usage
+from ai_json import request_categories, request_mapping
+from toc_layout import count_toc_pages, populate_toc
+from xml_patch import TextPatches
+from slide_order import UNMATCHED_KEEP, UNMATCHED_DROP, UNMATCHED_HIDE, reorder_slides
+from split_output import write_split_zip
+from thumbnails import is_thumbnail_available, submit_thumbnails
+from template_warmup import start_warmup, take_presentation, warm_groups
+from slide_index import KIND_GROUP, KIND_NOTES, KIND_TABLE, keyword_candidates, load_slide_index
+from upload_files import (MAX_CRITERIA_MB, MAX_TEMPLATE_MB, SpooledUpload, UploadTooLarge,
+                          OutputLease, check_upload_size, copy_output_file, new_output_path,
+                          prune_outputs, remove_file)
+from ocr_extract import is_ocr_available, ocr_extract_tables
+from model_backend import create_model, upload_file
+from match_cascade import (LOCAL_MATCHER, DEFAULT_CONFIDENCE_THRESHOLD, cascade_matching,
+                           cascade_models_from_env, confidence_threshold_from_env, uses_cascade)
+from single_flight import SingleFlight, flight_key
+from request_scheduler import PRIORITY_EXTRACT, RequestScheduler, ScheduledModel
 
 # ============================================================================
 # Page Config
@@ -62,11 +85,31 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# マッチングプロンプトのトークン予算（推定値）
+MATCHING_TOKEN_BUDGET = DEFAULT_TOKEN_BUDGET
+
+# 未使用スライドの扱い（表示名 -> モード）
+UNMATCHED_OPTIONS = {
+    "末尾に残す": UNMATCHED_KEEP,
+    "削除する（ファイルを軽量化）": UNMATCHED_DROP,
+    "非表示にしてまとめる": UNMATCHED_HIDE,
+}
+
+# スライドのグループ化方法（表示名 -> 戦略）
+GROUPING_OPTIONS = {
+    "レイアウト・セクションも考慮": GROUPING_STRUCTURE,
+    "タイトルのみ（従来）": GROUPING_TITLE,
+}
+
+# プレビューでサムネイルの描画完了を待つ最大秒数と、1グループに表示する枚数
+THUMB_WAIT_SECONDS = 120
+THUMBS_PER_GROUP = 3
+
 # ============================================================================
 # Gemini API Setup
 # ============================================================================
-def setup_gemini():
-    """Gemini APIを初期化"""
+def setup_gemini(model_name=None):
+    """Gemini APIを初期化（model_name 省略時は MODEL_NAME / gemini-2.5-flash）"""
     api_key = None
     
     # Streamlit Secretsから取得
@@ -75,12 +118,30 @@ def setup_gemini():
     else:
         api_key = os.getenv("GOOGLE_API_KEY")
     
-    if not api_key:
-        st.error("⚠️ GOOGLE_API_KEY が設定されていません")
+    try:
+        return create_model(api_key=api_key, model_name=model_name)
+    except ValueError as e:
+        st.error(f"⚠️ {e}")
         st.stop()
-    
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel("models/gemini-2.5-flash")
+
+
+@st.cache_resource
+def get_scheduler() -> RequestScheduler:
+    """全セッションで共有するAIリクエストのスケジューラ（GEMINI_RPM / GEMINI_TPM で上限を設定）"""
+    return RequestScheduler.from_env()
+
+
+@st.cache_resource
+def get_single_flight() -> SingleFlight:
+    """全セッションで共有する、実行中の同一処理のまとめ役"""
+    return SingleFlight()
+
+
+def session_id() -> str:
+    """このブラウザセッションの識別子（スケジューラの公平キューイング用）"""
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
+    return st.session_state["session_id"]
 
 # ============================================================================
 # File Type Detection
@@ -98,265 +159,144 @@ def detect_file_type(filename: str) -> str:
 # ============================================================================
 # Category Extraction Functions
 # ============================================================================
-def extract_categories_from_pdf(file_bytes) -> list:
+def extract_categories_from_pdf(upload) -> list:
     """
     PDFから大項目・小項目を含む階層構造でカテゴリを抽出
+    テキストレイヤーの無いスキャンPDFはローカルOCRで抽出
     """
-    categories = []
-    current_category = None
+    page_tables = []
+    has_text_layer = False
     
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+    with pdfplumber.open(upload.source()) as pdf:
         for page in pdf.pages:
-            tables = page.extract_tables()
-            for table in tables:
-                if not table or len(table) < 2:
-                    continue
-                for row in table:
-                    if not row or len(row) < 2:
-                        continue
-                    col0 = str(row[0]).strip() if row[0] else ""
-                    col1 = str(row[1]).strip() if row[1] else ""
-                    
-                    # 大項目の検出
-                    if col0 and re.match(r'^\d+', col0):
-                        no_match = re.match(r'^(\d+)', col0)
-                        if no_match and col1:
-                            # 前のカテゴリを保存
-                            if current_category:
-                                categories.append(current_category)
-                            
-                            no = int(no_match.group(1))
-                            main_category = col1.split('\n')[0].strip()
-                            current_category = {
-                                'No': no,
-                                'MainCategory': main_category,
-                                'SubItems': []
-                            }
-                    
-                    # 小項目の検出
-                    if len(row) >= 4 and current_category:
-                        col2 = str(row[2]).strip() if row[2] else ""
-                        col3 = str(row[3]).strip() if row[3] else ""
-                        if col2 and re.match(r'^\d+$', col2) and col3:
-                            sub_item = col3.split('\n')[0].strip()[:100]
-                            if sub_item and sub_item not in current_category['SubItems']:
-                                current_category['SubItems'].append(sub_item)
-            
-            # ページ終了時にカテゴリを保存
-            if current_category and current_category not in categories:
-                categories.append(current_category)
-                current_category = None
-    
-    # 重複を除去してソート
-    seen_nos = set()
-    unique_categories = []
-    for cat in categories:
-        if cat['No'] not in seen_nos:
-            seen_nos.add(cat['No'])
-            unique_categories.append(cat)
+            has_text_layer = has_text_layer or bool(page.chars)
+            page_tables.append(page.extract_tables())
     
-    unique_categories.sort(key=lambda x: x['No'])
-    return unique_categories
+    categories = parse_category_tables(page_tables)
+    if not categories and not has_text_layer:
+        return extract_categories_with_ocr(upload.read_bytes(), 'pdf')
+    return categories
 
 
-def extract_categories_from_excel(file_bytes) -> list:
+def extract_categories_with_ocr(file_bytes, file_type: str) -> list:
+    """ローカルOCR（Tesseract）でスキャンPDF／画像からカテゴリを抽出"""
+    if not is_ocr_available():
+        return []
+    return parse_category_tables(ocr_extract_tables(file_bytes, file_type))
+
+
+def extract_categories_from_excel(upload) -> list:
     """Excelからカテゴリを抽出"""
     import openpyxl
-    categories = []
     
-    wb = openpyxl.load_workbook(io.BytesIO(file_bytes))
+    wb = openpyxl.load_workbook(upload.source())
     ws = wb.active
-    
-    for row in ws.iter_rows(values_only=True):
-        if not row or len(row) < 2:
-            continue
-        col0 = str(row[0]).strip() if row[0] else ""
-        col1 = str(row[1]).strip() if row[1] else ""
-        
-        if col0 and re.match(r'^\d+', col0):
-            no_match = re.match(r'^(\d+)', col0)
-            if no_match and col1:
-                no = int(no_match.group(1))
-                if not any(c['No'] == no for c in categories):
-                    categories.append({'No': no, 'Category': col1.split('\n')[0].strip()})
-    
-    categories.sort(key=lambda x: x['No'])
-    return categories
+    return parse_category_rows(ws.iter_rows(values_only=True))
 
 
-def extract_categories_with_ai(model, file_bytes, file_type: str) -> list:
+def extract_categories_with_ai(model, upload, file_type: str) -> list:
     """AIでカテゴリを抽出（Word/画像）"""
     
     if file_type == 'image':
-        # 一時ファイルに保存してアップロード
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp:
-            tmp.write(file_bytes)
-            tmp_path = tmp.name
-        uploaded_file = genai.upload_file(tmp_path)
+        if upload.on_disk:
+            uploaded_file = upload_file(model, upload.path)
+        else:
+            # 一時ディレクトリに保存してアップロード（書き込みの失敗時も含め、必ず削除）
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                tmp_path = os.path.join(tmp_dir, f"criteria{Path(upload.name).suffix or '.png'}")
+                Path(tmp_path).write_bytes(upload.read_bytes())
+                uploaded_file = upload_file(model, tmp_path)
         prompt_parts = [uploaded_file]
-        os.unlink(tmp_path)
     else:
         # Wordはテキスト抽出
         try:
             import docx
-            doc = docx.Document(io.BytesIO(file_bytes))
+            doc = docx.Document(upload.source())
             text = "\n".join([para.text for para in doc.paragraphs])
         except:
-            text = file_bytes.decode('utf-8', errors='ignore')
+            text = upload.read_bytes().decode('utf-8', errors='ignore')
         prompt_parts = [text]
     
     prompt = """以下のファイルから審査基準のカテゴリ一覧を抽出してください。
 
-出力形式（JSON）:
-```json
+出力形式（JSON配列）:
 [
-  {"No": 1, "Category": "カテゴリ名"},
-  {"No": 2, "Category": "カテゴリ名"}
+  {"No": 1, "Category": "カテゴリ名", "SubItems": ["小項目", ...]},
+  {"No": 2, "Category": "カテゴリ名", "SubItems": []}
 ]
-```
 
-番号順に並べてください。必ずJSON形式のみを出力してください。
+番号順に並べてください。小項目が無い場合は SubItems を空配列にしてください。
 """
     
-    response = model.generate_content([prompt] + prompt_parts)
-    response_text = response.text.strip()
-    
-    if "```json" in response_text:
-        response_text = response_text.split("```json")[1].split("```")[0].strip()
-    elif "```" in response_text:
-        response_text = response_text.split("```")[1].split("```")[0].strip()
-    
-    categories = json.loads(response_text)
-    categories.sort(key=lambda x: x['No'])
-    return categories
+    return request_categories(model, [prompt] + prompt_parts)
 
 
-def extract_categories(model, file_bytes, filename: str) -> list:
-    """ファイル形式に応じてカテゴリを抽出"""
-    file_type = detect_file_type(filename)
+def extract_categories(model, upload) -> list:
+    """ファイル形式に応じてカテゴリを抽出（upload: SpooledUpload）"""
+    file_type = detect_file_type(upload.name)
     
     if file_type == 'pdf':
-        return extract_categories_from_pdf(file_bytes)
+        return extract_categories_from_pdf(upload)
     elif file_type == 'excel':
-        return extract_categories_from_excel(file_bytes)
+        return extract_categories_from_excel(upload)
+    elif file_type == 'image' and is_ocr_available():
+        # オフラインOCRを優先し、抽出できなければAIにフォールバック
+        categories = extract_categories_with_ocr(upload.read_bytes(), 'image')
+        return categories or extract_categories_with_ai(model, upload, 'image')
     elif file_type in ('word', 'image'):
-        return extract_categories_with_ai(model, file_bytes, file_type)
+        return extract_categories_with_ai(model, upload, file_type)
     else:
-        return extract_categories_with_ai(model, file_bytes, 'word')
+        return extract_categories_with_ai(model, upload, 'word')
+
+
+def extract_categories_from_files(model, files, progress_callback=None) -> list:
+    """
+    複数の審査基準ファイルから並列にカテゴリを抽出し、No と名称で統合する
+    files: [SpooledUpload, ...]（先のファイルを優先）
+    progress_callback: progress_callback(完了数, 総数) をファイルごとに呼ぶ
+    """
+    if len(files) == 1:
+        categories = extract_categories(model, files[0])
+        if progress_callback:
+            progress_callback(1, 1)
+        return categories
+    
+    # ワーカーからも順番待ち（ScheduledModel の on_wait）を表示できるよう、このセッションのコンテキストを引き継ぐ
+    ctx = get_script_run_ctx()
+    
+    def extract_in_thread(upload):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return extract_categories(model, upload)
+    
+    with ThreadPoolExecutor(max_workers=min(4, len(files))) as pool:
+        futures = [pool.submit(extract_in_thread, f) for f in files]
+        for done, _ in enumerate(as_completed(futures), 1):
+            if progress_callback:
+                progress_callback(done, len(files))
+        results = [future.result() for future in futures]
+    return merge_categories(results)
 
 # ============================================================================
 # PPTX Processing Functions
 # ============================================================================
-def get_slide_title(slide) -> str:
-    if slide.shapes.title:
-        return slide.shapes.title.text.strip()
-    return ""
-
-
-def get_slide_first_text(slide) -> str:
-    for shape in slide.shapes:
-        if shape.has_text_frame:
-            text = shape.text_frame.text.strip()
-            if text:
-                return text
-    return ""
-
-
-def get_slide_full_content(slide) -> str:
-    """スライドの全テキスト内容を取得"""
-    texts = []
-    for shape in slide.shapes:
-        if shape.has_text_frame:
-            text = shape.text_frame.text.strip()
-            if text and len(text) > 2:
-                texts.append(text)
-    return "\n".join(texts)[:500]
-
-
-def populate_toc(prs, categories, toc_slide_index=1):
-    """目次スライドにカテゴリを階層構造で入力"""
-    from pptx.util import Pt
+def create_matching_with_ai(model, categories, groups, confidences=None, candidates=None) -> dict:
+    """
+    AIでマッチング（階層構造・コンテンツ考慮）
+    confidences を渡すと確信度付きで依頼し、{No: 確信度} を入れる（カスケード用）
+    candidates（{No: [グループ番号, ...]}）はテキスト索引のキーワード候補としてプロンプトに添える
+    """
+    confidence_rule = (
+        '\n各要素には判断の確信度（0〜1）を "Confidence" として付ける。' if confidences is not None else ''
+    )
+    hint_rule = (
+        '\n「キーワード候補」はカテゴリの語がスライドに含まれるグループです（参考。内容で判断してください）。'
+        if candidates else ''
+    )
     
-    try:
-        toc_slide = prs.slides[toc_slide_index]
-        
-        # 最も大きいテキストフレームを探す
-        target_shape = None
-        max_area = 0
-        
-        for shape in toc_slide.shapes:
-            if shape.has_text_frame:
-                area = shape.width * shape.height
-                existing_text = shape.text_frame.text.strip()
-                if len(existing_text) > 10 and area > max_area:
-                    max_area = area
-                    target_shape = shape
-        
-        if not target_shape:
-            return False
-        
-        tf = target_shape.text_frame
-        tf.clear()
-        
-        for idx, cat in enumerate(categories):
-            if idx == 0:
-                p = tf.paragraphs[0]
-            else:
-                p = tf.add_paragraph()
-            
-            main_text = cat.get('MainCategory', cat.get('Category', ''))
-            p.text = f"{cat['No']}. {main_text}"
-            p.font.bold = True
-            p.font.size = Pt(11)
-            
-            # 小項目を追加
-            for sub_item in cat.get('SubItems', [])[:3]:
-                sub_p = tf.add_paragraph()
-                sub_p.text = f"  ・ {sub_item[:40]}"
-                sub_p.level = 1
-                sub_p.font.bold = False
-                sub_p.font.size = Pt(9)
-        
-        return True
-    except:
-        return False
-
-
-def update_slide_title(slide, new_title: str):
-    try:
-        if slide.shapes.title:
-            slide.shapes.title.text = new_title
-            return True
-    except:
-        pass
-    return False
-
-
-def create_matching_with_ai(model, categories, groups) -> dict:
-    """AIでマッチング（階層構造・コンテンツ考慮）"""
-    # 階層構造を含むカテゴリリスト
-    cat_entries = []
-    for cat in categories:
-        main_cat = cat.get('MainCategory', cat.get('Category', ''))
-        entry = f"CAT{cat['No']}: 【大項目】 {main_cat}"
-        sub_items = cat.get('SubItems', [])
-        if sub_items:
-            entry += f"\n  小項目: {', '.join(sub_items[:3])}"
-        cat_entries.append(entry)
-    cat_list = "\n".join(cat_entries)
-    
-    # グループ情報（タイトル + 内容）
-    grp_entries = []
-    for i, g in enumerate(groups):
-        entry = f"GRP{i}: {g['title']}"
-        content = g.get('content', '')[:200]
-        if content:
-            entry += f"\n  内容: {content}..."
-        grp_entries.append(entry)
-    grp_list = "\n".join(grp_entries)
-    
-    prompt = f"""審査基準カテゴリとPPTXスライドグループをマッチングしてください。
-大項目と小項目の両方を考慮してください。
+    # 定型文を除き、トークン予算内で小項目・内容を詰める
+    def render(cat_list: str, grp_list: str) -> str:
+        return f"""審査基準カテゴリとPPTXスライドグループをマッチングしてください。
+大項目と小項目の両方を考慮してください。{hint_rule}
 
 ## カテゴリ一覧
 {cat_list}
@@ -365,143 +305,452 @@ def create_matching_with_ai(model, categories, groups) -> dict:
 {grp_list}
 
 ## 出力形式
-JSON形式で。カテゴリNoをキー、グループインデックスを値。マッチなしは-1。
-例: {{"1": 3, "2": 5, "3": -1}}
-
-必ずJSON形式のみを出力してください。
+JSON配列で。各要素はカテゴリNoを "No"、グループインデックスを "Group" とする。
+全カテゴリを1件ずつ出力し、マッチなしは-1。{confidence_rule}
+例: [{{"No": 1, "Group": 3}}, {{"No": 2, "Group": 5}}, {{"No": 3, "Group": -1}}]
 """
     
-    response = model.generate_content(prompt)
-    response_text = response.text.strip()
-    
-    if "```json" in response_text:
-        response_text = response_text.split("```json")[1].split("```")[0].strip()
-    elif "```" in response_text:
-        response_text = response_text.split("```")[1].split("```")[0].strip()
+    prompt, prompt_stats = build_matching_lists(
+        categories, groups, render, token_budget=MATCHING_TOKEN_BUDGET,
+        cat_label='CAT', grp_label='GRP', hints=candidates
+    )
     
-    mapping_raw = json.loads(response_text)
-    mapping = {}
-    for k, v in mapping_raw.items():
-        if int(v) >= 0:
-            mapping[int(k)] = int(v)
-    return mapping
+    return request_mapping(
+        model, prompt, [cat.no for cat in categories], len(groups),
+        on_response=lambda response: log_usage(response, prompt_stats),
+        confidences=confidences
+    )
 
 
-def process_pptx(model, categories, pptx_bytes, progress_callback=None) -> bytes:
-    """PPTXを処理して並べ替え"""
-    prs = Presentation(io.BytesIO(pptx_bytes))
-    total_slides = len(prs.slides)
-    
-    FIXED_SLIDES = 2  # 表紙と目次
+# 表紙と目次
+FIXED_SLIDES = 2
+
+
+def load_template(pptx_bytes, grouping=GROUPING_STRUCTURE, progress_callback=None, template_key=None):
+    """
+    テンプレート段階: 読み込み・スライド要約・グループ化（審査基準に依存しない）
+    目次を入れる前の状態で、目次の次のスライドからグループ化する
+    template_key は計算済みの template_digest_key（省略時はここで計算）
     
-    if total_slides <= FIXED_SLIDES:
+    Returns:
+        (prs, groups)
+    """
+    if progress_callback:
+        progress_callback(0.1, "テンプレートを読み込み中...")
+    # 保存時に準備済み（template_warmup）であれば、読み込み・グループ化をやり直さない
+    template_key = template_key or template_digest_key(pptx_bytes)
+    prs = take_presentation(pptx_bytes, template_key)
+    if len(prs.slides) <= FIXED_SLIDES:
         raise ValueError("スライドが少なすぎます")
     
-    # 目次更新
+    groups = warm_groups(template_key, grouping)
+    if groups is None:
+        # 定型文を除いたスライド要約とグループ化の結果は、テンプレートごとにキャッシュ
+        if progress_callback:
+            progress_callback(0.4, "スライドを分析中...")
+        digests = load_template_digest(pptx_bytes, prs, key=template_key)
+        
+        if progress_callback:
+            progress_callback(0.7, "スライドをグループ化中...")
+        groups = group_slides(prs, start=FIXED_SLIDES, strategy=grouping,
+                              digests=digests, cache_key=template_key)
     if progress_callback:
-        progress_callback(0.1, "目次を更新中...")
-    populate_toc(prs, categories, toc_slide_index=1)
+        progress_callback(1.0, f"{len(groups)} グループ")
+    return prs, groups
+
+
+def match_template(model, categories, template, progress_callback=None,
+                   cascade=None, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD, cascade_stats=None,
+                   candidates=None):
+    """
+    マッチング段階: 目次の枚数の分だけグループをずらし、AIでマッチング
     
-    # スライド2以降をグループ化
-    if progress_callback:
-        progress_callback(0.2, "スライドをグループ化中...")
+    Args:
+        template: load_template() の (prs, groups)。prs は変更しない（目次の枚数を見積もるだけ）
+        cascade: [(モデル名, モデル), ...]。2段階以上の場合、確信度の低いカテゴリだけを次のモデルへ
+                 （1段階の場合はそのモデルだけで。"local" だけの場合はAIを使わない）
+        cascade_stats: 指定した場合はカスケードの段階ごとの件数・エスカレーション件数を入れる
+        candidates: テキスト索引のキーワード候補 {No: [グループ番号, ...]}（マッチングの手がかり）
     
-    groups = []
-    current_group = None
+    Returns:
+        (groups, mapping, fixed_slides):
+            mapping: {pdf_no: group_index}
+            fixed_slides: 表紙・目次の枚数（目次の分割でテンプレートより増えた分を含む）
+    """
+    prs, groups = template
     
-    for idx in range(FIXED_SLIDES, total_slides):
-        slide = prs.slides[idx]
-        title = get_slide_title(slide)
-        content = get_slide_full_content(slide)  # スライドの全内容を取得
-        
-        if title:
-            if current_group:
-                groups.append(current_group)
-            current_group = {
-                'title': title, 
-                'slides': [idx], 
-                'first_index': idx,
-                'content': content
-            }
-        else:
-            if current_group:
-                current_group['slides'].append(idx)
-                current_group['content'] = (current_group.get('content', '') + '\n' + content)[:500]
-            else:
-                first_text = get_slide_first_text(slide)
-                current_group = {
-                    'title': first_text[:50] if first_text else f"[Untitled {idx}]",
-                    'slides': [idx], 
-                    'first_index': idx,
-                    'content': content
-                }
-    
-    if current_group:
-        groups.append(current_group)
+    # 目次更新（目次が複数枚に分かれた分だけ、グループのスライド番号をずらす）
+    if progress_callback:
+        progress_callback(0.1, "目次を更新中...")
+    # 目次の書き込みは出力段階で1回だけ行う（ここでは枚数だけを見積もり、prs は出力に使い回す）
+    toc_pages = count_toc_pages(prs, categories, toc_slide_index=1)
+    fixed_slides = 1 + max(toc_pages, 1)
+    groups = offset_groups(groups, fixed_slides - FIXED_SLIDES)
     
     # AIマッチング
     if progress_callback:
         progress_callback(0.4, "AIでマッチング中...")
     
-    mapping = create_matching_with_ai(model, categories, groups)
-    
-    # マッチング結果を整理
-    if progress_callback:
-        progress_callback(0.6, "スライドを並べ替え中...")
+    if cascade and uses_cascade(cascade):
+        def on_stage(text):
+            if progress_callback:
+                progress_callback(0.4, text)
+        
+        mapping, stats = cascade_matching(cascade, categories, groups, create_matching_with_ai,
+                                          threshold=confidence_threshold, progress_callback=on_stage,
+                                          candidates=candidates)
+        if cascade_stats is not None:
+            cascade_stats.update(stats)
+    else:
+        mapping = create_matching_with_ai(model, categories, groups, candidates=candidates)
+    return groups, mapping, fixed_slides
+
+
+def resolve_matches(categories, groups, mapping):
+    """
+    マッピングから (マッチしたカテゴリ, 未使用グループ) を作る
     
+    Returns:
+        (matched_list, unused_groups): matched_list は [(pdf_no, category_name, SlideGroup), ...]（No順）
+    """
     used_groups = set()
     matched_list = []
     
     for cat in categories:
-        pdf_no = cat['No']
-        main_cat = cat.get('MainCategory', cat.get('Category', ''))
+        pdf_no = cat.no
+        main_cat = cat.main_category
         if pdf_no in mapping:
             pptx_idx = mapping[pdf_no]
-            if pptx_idx < len(groups):
+            if 0 <= pptx_idx < len(groups) and pptx_idx not in used_groups:
                 matched_list.append((pdf_no, main_cat, groups[pptx_idx]))
                 used_groups.add(pptx_idx)
     
+    matched_list.sort(key=lambda x: x[0])
     unused_groups = [g for i, g in enumerate(groups) if i not in used_groups]
+    return matched_list, unused_groups
+
+
+def render_output(categories, pptx_bytes, groups, mapping, progress_callback=None,
+                  unmatched=UNMATCHED_KEEP, split=False, template_key=None, prs=None):
+    """
+    出力段階: 目次・タイトル更新、並べ替え、保存（AIは呼ばない）
+    出力はメモリに置かず、一時ファイル（OUTPUT_DIR）に書く
+    template_key は計算済みの template_digest_key（省略時は take_presentation で計算）
+    prs は変更していないテンプレート（load_template() の結果）。省略時は take_presentation で取り出す
+    
+    Returns:
+        出力PPTXの一時ファイルのパス（split=True の場合はカテゴリごとのPPTXをまとめたZIP）
+    """
+    if prs is None:
+        prs = take_presentation(pptx_bytes, template_key)
+    # 目次とタイトルの書き換えは書式を保ったXMLパッチとして集め、並べ替えの前に1回で適用する
+    patches = TextPatches()
+    toc_pages = populate_toc(prs, categories, toc_slide_index=1, patches=patches)
+    fixed_slides = 1 + max(toc_pages, 1)
+    
+    if progress_callback:
+        progress_callback(0.6, "スライドを並べ替え中...")
+    
+    matched_list, unused_groups = resolve_matches(categories, groups, mapping)
     
     # 新しい順序を構築
-    new_order = list(range(FIXED_SLIDES))
+    new_order = list(range(fixed_slides))
     
-    matched_list.sort(key=lambda x: x[0])
     for pdf_no, category_name, group in matched_list:
         # タイトル更新（大項目名を使用）
-        first_slide_idx = group['slides'][0]
+        first_slide_idx = group.first_index
         new_title = f"{pdf_no}. {category_name}"
-        update_slide_title(prs.slides[first_slide_idx], new_title)
+        patches.retitle(prs.slides[first_slide_idx], new_title)
         
-        for slide_idx in group['slides']:
-            new_order.append(slide_idx)
+        new_order.extend(group.slides)
+    
+    patches.apply()
     
+    if split:
+        return write_split_result(prs, fixed_slides, matched_list, progress_callback)
+    
+    unmatched_start = len(new_order)
     for g in unused_groups:
-        for slide_idx in g['slides']:
-            new_order.append(slide_idx)
+        new_order.extend(g.slides)
     
-    # XMLレベルで並べ替え
+    # XMLレベルで並べ替え（sldIdLst を1回で置換）
     if progress_callback:
         progress_callback(0.8, "ファイルを生成中...")
     
-    xml_slides = prs.slides._sldIdLst
-    original_slides = list(xml_slides)
-    
-    while len(xml_slides) > 0:
-        xml_slides.remove(xml_slides[0])
+    reorder_slides(prs, new_order, unmatched_start, unmatched=unmatched)
     
-    for idx in new_order:
-        xml_slides.append(original_slides[idx])
-    
-    # バイトに変換
-    output = io.BytesIO()
-    prs.save(output)
-    output.seek(0)
+    # 一時ファイルに保存
+    output_path = new_output_path('.pptx')
+    try:
+        prs.save(output_path)
+    except BaseException:
+        remove_file(output_path)
+        raise
     
     if progress_callback:
         progress_callback(1.0, "完了！")
     
-    return output.read(), len(matched_list), len(unused_groups)
+    return output_path
+
+
+def organize(model, files, pptx_bytes, grouping, unmatched, split, progress_callback=None,
+             cascade=None, extract_progress=None, template_progress=None, template_key=None):
+    """
+    カテゴリ抽出・マッチング・初回の出力生成をまとめて行う（同じ要求はこの単位で共有する）
+    カテゴリ抽出とテンプレートの読み込み・グループ化は審査基準に依存しないため並行して行い、
+    マッチングの前で合流する
+    
+    Args:
+        extract_progress / template_progress: 並行する2つの段階の進捗 (値, 説明)
+        template_key: 計算済みの template_digest_key（省略時はここで1回だけ計算）
+    
+    Returns:
+        (categories, groups, mapping, fixed_slides, result, cascade_stats, candidates)。
+        candidates はテキスト索引によるカテゴリごとのキーワード候補 {No: [グループ番号, ...]}。
+        カテゴリを抽出できなければ None
+    """
+    def on_file(done, total):
+        if extract_progress:
+            extract_progress(done / total, f"{done}/{total} ファイル")
+    
+    # テンプレート側は別スレッドで進める（進捗表示のため、このセッションのコンテキストを引き継ぐ）
+    ctx = get_script_run_ctx()
+    template_key = template_key or template_digest_key(pptx_bytes)
+    
+    def load_in_thread():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        template = load_template(pptx_bytes, grouping, template_progress, template_key)
+        # テキスト索引（保存時に作成済みならキャッシュから。目次を入れる前の prs で作る）
+        return template, load_slide_index(pptx_bytes, template[0], key=template_key)
+    
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="template") as pool:
+        template_future = pool.submit(load_in_thread)
+        if extract_progress:
+            extract_progress(0.05, "審査基準を分析中...")
+        # 複数ファイルは並列に抽出し、1つのカテゴリ一覧に統合してから1回でマッチング
+        categories = extract_categories_from_files(model.with_priority(PRIORITY_EXTRACT), files, on_file)
+        if not categories:
+            return None
+        if extract_progress:
+            extract_progress(1.0, f"{len(categories)} カテゴリ")
+        template, index = template_future.result()
+    
+    # キーワード候補はマッチングの手がかりにする（目次を入れる前のグループで作るため位置のずれは無い）
+    candidates = keyword_candidates(index, categories, template[1])
+    cascade_stats = {}
+    groups, mapping, fixed_slides = match_template(model, categories, template, progress_callback,
+                                                   cascade=cascade,
+                                                   confidence_threshold=confidence_threshold_from_env(),
+                                                   cascade_stats=cascade_stats, candidates=candidates)
+    # 初回の出力は、マッチングで変更していないテンプレートの prs をそのまま使う
+    result = render_output(categories, pptx_bytes, groups, mapping, progress_callback,
+                           unmatched=unmatched, split=split, template_key=template_key, prs=template[0])
+    return categories, groups, mapping, fixed_slides, result, cascade_stats, candidates
+
+
+def write_split_result(prs, fixed_slides, matched_list, progress_callback=None) -> str:
+    """カテゴリごとのPPTXをZIP（一時ファイル）へ書き出し、そのパスを返す"""
+    def on_deck(done, total):
+        if progress_callback:
+            progress_callback(0.8 + 0.2 * done / total, f"分割ファイルを生成中... ({done}/{total})")
+    
+    zip_path = new_output_path('.zip')
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_path = os.path.join(tmp_dir, "source.pptx")
+            prs.save(source_path)
+            with open(zip_path, 'wb') as zip_file:
+                write_split_zip(source_path, fixed_slides, matched_list, zip_file,
+                                progress_callback=on_deck)
+    except BaseException:
+        remove_file(zip_path)
+        raise
+    return zip_path
+
+# ============================================================================
+# Preview
+# ============================================================================
+def show_match_preview(matched_list, fixed_slides, thumbnails_future=None):
+    """カテゴリ → スライドグループの対応を、テンプレートのサムネイル付きで表示"""
+    # グループのスライド番号は目次の分割で増えた分だけずれているため、テンプレートの番号に戻す
+    offset = fixed_slides - 2
+    thumbnails = {}
+    if thumbnails_future is not None:
+        try:
+            with st.spinner("サムネイルを描画中..."):
+                thumbnails = thumbnails_future.result(timeout=THUMB_WAIT_SECONDS)
+        except Exception as e:
+            st.caption(f"サムネイルを表示できません: {e}")
+    else:
+        st.caption("LibreOffice が無いため、サムネイルは表示されません")
+    
+    for pdf_no, category_name, group in matched_list:
+        text_col, thumb_col = st.columns([2, 3])
+        with text_col:
+            st.markdown(f"**{pdf_no}. {category_name}**")
+            st.caption(f"→ {group.title}（{len(group.slides)}枚）")
+        with thumb_col:
+            images = [thumbnails.get(idx - offset) for idx in group.slides[:THUMBS_PER_GROUP]]
+            images = [str(path) for path in images if path is not None]
+            if images:
+                st.image(images, width=160)
+
+# ============================================================================
+# Results & Mapping Override
+# ============================================================================
+NO_MATCH_LABEL = "（マッチなし）"
+
+
+def output_key(mapping, unmatched, split) -> tuple:
+    """出力の生成条件（同じなら生成済みの出力を再利用できる）"""
+    return tuple(sorted(mapping.items())), unmatched, split
+
+
+def clear_output():
+    """生成済みの出力を破棄（一時ファイルも削除）"""
+    previous = st.session_state.pop("output", None)
+    st.session_state.pop("output_key", None)
+    lease = st.session_state.pop("output_lease", None)
+    if lease is not None:
+        lease.release()
+    remove_file(previous)
+
+
+def store_output(key, result, elapsed):
+    clear_output()
+    st.session_state["output_key"] = key
+    st.session_state["output"] = result
+    st.session_state["output_elapsed"] = elapsed
+    # 他のセッションの prune_outputs で削除されないよう、使用中として登録する
+    st.session_state["output_lease"] = OutputLease(result)
+
+
+def mapping_editor(state) -> dict:
+    """マッチング結果を表で編集し、編集後のマッピングを返す"""
+    categories, groups = state["categories"], state["groups"]
+    ai_mapping = state["ai_mapping"]
+    candidates = state.get("candidates") or {}
+    labels = [f"GRP{i}: {g.title[:40]}" for i, g in enumerate(groups)]
+    label_index = {label: i for i, label in enumerate(labels)}
+    
+    rows = [
+        {
+            "No": cat.no,
+            "カテゴリ": cat.main_category,
+            "スライドグループ": labels[ai_mapping[cat.no]] if cat.no in ai_mapping else NO_MATCH_LABEL,
+            # テンプレートのテキスト索引で、カテゴリの語を多く含むグループ
+            "キーワード候補": ", ".join(f"GRP{g}" for g in candidates.get(cat.no, [])),
+        }
+        for cat in categories
+    ]
+    edited = st.data_editor(
+        rows,
+        column_config={
+            "スライドグループ": st.column_config.SelectboxColumn(
+                options=[NO_MATCH_LABEL] + labels, required=True
+            ),
+        },
+        disabled=["No", "カテゴリ", "キーワード候補"],
+        hide_index=True,
+        use_container_width=True,
+        key="mapping_editor",
+    )
+    
+    mapping = {}
+    duplicated = []
+    for row in edited:
+        group_idx = label_index.get(row["スライドグループ"])
+        if group_idx is None:
+            continue
+        if group_idx in mapping.values():
+            # 1つのグループは1つのカテゴリにのみ割り当てる（先の行を優先）
+            duplicated.append(row["No"])
+            continue
+        mapping[row["No"]] = group_idx
+    if duplicated:
+        st.warning(f"同じスライドグループが複数のカテゴリに割り当てられています（No {duplicated} はマッチなし扱い）")
+    return mapping
+
+
+def show_results(state, template_bytes, unmatched, split):
+    """結果表示: マッピングの修正表・ダウンロード・プレビュー"""
+    categories, groups = state["categories"], state["groups"]
+    
+    with st.expander("✏️ マッチングの修正", expanded=False):
+        st.caption("スライドグループを変更すると、AIを呼ばずに並べ替えだけをやり直します")
+        mapping = mapping_editor(state)
+    matched_list, unused_groups = resolve_matches(categories, groups, mapping)
+    
+    st.success(f"✅ 処理完了！ マッチ: {len(matched_list)}件 / 未使用: {len(unused_groups)}件")
+    cascade_stats = state.get("cascade_stats")
+    if cascade_stats:
+        st.caption(
+            f"マッチングのカスケード: {' → '.join(stage['model'] for stage in cascade_stats['stages'])} / "
+            f"確信度 {cascade_stats['threshold']} 未満で再判定: {cascade_stats['escalated']} 件"
+        )
+    
+    # 同じ条件の出力が生成済みならそれを使い、そうでなければダウンロード時に生成する
+    key = output_key(mapping, unmatched, split)
+    output = st.session_state.get("output") if st.session_state.get("output_key") == key else None
+    if output is not None and not os.path.exists(output):
+        # 出力ファイルが失われた場合（サーバーの一時ファイルの削除など）はダウンロード時に生成し直す
+        clear_output()
+        output = None
+    if output is not None:
+        output_size = os.path.getsize(output)
+        st.caption(
+            f"出力サイズ: {output_size / 1024 / 1024:.1f} MB "
+            f"（テンプレート {len(template_bytes) / 1024 / 1024:.1f} MB） / "
+            f"処理時間: {st.session_state['output_elapsed']:.1f} 秒"
+        )
+    else:
+        st.caption("変更内容はダウンロード時に反映されます")
+    
+    output_stem = f"organized_{state['criteria_name'].split('.')[0]}"
+    
+    def output_bytes():
+        # 出力はディスクに置いたまま、クリック時にファイルから読み出す
+        if output is not None:
+            try:
+                return Path(output).read_bytes()
+            except FileNotFoundError:
+                pass   # 表示した後に失われた場合は、ここで生成し直す
+        path = render_output(categories, template_bytes, groups, mapping, unmatched=unmatched, split=split,
+                             template_key=state["template_key"])
+        try:
+            return Path(path).read_bytes()
+        finally:
+            remove_file(path)
+    
+    if split:
+        st.download_button(
+            label="📥 分割PPTX（ZIP）をダウンロード",
+            data=output_bytes,
+            file_name=f"{output_stem}.zip",
+            mime="application/zip",
+            on_click="ignore",
+            type="primary",
+            use_container_width=True
+        )
+    else:
+        st.download_button(
+            label="📥 完成PPTXをダウンロード",
+            data=output_bytes,
+            file_name=f"{output_stem}.pptx",
+            mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+            on_click="ignore",
+            type="primary",
+            use_container_width=True
+        )
+    
+    # マッチング結果のプレビュー
+    with st.expander("🖼️ マッチング結果プレビュー", expanded=True):
+        show_match_preview(matched_list, state["fixed_slides"], state["thumbnails_future"])
+    
+    # カテゴリ一覧表示
+    with st.expander("📋 抽出されたカテゴリ一覧"):
+        for cat in categories:
+            st.write(f"{cat.no}. {cat.main_category}")
 
 # ============================================================================
 # Template Management
@@ -510,17 +759,95 @@ def process_pptx(model, categories, pptx_bytes, progress_callback=None) -> bytes
 TEMPLATE_PATH = Path(__file__).parent / "master_template.pptx"
 
 def get_saved_template() -> bytes:
-    """保存されたテンプレートを取得"""
+    """保存されたテンプレートを取得（版ごとに1回だけ読み込み、全セッションで共有）"""
+    version = template_version()
+    return read_template(version) if version else None
+
+def get_saved_template_key() -> str:
+    """保存されたテンプレートのハッシュ（template_digest_key。無ければ None）"""
+    version = template_version()
+    return read_template_key(version) if version else None
+
+@st.cache_resource(max_entries=1)
+def read_template(version) -> bytes:
+    return TEMPLATE_PATH.read_bytes()
+
+@st.cache_resource(max_entries=1)
+def read_template_key(version) -> str:
+    # テンプレート全体のハッシュは版ごとに1回だけ計算し、各段階には key として渡す
+    return template_digest_key(read_template(version))
+
+def template_version():
+    """保存されたテンプレートの版（更新日時とサイズ。無ければ None）"""
     if TEMPLATE_PATH.exists():
-        return TEMPLATE_PATH.read_bytes()
+        stat = TEMPLATE_PATH.stat()
+        return stat.st_mtime_ns, stat.st_size
     return None
 
-def save_template(file_bytes: bytes):
-    """テンプレートを永続的に保存（ファイルを上書き）"""
+@st.cache_resource
+def warm_saved_template(version):
+    """保存されたテンプレートの準備をバックグラウンドで開始（版ごと・プロセスごとに1回）"""
+    template = get_saved_template()
+    return start_warmup(template, get_saved_template_key()) if template else None
+
+def show_warmup(warmup):
+    """テンプレートの準備の進捗（実行中は1秒ごとに更新し、完了したら画面全体を更新）"""
+    running = not warmup.done
+    
+    @st.fragment(run_every=1 if running else None)
+    def status():
+        if not warmup.done:
+            st.progress(warmup.progress, text=f"準備中: {warmup.text}")
+        elif running:
+            st.rerun()
+        elif warmup.error:
+            st.caption(f"⚠️ テンプレートの準備に失敗しました（処理時に読み込みます）: {warmup.error}")
+        else:
+            st.caption(f"⚡ {warmup.text}")
+    
+    status()
+
+@st.cache_resource(max_entries=1)
+def template_index(version):
+    """保存されたテンプレートのテキスト索引（版ごとに1回だけ読み込み、全セッションで共有）"""
+    return load_slide_index(get_saved_template(), key=get_saved_template_key())
+
+# 検索結果の表示件数と、シェイプの種類の表示名
+SEARCH_LIMIT = 20
+KIND_LABELS = {KIND_TABLE: "表", KIND_GROUP: "グループ内", KIND_NOTES: "ノート"}
+
+def show_template_search(version):
+    """保存されたテンプレートの全文検索（どのスライドに書いてあるか）"""
+    query = st.text_input("🔎 テンプレート内を検索", key="template_search",
+                          placeholder="例: 実施体制 品質管理")
+    if not query.strip():
+        return
+    hits = template_index(version).search(query, limit=SEARCH_LIMIT)
+    if not hits:
+        st.caption("見つかりませんでした")
+        return
+    st.caption(f"{len(hits)} 件（スライド番号は目次を入れる前のテンプレートの番号）")
+    for hit in hits:
+        kind = KIND_LABELS.get(hit.kind)
+        shape = f"{hit.shape}（{kind}）" if kind else hit.shape
+        st.markdown(f"**スライド {hit.slide}** {hit.title[:30]}")
+        st.caption(f"{shape}: {hit.snippet}")
+
+def save_template(stream):
+    """
+    テンプレートを永続的に保存（ファイルを上書き）
+    アップロードを少しずつ一時ファイルへ書き、書き終えてから置き換える
+    """
+    tmp_path = None
     try:
-        TEMPLATE_PATH.write_bytes(file_bytes)
+        fd, tmp_path = tempfile.mkstemp(suffix='.pptx', dir=TEMPLATE_PATH.parent)
+        with os.fdopen(fd, 'wb') as tmp:
+            stream.seek(0)
+            shutil.copyfileobj(stream, tmp)
+        os.replace(tmp_path, TEMPLATE_PATH)
         return True
     except Exception as e:
+        remove_file(tmp_path)
         print(f"テンプレート保存エラー: {e}")
         return False
 
@@ -535,7 +862,7 @@ with st.sidebar:
     st.header("📋 使い方")
     st.markdown("""
     1. **審査基準ファイル**をアップロード
-       - PDF / Excel / Word / 画像
+       - PDF / Excel / Word / 画像（複数ファイル可）
     2. **処理開始**ボタンをクリック
     3. 完成したPPTXを**ダウンロード**
     """)
@@ -558,27 +885,68 @@ with st.sidebar:
             label_visibility="collapsed"
         )
         
+        template_too_large = None
         if template_upload:
+            try:
+                check_upload_size(template_upload.name, template_upload.size, MAX_TEMPLATE_MB)
+            except UploadTooLarge as e:
+                template_too_large = e
+                st.error(f"テンプレートが大きすぎます: {e}")
+        
+        if template_upload and not template_too_large:
             if st.button("💾 更新を保存", use_container_width=True):
-                template_bytes = template_upload.read()
-                if save_template(template_bytes):
+                if save_template(template_upload):
+                    # 最初の処理を待たずに、読み込み・グループ化・サムネイルを準備しておく
+                    start_warmup(get_saved_template(), get_saved_template_key())
                     st.success("✅ 更新しました！")
                     st.rerun()
                 else:
                     st.error("保存に失敗しました")
+    
+    # 保存したテンプレートの準備（折りたたみの外に表示）
+    warmup = warm_saved_template(template_version())
+    if warmup is not None:
+        show_warmup(warmup)
+        show_template_search(template_version())
 
 # メインエリア
-criteria_file = st.file_uploader(
-    "審査基準をアップロード（PDF / Excel / Word / 画像）",
+criteria_files = st.file_uploader(
+    "審査基準をアップロード（PDF / Excel / Word / 画像。複数ファイル可）",
     type=['pdf', 'xlsx', 'xls', 'docx', 'doc', 'png', 'jpg', 'jpeg'],
+    accept_multiple_files=True,
     key="criteria"
 )
-if criteria_file:
+criteria_too_large = []
+for criteria_file in criteria_files:
     file_type = detect_file_type(criteria_file.name)
+    try:
+        # 内容を読む前にサイズだけで確認
+        check_upload_size(criteria_file.name, criteria_file.size, MAX_CRITERIA_MB)
+    except UploadTooLarge as e:
+        criteria_too_large.append(criteria_file.name)
+        st.error(f"❌ 審査基準ファイルが大きすぎます: {e}")
+        continue
     st.success(f"✅ {criteria_file.name} ({file_type})")
 
+unmatched_label = st.radio(
+    "未使用スライドの扱い",
+    list(UNMATCHED_OPTIONS),
+    horizontal=True,
+    help="「削除する」は未使用スライドと、それだけが使っていたレイアウト・画像を出力から除きます"
+)
+grouping_label = st.selectbox(
+    "スライドのグループ化",
+    list(GROUPING_OPTIONS),
+    help="セクション・セクション見出しレイアウトで区切り、「（続き）」等の同じタイトルはまとめます"
+)
+split_output = st.checkbox(
+    "カテゴリごとに分割してZIPで出力",
+    help="マッチしたカテゴリごとに、表紙・目次付きのPPTXを作成します"
+)
+
 # テンプレート状態確認（表示なし）
 template_to_use = get_saved_template()
+template_key = get_saved_template_key()
 
 if not template_to_use:
     st.warning("⚠️ テンプレートがありません。サイドバーからアップロードしてください。")
@@ -586,63 +954,120 @@ if not template_to_use:
 # 処理ボタン
 st.markdown("---")
 
-if criteria_file and template_to_use:
+if criteria_files and template_to_use and criteria_too_large:
+    st.info("👆 上限を超えるファイルを外してから処理してください")
+elif criteria_files and template_to_use:
     if st.button("🚀 処理開始", type="primary", use_container_width=True):
+        uploads = []
         try:
-            model = setup_gemini()
-            
+            # 審査基準の分析とテンプレートの準備は並行して進むため、進捗を別々に表示
+            extract_column, template_column = st.columns(2)
+            extract_bar = extract_column.progress(0, text="審査基準: 待機中")
+            template_bar = template_column.progress(0, text="テンプレート: 待機中")
             progress_bar = st.progress(0)
             status_text = st.empty()
+            progress = {"text": ""}
             
             def update_progress(value, text):
+                progress["text"] = text
                 progress_bar.progress(value)
                 status_text.text(text)
             
-            # カテゴリ抽出
-            update_progress(0.05, "審査基準を分析中...")
-            criteria_bytes = criteria_file.read()
-            categories = extract_categories(model, criteria_bytes, criteria_file.name)
+            def update_extract(value, text):
+                extract_bar.progress(value, text=f"審査基準: {text}")
             
-            if not categories:
-                st.error("審査基準からカテゴリを抽出できませんでした")
-                st.stop()
+            def update_template(value, text):
+                template_bar.progress(value, text=f"テンプレート: {text}")
             
-            st.info(f"📋 {len(categories)} 件のカテゴリを抽出しました")
+            def show_queue(position, waiting):
+                # 他のセッションの処理待ち（順番 0 は送信開始のため元の表示に戻す）
+                if position:
+                    status_text.text(f"{progress['text']}（AIの順番待ち: {position} 番目 / {waiting} 件）")
+                else:
+                    status_text.text(progress["text"])
+            
+            # サムネイルはマッチングと並行してバックグラウンドで描画（キャッシュ済みなら即時）
+            thumbnails_future = submit_thumbnails(template_to_use, key=template_key) if is_thumbnail_available() else None
+            
+            # 前のセッションが残した古い一時ファイルを削除
+            prune_outputs()
+            # 大きな審査基準はディスクへ退避し、読み込み側にはパスを渡す（処理後に必ず削除）
+            uploads = [SpooledUpload(f, f.name) for f in criteria_files]
+            grouping = GROUPING_OPTIONS[grouping_label]
+            unmatched = UNMATCHED_OPTIONS[unmatched_label]
+            
+            def run_job():
+                # AIへのリクエストは全セッション共通のキューでレート制限内に送る
+                model = ScheduledModel(setup_gemini(), get_scheduler(), session_id(), on_wait=show_queue)
+                # MATCH_MODELS を設定した場合は、確信度の低いカテゴリだけを次のモデルに聞き直す
+                cascade = [
+                    (name, None if name == LOCAL_MATCHER else
+                     ScheduledModel(setup_gemini(name), get_scheduler(), session_id(), on_wait=show_queue))
+                    for name in cascade_models_from_env()
+                ]
+                return organize(model, uploads, template_to_use, grouping, unmatched, split_output,
+                                update_progress, cascade=cascade,
+                                extract_progress=update_extract, template_progress=update_template,
+                                template_key=template_key)
             
-            # PPTX処理
-            result_bytes, matched_count, unused_count = process_pptx(
-                model, categories, template_to_use, update_progress
-            )
+            def show_shared():
+                update_progress(0.05, "同じ審査基準・テンプレートの処理が実行中のため、その結果を待っています...")
             
-            # 結果表示
-            st.success(f"✅ 処理完了！ マッチ: {matched_count}件 / 未使用: {unused_count}件")
+            # 同じ審査基準・テンプレート・オプションの処理が実行中なら、その結果を共有する
+            started = time.perf_counter()
+            # 審査基準・テンプレートは内容の代わりにハッシュを渡す（同じ内容なら同じキー）
+            key = flight_key([upload.digest for upload in uploads], template_key,
+                             {"grouping": grouping, "unmatched": unmatched, "split": split_output})
+            job, shared = get_single_flight().do(key, run_job, on_wait=show_shared)
             
-            # ダウンロードボタン
-            output_filename = f"organized_{criteria_file.name.split('.')[0]}.pptx"
-            st.download_button(
-                label="📥 完成PPTXをダウンロード",
-                data=result_bytes,
-                file_name=output_filename,
-                mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-                type="primary",
-                use_container_width=True
-            )
+            if job is None:
+                st.error("審査基準からカテゴリを抽出できませんでした")
+                st.stop()
+            
+            categories, groups, mapping, fixed_slides, result, cascade_stats, candidates = job
+            if shared:
+                # 出力ファイルは各セッションで削除するため、共有した場合は自分用に複製する
+                result = copy_output_file(result)
+                update_progress(1.0, "完了！（実行中の同じ処理の結果を共有しました）")
+            st.info(f"📋 {len(categories)} 件のカテゴリを抽出しました")
             
-            # カテゴリ一覧表示
-            with st.expander("📋 抽出されたカテゴリ一覧"):
-                for cat in categories:
-                    main_cat = cat.get('MainCategory', cat.get('Category', ''))
-                    st.write(f"{cat['No']}. {main_cat}")
-                    
+            # マッチング結果はセッションに保持し、修正時は出力段階だけをやり直す
+            clear_output()
+            st.session_state.pop("mapping_editor", None)
+            st.session_state["match_state"] = {
+                "criteria_name": criteria_files[0].name,
+                "template_version": template_version(),
+                "template_key": template_key,
+                "categories": categories,
+                "groups": groups,
+                "ai_mapping": mapping,
+                "fixed_slides": fixed_slides,
+                "thumbnails_future": thumbnails_future,
+                "cascade_stats": cascade_stats,
+                "candidates": candidates,
+            }
+            store_output(output_key(mapping, unmatched, split_output), result,
+                         time.perf_counter() - started)
         except Exception as e:
             st.error(f"エラーが発生しました: {e}")
             import traceback
             st.code(traceback.format_exc())
+        finally:
+            for upload in uploads:
+                upload.close()
 elif not template_to_use:
     st.info("👈 サイドバーからテンプレートをアップロードしてください")
 else:
     st.info("👆 審査基準ファイルをアップロードしてください")
 
+# 結果表示（テンプレートが更新された場合は破棄）
+match_state = st.session_state.get("match_state")
+if match_state and template_to_use and match_state["template_version"] == template_version():
+    show_results(match_state, template_to_use, UNMATCHED_OPTIONS[unmatched_label], split_output)
+elif match_state:
+    st.session_state.pop("match_state")
+    clear_output()
+
 # フッター
 st.markdown("---")
 st.caption("PPTX Organizer v5 | Powered by Google Gemini")
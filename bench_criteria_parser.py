@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+審査基準表パーサーのマイクロベンチマーク
+====================================
+1万行規模の合成テーブルで、旧実装（行ごとに re.match を2回呼び、
+小項目の重複をリストで線形探索する版）と criteria_parser の
+1パス実装を比較する。出力が完全に一致することも確認する。
+
+Usage:
+    python bench_criteria_parser.py [rows] [repeat]
+"""
+
+import re
+import sys
+import time
+import random
+
+from criteria_parser import parse_category_tables
+
+
+def legacy_parse_category_tables(page_tables):
+    """旧実装（extract_categories_from_pdf の行ループをそのまま移植）"""
+    categories = []
+    current_category = None
+
+    for tables in page_tables:
+        for table in tables:
+            if not table or len(table) < 2:
+                continue
+            for row in table:
+                if not row or len(row) < 2:
+                    continue
+                col0 = str(row[0]).strip() if row[0] else ""
+                col1 = str(row[1]).strip() if row[1] else ""
+
+                if col0 and re.match(r'^\d+', col0):
+                    no_match = re.match(r'^(\d+)', col0)
+                    if no_match and col1:
+                        if current_category:
+                            categories.append(current_category)
+                        no = int(no_match.group(1))
+                        lines = col1.split('\n')
+                        main_category = lines[0].strip()
+                        current_category = {
+                            'No': no,
+                            'MainCategory': main_category,
+                            'SubItems': []
+                        }
+
+                if len(row) >= 4 and current_category:
+                    col2 = str(row[2]).strip() if row[2] else ""
+                    col3 = str(row[3]).strip() if row[3] else ""
+                    if col2 and re.match(r'^\d+$', col2) and col3:
+                        sub_item = col3.split('\n')[0].strip()[:100]
+                        if sub_item and sub_item not in current_category['SubItems']:
+                            current_category['SubItems'].append(sub_item)
+
+        if current_category and current_category not in categories:
+            categories.append(current_category)
+            current_category = None
+
+    seen_nos = set()
+    unique_categories = []
+    for cat in categories:
+        if cat['No'] not in seen_nos:
+            seen_nos.add(cat['No'])
+            unique_categories.append(cat)
+
+    unique_categories.sort(key=lambda x: x['No'])
+    return unique_categories
+
+
+def make_synthetic_tables(rows: int, pages: int = 10, seed: int = 0):
+    """大項目・小項目・継続行・重複を含む合成テーブル（ページ単位）"""
+    rng = random.Random(seed)
+    per_page = rows // pages
+    page_tables = []
+    no = 0
+    for _ in range(pages):
+        table = [['No', '評価項目', '', '評価の視点', '配点']]
+        sub_no = 0
+        for _ in range(per_page):
+            r = rng.random()
+            if r < 0.02:
+                # 大項目行（たまに既出の No を混ぜる）
+                no = no + 1 if rng.random() > 0.05 else max(1, no - 3)
+                sub_no = 1
+                table.append([f' {no} ', f'大項目{no}（説明）\n補足行', '1',
+                              f'小項目{no}-{sub_no}の評価内容\n詳細', '10'])
+            elif r < 0.85:
+                # 小項目行（重複あり）
+                sub_no += 1
+                text = f'小項目{no}-{rng.randint(1, max(1, sub_no))}の評価内容'
+                table.append([None, None, str(sub_no), text + '\n詳細', '5'])
+            else:
+                # 継続行・空行
+                table.append([None, '続き', None, '（続き）', None])
+        page_tables.append([table])
+    return page_tables
+
+
+def bench(fn, page_tables, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(page_tables)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    page_tables = make_synthetic_tables(rows)
+    expected = legacy_parse_category_tables(page_tables)
+    actual = [c.to_dict() for c in parse_category_tables(page_tables)]
+    assert actual == expected, "出力が旧実装と一致しません"
+
+    sub_total = sum(len(c['SubItems']) for c in expected)
+    print(f"rows={rows}  categories={len(expected)}  sub_items={sub_total}  (出力一致)")
+
+    legacy = bench(legacy_parse_category_tables, page_tables, repeat)
+    current = bench(parse_category_tables, page_tables, repeat)
+    print(f"legacy : {legacy * 1000:8.2f} ms")
+    print(f"current: {current * 1000:8.2f} ms")
+    print(f"speedup: {legacy / current:6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
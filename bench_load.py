@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+整理処理の負荷試験
+================
+main.py の処理（カテゴリ抽出 → 目次 → グループ化 → マッチング → 保存）を
+N件同時に実行し、スループットと段階ごとの p50 / p95 / p99 を出力する。
+
+AIは http バックエンド（Gemini 互換サーバー）を使う。--server を省略すると
+fake_gemini_server をこのプロセス内で起動するため、APIキーもネットワークも不要。
+段階ごとの時間は run_record.RunRecorder の timings から集計する。
+--client-rpm / --client-tpm を指定すると、アプリと同じく全ジョブで共有する
+request_scheduler.RequestScheduler を通して送る（ジョブごとに別セッション扱い）。
+
+Usage:
+    python bench_load.py master.pptx [-c 審査基準.pdf ...] [--jobs 20] [--concurrency 5]
+                         [--latency 1.0 --jitter 0.5 --error-rate 0.05 --rpm 60]
+    python bench_load.py master.pptx --server http://127.0.0.1:8765
+    python bench_load.py master.pptx --rpm 30 --client-rpm 30
+"""
+
+import os
+import math
+import time
+import logging
+import argparse
+import tempfile
+import traceback
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from fake_gemini_server import start_server
+from model_backend import HttpModel
+from run_record import RunRecorder, RecordingModel
+from request_scheduler import PRIORITY_EXTRACT, RequestScheduler, ScheduledModel
+import main as organizer
+
+# --criteria を省略した場合の審査基準（AI抽出の経路を通す）
+SAMPLE_CRITERIA = """審査基準
+1. 事業の目的と概要
+2. 実施体制
+3. 業務スケジュール
+4. 品質管理と安全対策
+5. 費用の見積もり
+"""
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """最近順位法のパーセンタイル"""
+    ordered = sorted(values)
+    if not ordered:
+        return float('nan')
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_job(model_url: str, criteria: List[str], template: str, out_dir: str, job_no: int,
+            options: Dict, scheduler: Optional[RequestScheduler] = None) -> Dict:
+    """1件の整理処理。{"ok", "timings", "total", "error"} を返す"""
+    recorder = RunRecorder('bench', options)
+    model = HttpModel(model_url)
+    extract_model = model
+    if scheduler is not None:
+        model = ScheduledModel(model, scheduler, f"job{job_no}")
+        extract_model = model.with_priority(PRIORITY_EXTRACT)
+    model, extract_model = RecordingModel(model, recorder), RecordingModel(extract_model, recorder)
+    started = time.perf_counter()
+    try:
+        recorder.start('extract')
+        categories = organizer.extract_categories_from_files(extract_model, criteria)
+        if not categories:
+            raise RuntimeError("カテゴリを抽出できませんでした")
+        output = os.path.join(out_dir, f"job{job_no:04d}.pptx")
+        result = organizer.process_pptx(model, categories, template, output,
+                                        unmatched=options['unmatched'], split=options['split'],
+                                        grouping=options['grouping'], recorder=recorder)
+        ok, error = result is not None, None if result is not None else "マッチングに失敗"
+    except Exception as e:
+        recorder.finish()
+        ok, error = False, f"{type(e).__name__}: {e}"
+        logging.debug(traceback.format_exc())
+    return {"ok": ok, "timings": dict(recorder.data["timings"]),
+            "total": time.perf_counter() - started, "error": error}
+
+
+def report(results: List[Dict], elapsed: float, server=None, scheduler=None):
+    ok = [r for r in results if r["ok"]]
+    print("")
+    print(f"ジョブ: {len(results)} 件, 成功 {len(ok)} 件, 失敗 {len(results) - len(ok)} 件, "
+          f"経過 {elapsed:.2f}s, スループット {len(ok) / elapsed:.2f} jobs/s")
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"][:80]] = errors.get(r["error"][:80], 0) + 1
+    for message, count in sorted(errors.items(), key=lambda item: -item[1]):
+        print(f"  {count:4d} x {message}")
+    if server is not None:
+        print(f"サーバー: リクエスト {server.stats['requests']} 件, 429 {server.stats['rate_limited']} 件, "
+              f"500 {server.stats['errors']} 件")
+    if scheduler is not None:
+        granted = max(1, scheduler.stats['granted'])
+        print(f"スケジューラ: 送信 {scheduler.stats['granted']} 件, 平均待ち "
+              f"{scheduler.stats['waited_seconds'] / granted:.2f}s, 429 による停止 {scheduler.stats['rate_limited']} 回")
+
+    stages = []
+    for r in results:
+        stages.extend(stage for stage in r["timings"] if stage not in stages)
+    print("")
+    print(f"{'stage':10s} {'n':>5s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}")
+    for stage in stages + ['total']:
+        values = [r["total"] if stage == 'total' else r["timings"][stage]
+                  for r in ok if stage == 'total' or stage in r["timings"]]
+        if not values:
+            continue
+        print(f"{stage:10s} {len(values):5d} {percentile(values, 50):8.3f}s {percentile(values, 95):8.3f}s "
+              f"{percentile(values, 99):8.3f}s {max(values):8.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='整理処理の負荷試験（Gemini 互換サーバーを使用）')
+    parser.add_argument('template', help='テンプレートPPTX')
+    parser.add_argument('-c', '--criteria', action='append', default=[], metavar='FILE',
+                        help='審査基準ファイル（複数指定可。省略時は番号付きテキストをAIで抽出）')
+    parser.add_argument('--jobs', type=int, default=20, help='ジョブ数（既定: 20）')
+    parser.add_argument('--concurrency', type=int, default=5, help='同時実行数（既定: 5）')
+    parser.add_argument('--server', default=None, help='Gemini 互換サーバーのURL（省略時は内部で起動）')
+    parser.add_argument('--latency', type=float, default=0.5, help='内部サーバーの遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='内部サーバーの遅延の乱数幅（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='内部サーバーが 500 を返す割合')
+    parser.add_argument('--rpm', type=int, default=0, help='内部サーバーの1分あたりのリクエスト上限')
+    parser.add_argument('--tpm', type=int, default=0, help='内部サーバーの1分あたりのトークン上限')
+    parser.add_argument('--client-rpm', type=int, default=None,
+                        help='共有スケジューラの1分あたりのリクエスト上限（指定時のみ使用）')
+    parser.add_argument('--client-tpm', type=int, default=0,
+                        help='共有スケジューラの1分あたりのトークン上限（0 は無制限）')
+    parser.add_argument('--unmatched', default='keep', help='未使用スライドの扱い（既定: keep）')
+    parser.add_argument('--grouping', default=organizer.DEFAULT_GROUPING, help='グループ化の方法')
+    parser.add_argument('--split', action='store_true', help='カテゴリごとに分割して出力')
+    parser.add_argument('-v', '--verbose', action='store_true', help='処理のログを表示')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    server = None
+    if args.server:
+        model_url = args.server
+    else:
+        server = start_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                              rpm=args.rpm, tpm=args.tpm, seed=0)
+        model_url = server.url
+
+    scheduler = None
+    if args.client_rpm is not None:
+        scheduler = RequestScheduler(rpm=args.client_rpm, tpm=args.client_tpm)
+
+    options = {'unmatched': args.unmatched, 'grouping': args.grouping, 'split': args.split}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        criteria = args.criteria
+        if not criteria:
+            sample = Path(tmp_dir) / "criteria.txt"
+            sample.write_text(SAMPLE_CRITERIA, encoding='utf-8')
+            criteria = [str(sample)]
+
+        print(f"{args.jobs} ジョブ / 同時実行 {args.concurrency}（サーバー: {model_url}）")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+            futures = [pool.submit(run_job, model_url, criteria, args.template, tmp_dir, i, options,
+                                   scheduler)
+                       for i in range(args.jobs)]
+            results = [f.result() for f in futures]
+        elapsed = time.perf_counter() - started
+
+    report(results, elapsed, server, scheduler)
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スライドグループ化のベンチマーク
+==============================
+1,000スライド規模の合成デッキで、旧実装（辞書 + 文字列の連結と切り詰め）と
+records.SlideGroup を使う build_slide_groups を比較する。
+グループの内容が一致することを確認し、時間とメモリ（tracemalloc）を出力する。
+
+Usage:
+    python bench_slide_groups.py [slides] [titled_every]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from pptx import Presentation
+from pptx.util import Inches
+
+from pptx_utils import get_slide_title, get_slide_first_text, build_slide_groups
+
+
+def legacy_full_content(slide) -> str:
+    texts = []
+    for shape in slide.shapes:
+        if shape.has_text_frame:
+            text = shape.text_frame.text.strip()
+            if text and len(text) > 2:
+                texts.append(text)
+    return "\n".join(texts)[:500]
+
+
+def legacy_groups(prs, start):
+    """旧実装（process_pptx のグループ化ループをそのまま移植）"""
+    groups = []
+    current_group = None
+    for idx in range(start, len(prs.slides)):
+        slide = prs.slides[idx]
+        title = get_slide_title(slide)
+        content = legacy_full_content(slide)
+        if title:
+            if current_group:
+                groups.append(current_group)
+            current_group = {'title': title, 'slides': [idx], 'first_index': idx, 'content': content}
+        else:
+            if current_group:
+                current_group['slides'].append(idx)
+                current_group['content'] = (current_group.get('content', '') + '\n' + content)[:500]
+            else:
+                first_text = get_slide_first_text(slide)
+                current_group = {
+                    'title': first_text[:50] if first_text else f"[Untitled {idx}]",
+                    'slides': [idx], 'first_index': idx, 'content': content
+                }
+    if current_group:
+        groups.append(current_group)
+    return groups
+
+
+def make_deck(slides: int, titled_every: int):
+    """タイトル付きスライドと本文のみのスライドを交互に含む合成デッキ"""
+    prs = Presentation()
+    title_layout = prs.slide_layouts[5]   # Title Only
+    blank_layout = prs.slide_layouts[6]   # Blank
+    body = "本文テキスト。保育方針や職員体制などの説明がここに入ります。" * 4
+    for i in range(slides):
+        if i % titled_every == 0:
+            slide = prs.slides.add_slide(title_layout)
+            slide.shapes.title.text = f"セクション {i // titled_every}"
+        else:
+            slide = prs.slides.add_slide(blank_layout)
+        for j in range(3):
+            box = slide.shapes.add_textbox(Inches(0.5), Inches(1 + j), Inches(9), Inches(1))
+            box.text_frame.text = f"{i}-{j} {body}"
+        footer = slide.shapes.add_textbox(Inches(0.5), Inches(7), Inches(9), Inches(0.3))
+        footer.text_frame.text = f"社外秘 - {i + 1}"
+    return prs
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """グループ構造が保持しているメモリ量（共有オブジェクトは1回だけ数える）"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, '__slots__') and not isinstance(obj, (str, bytes)):
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(obj, name):
+                    size += deep_sizeof(getattr(obj, name), seen)
+    return size
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, deep_sizeof(result), peak
+
+
+def main():
+    slides = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    titled_every = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print(f"合成デッキを作成中: {slides} slides")
+    prs = make_deck(slides, titled_every)
+
+    old, old_time, old_size, old_peak = measure(legacy_groups, prs, 2)
+    new, new_time, new_size, new_peak = measure(build_slide_groups, prs, 2)
+    # 内容を文字列化してから比較・計測する（バッファは初回の str() で1本にまとまる）
+    assert [g.to_dict() for g in new] == old, "グループ化の結果が旧実装と一致しません"
+    new_size = deep_sizeof(new)
+
+    print(f"groups={len(new)}  (出力一致)")
+    print(f"legacy : {old_time * 1000:8.1f} ms  groups {old_size / 1024:8.1f} KiB  peak {old_peak / 1024:8.1f} KiB")
+    print(f"records: {new_time * 1000:8.1f} ms  groups {new_size / 1024:8.1f} KiB  peak {new_peak / 1024:8.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+テキスト索引のベンチマーク
+========================
+1,000スライド規模の合成デッキ（テキストボックス・表・グループ・ノート）で、
+slide_index の検索と、全シェイプを走査する素朴な検索を比較する。
+結果が一致することを確認し、索引の作成・保存・読み込みと1回の検索の時間を出力する。
+
+Usage:
+    python bench_slide_index.py [slides] [repeat]
+"""
+
+import sys
+import json
+import time
+import tempfile
+from pathlib import Path
+
+from pptx import Presentation
+from pptx.util import Inches
+
+from slide_index import SlideIndex, normalize, shape_texts
+
+QUERIES = ["実施体制", "品質管理", "ISO9001", "保育方針 職員", "セクション 12", "存在しない語句", "体"]
+
+
+def make_deck(slides: int):
+    """本文・表・グループ・ノートを含む合成デッキ"""
+    prs = Presentation()
+    layout = prs.slide_layouts[5]   # Title Only
+    topics = ["実施体制", "品質管理", "保育方針", "職員体制", "安全対策", "ISO9001 認証"]
+    for i in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"セクション {i // 20}"
+        topic = topics[i % len(topics)]
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(1))
+        box.text_frame.text = f"{i}: {topic}についての説明。本文テキストがここに入ります。" * 2
+        table = slide.shapes.add_table(2, 3, Inches(0.5), Inches(3), Inches(9), Inches(1)).table
+        for r in range(2):
+            for c in range(3):
+                table.cell(r, c).text = f"{topics[(i + r + c) % len(topics)]} {r}-{c}"
+        group = slide.shapes.add_group_shape()
+        inner = group.shapes.add_textbox(Inches(0.5), Inches(5), Inches(4), Inches(0.5))
+        inner.text_frame.text = f"図の注記 {i}"
+        slide.notes_slide.notes_text_frame.text = f"発表メモ: {topics[(i + 3) % len(topics)]}"
+    return prs
+
+
+def naive_search(shapes, query):
+    """全シェイプを走査する検索（索引の結果の確認用）"""
+    terms = [normalize(t) for t in query.split() if normalize(t)]
+    per_slide = {}
+    for i, (position, _, _, text) in enumerate(shapes):
+        for term in terms:
+            if term in normalize(text):
+                per_slide.setdefault(position, {}).setdefault(term, set()).add(i)
+    found = set()
+    for position, by_term in per_slide.items():
+        if len(by_term) == len(terms):
+            for ids in by_term.values():
+                found |= ids
+    return sorted(found)
+
+
+def main():
+    slides = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print(f"合成デッキを作成中: {slides} slides")
+    prs = make_deck(slides)
+
+    start = time.perf_counter()
+    index = SlideIndex.build(prs)
+    build_time = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "index.json"
+        start = time.perf_counter()
+        path.write_text(json.dumps(index.to_dict(), ensure_ascii=False), encoding='utf-8')
+        save_time = time.perf_counter() - start
+        start = time.perf_counter()
+        index = SlideIndex.from_dict(json.loads(path.read_text(encoding='utf-8')))
+        load_time = time.perf_counter() - start
+        size = path.stat().st_size
+
+    print(f"shapes={len(index)}  bigrams={len(index.postings)}  file {size / 1024:.0f} KiB")
+    print(f"build {build_time * 1000:8.1f} ms  save {save_time * 1000:6.1f} ms  load {load_time * 1000:6.1f} ms")
+    assert shape_texts(prs.slides[0]), "シェイプのテキストを取得できません"
+
+    for query in QUERIES:
+        hits = index.search(query, limit=None)
+        shape_ids = sorted({i for term in query.split() for i in index.find(term)
+                            if index.shapes[i][0] + 1 in {h.slide for h in hits}})
+        expected = naive_search(index.shapes, query)
+        assert shape_ids == expected, f"検索結果が一致しません: {query}"
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.search(query, limit=50)
+        indexed = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(max(1, repeat // 20)):
+            naive_search(index.shapes, query)
+        naive = (time.perf_counter() - start) / max(1, repeat // 20)
+        print(f"{query:14s} hits {len(hits):5d}  index {indexed * 1000:8.3f} ms  naive {naive * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
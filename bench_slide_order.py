@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スライド並べ替えのベンチマーク
+============================
+数千枚規模の sldIdLst で、旧実装（先頭から1つずつ remove して append し直す）と
+slide_order.reorder_slides（置換1回）を比較する。並び順が一致することも確認する。
+
+Usage:
+    python bench_slide_order.py [slides ...]
+"""
+
+import sys
+import time
+import random
+
+from pptx import Presentation
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+
+from slide_order import reorder_slides
+
+
+class _FakeSlides:
+    def __init__(self, sld_id_lst):
+        self._sldIdLst = sld_id_lst
+
+
+class _FakePresentation:
+    """sldIdLst だけを持つ Presentation の代わり（スライドパーツの生成を省く）"""
+    def __init__(self, count: int, part):
+        xml = ''.join(f'<p:sldId id="{256 + i}" r:id="rId{i + 10}"/>' for i in range(count))
+        self.slides = _FakeSlides(parse_xml(f'<p:sldIdLst {nsdecls("p", "r")}>{xml}</p:sldIdLst>'))
+        self.part = part
+
+
+def legacy_reorder(prs, order):
+    """旧実装（process_pptx の並べ替えをそのまま移植）"""
+    xml_slides = prs.slides._sldIdLst
+    original_slides = list(xml_slides)
+    while len(xml_slides) > 0:
+        xml_slides.remove(xml_slides[0])
+    for idx in order:
+        xml_slides.append(original_slides[idx])
+
+
+def ids(prs):
+    return [s.get('id') for s in prs.slides._sldIdLst]
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 5000, 20000]
+    # セクション情報の参照用に本物の presentation パーツを使う
+    part = Presentation().part
+
+    for count in sizes:
+        order = list(range(count))
+        random.Random(count).shuffle(order)
+
+        old = _FakePresentation(count, part)
+        start = time.perf_counter()
+        legacy_reorder(old, order)
+        legacy = time.perf_counter() - start
+
+        new = _FakePresentation(count, part)
+        start = time.perf_counter()
+        reorder_slides(new, order)
+        current = time.perf_counter() - start
+
+        assert ids(old) == ids(new), "並び順が旧実装と一致しません"
+        print(f"slides={count:6d}  legacy {legacy * 1000:9.1f} ms  "
+              f"reorder_slides {current * 1000:7.1f} ms  ({legacy / current:6.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+審査基準表の行パーサー
+====================
+pdfplumber / OCR のテーブル行や Excel の行から、大項目・小項目の
+階層構造を取り出す。main.py と app.py の両方から利用する。
+
+各行は1パスで分類し、正規表現はモジュール読み込み時にコンパイルする。
+小項目と No の重複チェックは set で行うため、行数に対して線形に動作する。
+
+複数ファイルから抽出したカテゴリは merge_categories() で1つにまとめる。
+"""
+
+import re
+import logging
+import unicodedata
+from difflib import SequenceMatcher
+from typing import List, Optional, Iterable, Sequence
+
+from records import Category
+
+logger = logging.getLogger(__name__)
+
+# 先頭が数字（大項目番号）
+_LEADING_NO = re.compile(r'\d+')
+# 全体が数字（小項目番号）
+_DIGITS_ONLY = re.compile(r'\d+$')
+# 比較用の正規化で除く先頭の番号と記号・空白
+_HEAD_NUMBERING = re.compile(r'^\s*(?:no\.?\s*)?\d+\s*[.、)\]:]?\s*', re.IGNORECASE)
+_SEPARATORS = re.compile(r'[\s・、。,.:：;；()（）\[\]「」『』【】-]+')
+
+# 同じ No のカテゴリを同一とみなす名称の類似度
+SAME_CATEGORY_SIMILARITY = 0.6
+
+
+def _first_line(text: str) -> str:
+    return text.partition('\n')[0].strip()
+
+
+def parse_category_tables(page_tables: Iterable[Iterable[Optional[list]]]) -> List[Category]:
+    """
+    ページごとのテーブル一覧から大項目・小項目を含む階層構造でカテゴリを抽出
+    （pdfplumber の extract_tables() とOCRの復元テーブルの両方に対応）
+
+    Returns:
+        List[Category]: No 順に並んだ大項目（同じ No は最初の出現のみ）
+            cat['No'], cat['MainCategory'], cat['SubItems'] でも参照できる
+    """
+    leading_no = _LEADING_NO.match
+    digits_only = _DIGITS_ONLY.match
+
+    categories = []
+    seen_nos = set()
+    # 現在の大項目の小項目リストと重複チェック用 set（重複 No の大項目は None）
+    sub_items = None
+    sub_seen = None
+
+    for tables in page_tables:
+        for table in tables:
+            if not table or len(table) < 2:
+                continue
+
+            for row in table:
+                if not row or len(row) < 2:
+                    continue
+
+                # 大項目の検出（数字で始まる行）
+                cell = row[0]
+                if cell:
+                    col0 = str(cell).strip()
+                    no_match = leading_no(col0)
+                    if no_match:
+                        cell = row[1]
+                        col1 = str(cell).strip() if cell else ""
+                        if col1:
+                            no = int(no_match.group())
+                            if no in seen_nos:
+                                # 既出の No は最初の出現を優先する
+                                sub_items = sub_seen = None
+                            else:
+                                seen_nos.add(no)
+                                sub_items = []
+                                sub_seen = set()
+                                categories.append(Category(no, _first_line(col1), sub_items))
+
+                # 小項目の検出（col2に数字、col3に内容がある行）
+                if sub_items is not None and len(row) >= 4:
+                    cell = row[2]
+                    if cell and digits_only(str(cell).strip()):
+                        cell = row[3]
+                        col3 = str(cell).strip() if cell else ""
+                        if col3:
+                            sub_item = _first_line(col3)[:100]
+                            if sub_item and sub_item not in sub_seen:
+                                sub_seen.add(sub_item)
+                                sub_items.append(sub_item)
+
+        # ページをまたいで小項目を引き継がない
+        sub_items = sub_seen = None
+
+    categories.sort(key=lambda x: x.no)
+    return categories
+
+
+def parse_category_rows(rows: Iterable[Optional[tuple]]) -> List[Category]:
+    """
+    Excel 等の行から大項目のみを抽出
+
+    Returns:
+        List[Category]: No 順の大項目（小項目は空）
+    """
+    leading_no = _LEADING_NO.match
+    categories = []
+    seen_nos = set()
+
+    for row in rows:
+        if not row or len(row) < 2:
+            continue
+        cell = row[0]
+        if not cell:
+            continue
+        no_match = leading_no(str(cell).strip())
+        if not no_match:
+            continue
+        cell = row[1]
+        col1 = str(cell).strip() if cell else ""
+        if col1:
+            no = int(no_match.group())
+            if no not in seen_nos:
+                seen_nos.add(no)
+                categories.append(Category(no, _first_line(col1)))
+
+    categories.sort(key=lambda x: x.no)
+    return categories
+
+
+# ============================================================================
+# Merge
+# ============================================================================
+def normalize_category_text(text: str) -> str:
+    """比較用の正規化（全角・半角の統一、先頭の番号・記号・空白の除去）"""
+    text = unicodedata.normalize('NFKC', text or "")
+    text = _HEAD_NUMBERING.sub('', text)
+    return _SEPARATORS.sub('', text).lower()
+
+
+def _same_category(a: str, b: str) -> bool:
+    if not a or not b:
+        return True
+    if a == b or a in b or b in a:
+        return True
+    return SequenceMatcher(None, a, b).ratio() >= SAME_CATEGORY_SIMILARITY
+
+
+def merge_categories(category_lists: Sequence[Sequence[Category]]) -> List[Category]:
+    """
+    複数ファイルから抽出したカテゴリを No と正規化した名称でまとめる
+
+    - 名称（正規化後）が同じカテゴリは1つにまとめ、小項目を統合する
+    - 同じ No で名称が近いカテゴリは同一とみなし、先のファイルの名称を使う
+    - 同じ No で名称が異なるカテゴリは別物とみなし、後のものに空いている No を振る
+
+    Args:
+        category_lists: ファイル順のカテゴリ一覧（先のファイルを優先）
+
+    Returns:
+        List[Category]: No 順
+    """
+    by_no = {}
+    by_text = {}
+    sub_seen = {}
+    conflicts = []
+
+    def absorb(target: Category, source: Category):
+        seen = sub_seen[id(target)]
+        for sub_item in source.sub_items:
+            key = normalize_category_text(sub_item)
+            if key not in seen:
+                seen.add(key)
+                target.sub_items.append(sub_item)
+
+    for categories in category_lists:
+        for cat in categories:
+            text = normalize_category_text(cat.main_category)
+            existing = by_text.get(text) if text else None
+            if existing is None:
+                same_no = by_no.get(cat.no)
+                if same_no is not None:
+                    if _same_category(normalize_category_text(same_no.main_category), text):
+                        existing = same_no
+                    else:
+                        conflicts.append(cat)
+                        continue
+            if existing is not None:
+                absorb(existing, cat)
+                continue
+
+            merged = Category(cat.no, cat.main_category, [])
+            sub_seen[id(merged)] = set()
+            absorb(merged, cat)
+            by_no[cat.no] = merged
+            if text:
+                by_text[text] = merged
+
+    # No が衝突した別のカテゴリは末尾の空き番号へ
+    next_no = max(by_no, default=0) + 1
+    for cat in conflicts:
+        text = normalize_category_text(cat.main_category)
+        if text and text in by_text:
+            absorb(by_text[text], cat)
+            continue
+        logger.warning(f"No.{cat.no} が重複しているため No.{next_no} として追加します: {cat.main_category}")
+        merged = Category(next_no, cat.main_category, [])
+        sub_seen[id(merged)] = set()
+        absorb(merged, cat)
+        by_no[next_no] = merged
+        if text:
+            by_text[text] = merged
+        next_no += 1
+
+    merged_list = sorted(by_no.values(), key=lambda x: x.no)
+    total = sum(len(categories) for categories in category_lists)
+    if len(category_lists) > 1:
+        logger.info(f"カテゴリを統合: {len(category_lists)} ファイル, {total} 件 -> {len(merged_list)} 件")
+    return merged_list
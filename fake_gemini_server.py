@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Gemini 互換のローカルサーバー（負荷試験・オフラインCI用）
+=====================================================
+Gemini REST API の generateContent / countTokens と同じ形式で応答する。
+APIキーもネットワークも不要で、遅延・エラー率・レート制限を設定できる。
+
+応答の内容:
+    カテゴリ抽出（responseSchema に Category を含む）
+        プロンプト中の「1. 〇〇」形式の行をカテゴリとして返す
+    マッチング（responseSchema に Group を含む）
+        プロンプト中のカテゴリ（PDF1: / CAT1:）とグループ（PPTX0: / GRP0:）を
+        文字バイグラムの重なりで1対1に割り当てる
+        （重なりの無いカテゴリには、空いているグループを先頭から割り当てる）
+        responseSchema に Confidence がある場合は、重なりで選んだものを 0.9、それ以外を 0.3 とする
+
+レート制限は直近60秒のリクエスト数・トークン数で判定し、超えた場合は
+Retry-After 付きの 429（RESOURCE_EXHAUSTED）を返す。
+
+Usage:
+    python fake_gemini_server.py --port 8765 --latency 1.5 --jitter 0.5 --error-rate 0.02 --rpm 60
+    MODEL_BACKEND=http MODEL_BASE_URL=http://127.0.0.1:8765 python main.py 審査基準.pdf master.pptx
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from prompt_builder import estimate_tokens
+
+_ROUTE = re.compile(r'^/v1beta/(?P<model>.+):(?P<method>generateContent|countTokens)$')
+_CATEGORY_LINE = re.compile(r'^\s*(?:No\.?\s*)?(\d{1,3})\s*[.．、)）:：]\s*(.+?)\s*$')
+_CATEGORY_ENTRY = re.compile(r'^(?:PDF|CAT)(\d+): 【大項目】 (.+)$')
+_GROUP_ENTRY = re.compile(r'^(?:PPTX|GRP)(\d+): (.*)$')
+
+WINDOW_SECONDS = 60.0
+
+
+# ============================================================================
+# Responses
+# ============================================================================
+def _prompt_text(payload: Dict) -> str:
+    texts = []
+    for content in payload.get("contents") or []:
+        for part in content.get("parts") or []:
+            if "text" in part:
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+def _bigrams(text: str) -> set:
+    text = re.sub(r'\s+', '', text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def fake_categories(prompt: str) -> List[Dict]:
+    """プロンプト中の番号付きの行をカテゴリとして返す（無ければ固定の3件）"""
+    categories = []
+    seen = set()
+    for line in prompt.split('\n'):
+        match = _CATEGORY_LINE.match(line)
+        if match and int(match.group(1)) not in seen:
+            seen.add(int(match.group(1)))
+            categories.append({"No": int(match.group(1)), "Category": match.group(2)[:60], "SubItems": []})
+    return categories or [
+        {"No": no, "Category": name, "SubItems": []}
+        for no, name in ((1, "事業概要"), (2, "実施体制"), (3, "スケジュール"))
+    ]
+
+
+def fake_mapping(prompt: str) -> List[Dict]:
+    """カテゴリとグループを文字バイグラムの重なりで1対1に割り当てる（残りは空きグループを順に）"""
+    categories: List[Tuple[int, set]] = []
+    groups: Dict[int, set] = {}
+    current = None
+    for line in prompt.split('\n'):
+        cat = _CATEGORY_ENTRY.match(line)
+        grp = _GROUP_ENTRY.match(line)
+        if cat:
+            categories.append((int(cat.group(1)), _bigrams(cat.group(2))))
+            current = categories[-1][1]
+        elif grp:
+            groups[int(grp.group(1))] = _bigrams(grp.group(2))
+            current = groups[int(grp.group(1))]
+        elif current is not None and line.startswith("  "):
+            current.update(_bigrams(line))
+
+    scores = sorted(
+        ((len(grams & group_grams), no, idx)
+         for no, grams in categories for idx, group_grams in groups.items()),
+        key=lambda item: (-item[0], item[1], item[2])
+    )
+    mapping = {}
+    used = set()
+    for score, no, idx in scores:
+        if score > 0 and no not in mapping and idx not in used:
+            mapping[no] = idx
+            used.add(idx)
+    free = iter(idx for idx in sorted(groups) if idx not in used)
+    answers = []
+    for no, _ in categories:
+        # 重なりで選んだものは確信度を高く、空きグループを割り当てたものは低くする
+        confidence = 0.9 if no in mapping else 0.3
+        group = mapping[no] if no in mapping else next(free, -1)
+        answers.append({"No": no, "Group": group, "Confidence": confidence})
+    return answers
+
+
+def fake_response(payload: Dict) -> Tuple[str, int, int]:
+    """(応答テキスト, プロンプトのトークン数, 出力のトークン数)"""
+    prompt = _prompt_text(payload)
+    schema = (payload.get("generationConfig") or {}).get("responseSchema") or {}
+    properties = (schema.get("items") or {}).get("properties") or {}
+    if "Group" in properties:
+        answers = fake_mapping(prompt)
+        if "Confidence" not in properties:
+            answers = [{"No": a["No"], "Group": a["Group"]} for a in answers]
+        text = json.dumps(answers, ensure_ascii=False)
+    elif "Category" in properties:
+        text = json.dumps(fake_categories(prompt), ensure_ascii=False)
+    else:
+        text = "OK"
+    return text, estimate_tokens(prompt), estimate_tokens(text)
+
+
+# ============================================================================
+# Server
+# ============================================================================
+class FakeGeminiServer(ThreadingHTTPServer):
+    """
+    Args:
+        latency: 応答までの基本の遅延（秒）
+        jitter: 遅延に加える一様乱数の幅（秒）
+        error_rate: 500 を返す割合（0〜1）
+        rpm / tpm: 1分あたりのリクエスト数・トークン数の上限（0 は無制限）
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.5, jitter: float = 0.0, error_rate: float = 0.0,
+                 rpm: int = 0, tpm: int = 0, seed: Optional[int] = None):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.tpm = tpm
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = deque()  # (時刻, トークン数)
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self, tokens: int) -> Optional[float]:
+        """レート制限の判定。受け付ける場合は None、超過時は待つべき秒数"""
+        now = time.monotonic()
+        with self.lock:
+            self.stats["requests"] += 1
+            while self.window and now - self.window[0][0] >= WINDOW_SECONDS:
+                self.window.popleft()
+            over_rpm = self.rpm and len(self.window) >= self.rpm
+            over_tpm = self.tpm and sum(t for _, t in self.window) + tokens > self.tpm
+            if over_rpm or over_tpm:
+                self.stats["rate_limited"] += 1
+                oldest = self.window[0][0] if self.window else now
+                return max(1.0, WINDOW_SECONDS - (now - oldest))
+            self.window.append((now, tokens))
+            return None
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+            return failed
+
+    def delay(self) -> float:
+        with self.lock:
+            return self.latency + self.random.uniform(0, self.jitter)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeGeminiServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, state: str, message: str, headers: Optional[Dict] = None):
+        self._send(status, {"error": {"code": status, "message": message, "status": state}}, headers)
+
+    def do_POST(self):
+        route = _ROUTE.match(self.path.split('?')[0])
+        if not route:
+            self._error(404, "NOT_FOUND", f"unknown path: {self.path}")
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            self._error(400, "INVALID_ARGUMENT", "invalid JSON payload")
+            return
+
+        if route.group("method") == "countTokens":
+            self._send(200, {"totalTokens": estimate_tokens(_prompt_text(payload))})
+            return
+
+        text, prompt_tokens, output_tokens = fake_response(payload)
+        retry_after = self.server.admit(prompt_tokens + output_tokens)
+        if retry_after is not None:
+            self._error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).",
+                        {"Retry-After": f"{retry_after:.0f}"})
+            return
+        time.sleep(self.server.delay())
+        if self.server.should_fail():
+            self._error(500, "INTERNAL", "An internal error has occurred.")
+            return
+        self._send(200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]},
+                            "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens,
+                              "candidatesTokenCount": output_tokens,
+                              "totalTokenCount": prompt_tokens + output_tokens},
+            "modelVersion": route.group("model").split('/')[-1],
+        })
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, **options) -> FakeGeminiServer:
+    """サーバーをバックグラウンドのスレッドで起動する（port=0 は空いているポート）"""
+    server = FakeGeminiServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gemini 互換のローカルサーバー（負荷試験・オフラインCI用）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='応答の基本の遅延（秒、既定: 0.5）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='遅延に加える乱数の幅（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='500 を返す割合（0〜1）')
+    parser.add_argument('--rpm', type=int, default=0, help='1分あたりのリクエスト数の上限（0 は無制限）')
+    parser.add_argument('--tpm', type=int, default=0, help='1分あたりのトークン数の上限（0 は無制限）')
+    parser.add_argument('--seed', type=int, default=None, help='遅延・エラーの乱数シード')
+    args = parser.parse_args()
+
+    server = FakeGeminiServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate, rpm=args.rpm, tpm=args.tpm, seed=args.seed)
+    print(f"Gemini 互換サーバー: {server.url}（Ctrl+C で終了）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"リクエスト {server.stats['requests']} 件, 429 {server.stats['rate_limited']} 件, "
+              f"500 {server.stats['errors']} 件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+テンプレートのグループ表現と一括スコアリング
+=========================================
+同じテンプレートを多数の入札（審査基準）に使う場合、マッチングのグループ側
+（グループのタイトル＋内容）は毎回同じになる。グループごとの文字バイグラムを
+「語彙 × グループ」の0/1行列にして一度だけ作り、各入札ではカテゴリ側の
+バイグラムとの行列積だけを計算する。
+
+    scores[c, g] = |bigrams(c) ∩ bigrams(g)| / |bigrams(c)|
+
+（match_cascade のローカル照合と同じ値。カテゴリは大項目＋小項目）
+
+行列はグループの内容のハッシュをキーに、メモリと .group_matrix_cache にキャッシュする。
+グループのスライド番号（目次の枚数でずれる）はキーに含めないため、
+目次の枚数が違う入札どうしでも同じ行列を使う。
+
+    matrix = load_group_matrix(groups)
+    scores = matrix.score(categories)              # (カテゴリ数, グループ数)
+    batch = matrix.score_batch([cats1, cats2])     # 入札ごとの行列のリスト
+"""
+
+import os
+import re
+import hashlib
+import logging
+import zipfile
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+GROUP_MATRIX_CACHE_DIR = Path(__file__).parent / ".group_matrix_cache"
+# メモリに保持する行列の数（テンプレート × グループ化の方法）
+MEMORY_CACHE_SIZE = 8
+
+# キャッシュ形式やバイグラムの作り方を変えた場合はここを上げる（古いキャッシュを無効化）
+_CACHE_VERSION = 1
+
+_memory: 'OrderedDict[str, GroupMatrix]' = OrderedDict()
+_lock = threading.Lock()
+
+
+def bigrams(text: str) -> set:
+    """空白を除いた文字バイグラムの集合"""
+    text = re.sub(r'\s+', '', text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def group_text(group) -> str:
+    return f"{group.title}\n{group.content}"
+
+
+def category_text(category) -> str:
+    return " ".join([category.main_category] + list(category.sub_items))
+
+
+def groups_fingerprint(groups: Sequence) -> str:
+    """グループのタイトル・内容のハッシュ（スライド番号は含めない）"""
+    digest = hashlib.sha256(f"{_CACHE_VERSION}:".encode())
+    for group in groups:
+        digest.update(group.title.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(group.content.encode('utf-8'))
+        digest.update(b'\1')
+    return digest.hexdigest()
+
+
+# ============================================================================
+# Matrix
+# ============================================================================
+class GroupMatrix:
+    """グループのバイグラムの0/1行列（語彙 × グループ）"""
+
+    def __init__(self, vocab: Sequence[str], matrix: np.ndarray, fingerprint: str = ""):
+        self.vocab: Dict[str, int] = {gram: i for i, gram in enumerate(vocab)}
+        self.matrix = matrix
+        self.fingerprint = fingerprint
+
+    @property
+    def group_count(self) -> int:
+        return self.matrix.shape[1]
+
+    @classmethod
+    def build(cls, groups: Sequence, fingerprint: str = "") -> 'GroupMatrix':
+        grams = [bigrams(group_text(g)) for g in groups]
+        vocab = sorted(set().union(*grams)) if grams else []
+        index = {gram: i for i, gram in enumerate(vocab)}
+        matrix = np.zeros((len(vocab), len(groups)), dtype=np.uint8)
+        for col, group_grams in enumerate(grams):
+            matrix[[index[gram] for gram in group_grams], col] = 1
+        return cls(vocab, matrix, fingerprint)
+
+    def score(self, categories: Sequence) -> np.ndarray:
+        """
+        カテゴリ × グループのスコア行列（カテゴリのバイグラムがグループに含まれる割合）
+        グループに無いバイグラムは分母にだけ数える
+        """
+        rows: List[int] = []
+        starts: List[int] = []
+        filled: List[int] = []
+        sizes = np.ones(len(categories))
+        for i, cat in enumerate(categories):
+            grams = bigrams(category_text(cat))
+            known = [self.vocab[gram] for gram in grams if gram in self.vocab]
+            sizes[i] = max(len(grams), 1)
+            if known:
+                starts.append(len(rows))
+                filled.append(i)
+                rows.extend(known)
+
+        scores = np.zeros((len(categories), self.group_count))
+        if rows:
+            # 疎なカテゴリ行列との積: カテゴリごとに該当する語彙の行を足し合わせる
+            scores[filled] = np.add.reduceat(self.matrix[rows], starts, axis=0, dtype=np.float64)
+        return scores / sizes[:, None]
+
+    def score_batch(self, tenders: Sequence[Sequence]) -> List[np.ndarray]:
+        """入札（カテゴリ一覧）ごとのスコア行列。グループ側は共有する"""
+        return [self.score(categories) for categories in tenders]
+
+    # ------------------------------------------------------------------
+    def save(self, path: Path):
+        np.savez_compressed(
+            path, vocab=np.array(list(self.vocab), dtype=str),
+            bits=np.packbits(self.matrix, axis=None), shape=np.array(self.matrix.shape)
+        )
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str = "") -> 'GroupMatrix':
+        with np.load(path) as data:
+            shape = tuple(int(n) for n in data["shape"])
+            count = shape[0] * shape[1]
+            matrix = np.unpackbits(data["bits"], count=count).reshape(shape)
+            return cls(data["vocab"].tolist(), matrix, fingerprint)
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+def load_group_matrix(groups: Sequence,
+                      cache_dir: Optional[Path] = GROUP_MATRIX_CACHE_DIR) -> GroupMatrix:
+    """
+    グループの行列を返す（メモリ・ディスクのキャッシュがあれば作り直さない）
+
+    Args:
+        cache_dir: ディスクキャッシュの保存先（None の場合はメモリだけ）
+    """
+    fingerprint = groups_fingerprint(groups)
+    with _lock:
+        matrix = _memory.get(fingerprint)
+        if matrix is not None:
+            _memory.move_to_end(fingerprint)
+            return matrix
+
+    cache_file = Path(cache_dir) / f"v{_CACHE_VERSION}_{fingerprint[:32]}.npz" if cache_dir else None
+    matrix = None
+    if cache_file is not None and cache_file.exists():
+        try:
+            matrix = GroupMatrix.load(cache_file, fingerprint)
+            if matrix.group_count != len(groups):
+                matrix = None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            logger.warning(f"グループ行列のキャッシュを読めません: {e}")
+            matrix = None
+
+    if matrix is None:
+        matrix = GroupMatrix.build(groups, fingerprint)
+        logger.info(f"グループ行列を作成: {len(groups)} グループ, 語彙 {len(matrix.vocab)}")
+        if cache_file is not None:
+            tmp_path = None
+            try:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                # 書きかけのファイルをキャッシュとして読まないよう、書き終えてから置き換える
+                # （一時ファイルは書き込みごとに別名にし、同時に書くプロセスと衝突させない）
+                fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=cache_file.parent)
+                with os.fdopen(fd, 'wb') as tmp:
+                    matrix.save(tmp)
+                os.replace(tmp_path, cache_file)
+            except OSError as e:
+                logger.warning(f"グループ行列をキャッシュできません: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+    with _lock:
+        _memory[fingerprint] = matrix
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+    return matrix
@@ -8,6 +8,8 @@ Gemini AIを使用してPDFの審査基準とPPTXスライドを
 
 Usage:
     python main.py <source_pdf> <master_pptx> [output_pptx]
+    python main.py batch <master_pptx> <criteria> [<criteria> ...]   # 多数の入札を一括処理
+    python main.py search <master_pptx> <query> [<query> ...]        # テンプレート内の全文検索
 
 Example:
     python main.py 審査基準表.pdf 【標準提案資料】2025-10-3.pptx output.pptx
@@ -18,11 +20,13 @@ Environment:
 
 import sys
 import os
+import json
+import time
 import logging
 import argparse
-import re
-import json
+import tempfile
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Tuple
 
 import pdfplumber
@@ -30,7 +34,25 @@ from pptx import Presentation
 from pptx.util import Inches, Pt
 from dotenv import load_dotenv
 
-import google.generativeai as genai
+from criteria_parser import parse_category_tables, parse_category_rows, merge_categories
+from pptx_utils import get_slide_title, get_slide_first_text, get_slide_full_content, build_slide_groups
+from template_digest import load_template_digest, template_digest_key
+from slide_grouping import DEFAULT_GROUPING, GROUPING_STRATEGIES, group_slides
+from slide_index import keyword_candidates, load_slide_index
+from records import Category, SlideGroup
+from prompt_builder import DEFAULT_TOKEN_BUDGET, build_matching_lists, log_usage
+from ai_json import request_categories, request_mapping
+from toc_layout import populate_toc
+from xml_patch import TextPatches
+from slide_order import UNMATCHED_KEEP, UNMATCHED_MODES, reorder_slides
+from split_output import write_split_zip
+from model_backend import create_model, upload_file
+from match_cascade import (LOCAL_MATCHER, DEFAULT_CONFIDENCE_THRESHOLD, assign_scores, boost_candidates,
+                           cascade_matching, cascade_models_from_env, confidence_threshold_from_env,
+                           uses_cascade)
+from group_matrix import load_group_matrix
+from run_record import RunRecorder, RecordingModel, ReplayModel, load_record, file_sha256
+from ocr_extract import OCR_DPI, is_ocr_available, ocr_extract_tables
 
 # Load environment variables
 load_dotenv()
@@ -48,18 +70,18 @@ logger = logging.getLogger(__name__)
 # ============================================================================
 # Gemini API Setup
 # ============================================================================
-def setup_gemini():
-    """Gemini APIを初期化する"""
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        logger.error("GOOGLE_API_KEY が設定されていません。.env ファイルを確認してください。")
+def setup_gemini(model_name: Optional[str] = None):
+    """
+    モデルを初期化する（既定は Gemini 2.5 Flash）
+    MODEL_BACKEND=http の場合は MODEL_BASE_URL の Gemini 互換サーバーを使う（APIキー不要）
+    """
+    try:
+        model = create_model(model_name=model_name)
+    except ValueError as e:
+        logger.error(f"{e}。.env ファイルを確認してください。")
         sys.exit(1)
     
-    genai.configure(api_key=api_key)
-    
-    # Gemini 2.5 Flash を使用
-    model = genai.GenerativeModel("models/gemini-2.5-flash")
-    logger.info("Gemini API 初期化完了 (gemini-2.5-flash)")
+    logger.info("モデル初期化完了")
     return model
 
 
@@ -78,101 +100,68 @@ def detect_file_type(file_path: str) -> str:
     return type_map.get(ext, 'unknown')
 
 
-def extract_categories_from_pdf(pdf_path: str) -> List[Dict]:
+def log_categories(categories: List[Category]):
+    """抽出したカテゴリをログに出力"""
+    logger.info(f"抽出完了: {len(categories)} 件のカテゴリ")
+    for cat in categories:
+        logger.info(f"  No.{cat.no:2d}: {cat.main_category}")
+        for sub in cat.sub_items:
+            logger.info(f"       - {sub[:50]}...")
+
+
+def extract_categories_from_pdf(pdf_path: str, use_ocr: bool = True, ocr_dpi: int = OCR_DPI) -> List[Category]:
     """
     審査基準表PDFから大項目・小項目を含む階層構造でカテゴリを抽出
+    テキストレイヤーの無いスキャンPDFは、ローカルOCRで抽出する
     
     Returns:
-        List[Dict]: 各要素は以下の構造
-        {
-            'No': int,
-            'MainCategory': str,  # 大項目名
-            'SubItems': List[str]  # 小項目のリスト
-        }
+        List[Category]: parse_category_tables() と同じ構造
     """
     logger.info(f"PDFを読み込み中: {pdf_path}")
-    categories = []
-    current_category = None
+    page_tables = []
+    has_text_layer = False
     
     try:
         with pdfplumber.open(pdf_path) as pdf:
             for page_num, page in enumerate(pdf.pages, 1):
                 logger.info(f"  ページ {page_num} を処理中...")
-                tables = page.extract_tables()
-                
-                for table in tables:
-                    if not table or len(table) < 2:
-                        continue
-                    
-                    for row in table:
-                        if not row or len(row) < 2:
-                            continue
-                        
-                        col0 = str(row[0]).strip() if row[0] else ""
-                        col1 = str(row[1]).strip() if row[1] else ""
-                        
-                        # 大項目の検出（数字で始まる行）
-                        if col0 and re.match(r'^\d+', col0):
-                            no_match = re.match(r'^(\d+)', col0)
-                            if no_match and col1:
-                                # 前のカテゴリを保存
-                                if current_category:
-                                    categories.append(current_category)
-                                
-                                no = int(no_match.group(1))
-                                # col1から大項目名を抽出（最初の行）
-                                lines = col1.split('\n')
-                                main_category = lines[0].strip()
-                                
-                                # 新しいカテゴリを開始
-                                current_category = {
-                                    'No': no,
-                                    'MainCategory': main_category,
-                                    'SubItems': []
-                                }
-                        
-                        # 小項目の検出（col2に数字、col3に内容がある行）
-                        if len(row) >= 4 and current_category:
-                            col2 = str(row[2]).strip() if row[2] else ""
-                            col3 = str(row[3]).strip() if row[3] else ""
-                            
-                            # col2 が小項目番号（1, 2, 3等）で col3 に内容がある場合
-                            if col2 and re.match(r'^\d+$', col2) and col3:
-                                # 既存の小項目と重複しないかチェック
-                                sub_item = col3.split('\n')[0].strip()[:100]
-                                if sub_item and sub_item not in current_category['SubItems']:
-                                    current_category['SubItems'].append(sub_item)
-                    
-                # 最後のカテゴリを保存
-                if current_category and current_category not in categories:
-                    categories.append(current_category)
-                    current_category = None
-                            
+                has_text_layer = has_text_layer or bool(page.chars)
+                page_tables.append(page.extract_tables())
     except Exception as e:
         logger.error(f"PDF読み込みエラー: {e}")
         raise
     
-    # 重複を除去してソート
-    seen_nos = set()
-    unique_categories = []
-    for cat in categories:
-        if cat['No'] not in seen_nos:
-            seen_nos.add(cat['No'])
-            unique_categories.append(cat)
-    
-    unique_categories.sort(key=lambda x: x['No'])
+    unique_categories = parse_category_tables(page_tables)
     
-    logger.info(f"抽出完了: {len(unique_categories)} 件のカテゴリ")
-    for cat in unique_categories:
-        logger.info(f"  No.{cat['No']:2d}: {cat['MainCategory']}")
-        for sub in cat.get('SubItems', []):
-            logger.info(f"       - {sub[:50]}...")
+    if not unique_categories and not has_text_layer and use_ocr:
+        logger.info("テキストレイヤーが無いため、ローカルOCRで抽出します")
+        return extract_categories_with_ocr(pdf_path, ocr_dpi=ocr_dpi)
     
+    log_categories(unique_categories)
     return unique_categories
 
 
+def extract_categories_with_ocr(file_path: str, ocr_dpi: int = OCR_DPI) -> List[Category]:
+    """ローカルOCR（Tesseract）でスキャンPDF／画像からカテゴリを抽出"""
+    if not is_ocr_available():
+        logger.warning("OCRエンジン（pytesseract / tesseract）が利用できません")
+        return []
+    
+    file_type = detect_file_type(file_path)
+    file_bytes = Path(file_path).read_bytes()
+    try:
+        page_tables = ocr_extract_tables(file_bytes, file_type, dpi=ocr_dpi)
+    except Exception as e:
+        logger.error(f"OCRエラー: {e}")
+        return []
+    
+    categories = parse_category_tables(page_tables)
+    log_categories(categories)
+    return categories
+
+
 
-def extract_categories_from_excel(excel_path: str) -> List[Dict[str, str]]:
+def extract_categories_from_excel(excel_path: str) -> List[Category]:
     """Excelファイルからカテゴリを抽出"""
     logger.info(f"Excelを読み込み中: {excel_path}")
     categories = []
@@ -181,30 +170,16 @@ def extract_categories_from_excel(excel_path: str) -> List[Dict[str, str]]:
         import openpyxl
         wb = openpyxl.load_workbook(excel_path)
         ws = wb.active
-        
-        for row in ws.iter_rows(values_only=True):
-            if not row or len(row) < 2:
-                continue
-            
-            col0 = str(row[0]).strip() if row[0] else ""
-            col1 = str(row[1]).strip() if row[1] else ""
-            
-            if col0 and re.match(r'^\d+', col0):
-                no_match = re.match(r'^(\d+)', col0)
-                if no_match and col1:
-                    no = int(no_match.group(1))
-                    if not any(c['No'] == no for c in categories):
-                        categories.append({'No': no, 'Category': col1.split('\n')[0].strip()})
+        categories = parse_category_rows(ws.iter_rows(values_only=True))
     except Exception as e:
         logger.error(f"Excel読み込みエラー: {e}")
         raise
     
-    categories.sort(key=lambda x: x['No'])
     logger.info(f"抽出完了: {len(categories)} 件のカテゴリ")
     return categories
 
 
-def extract_categories_with_ai(model, file_path: str) -> List[Dict[str, str]]:
+def extract_categories_with_ai(model, file_path: str) -> List[Category]:
     """Gemini AIを使用してファイルからカテゴリを抽出（Word/Image対応）"""
     logger.info(f"AIでファイルを分析中: {file_path}")
     
@@ -212,7 +187,7 @@ def extract_categories_with_ai(model, file_path: str) -> List[Dict[str, str]]:
     
     if file_type == 'image':
         # 画像ファイルをアップロード
-        uploaded_file = genai.upload_file(file_path)
+        uploaded_file = upload_file(model, file_path)
         prompt_parts = [uploaded_file]
     else:
         # Word等はテキスト抽出
@@ -227,29 +202,18 @@ def extract_categories_with_ai(model, file_path: str) -> List[Dict[str, str]]:
     
     prompt = """以下のファイルから審査基準のカテゴリ一覧を抽出してください。
 
-出力形式（JSON）:
-```json
+出力形式（JSON配列）:
 [
-  {"No": 1, "Category": "カテゴリ名"},
-  {"No": 2, "Category": "カテゴリ名"}
+  {"No": 1, "Category": "カテゴリ名", "SubItems": ["小項目", ...]},
+  {"No": 2, "Category": "カテゴリ名", "SubItems": []}
 ]
-```
 
 番号順に並べてください。カテゴリ名は簡潔に（最初の1行程度）。
-必ずJSON形式のみを出力してください。
+小項目が無い場合は SubItems を空配列にしてください。
 """
     
     try:
-        response = model.generate_content([prompt] + prompt_parts)
-        response_text = response.text.strip()
-        
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        categories = json.loads(response_text)
-        categories.sort(key=lambda x: x['No'])
+        categories = request_categories(model, [prompt] + prompt_parts)
         logger.info(f"AI抽出完了: {len(categories)} 件のカテゴリ")
         return categories
     except Exception as e:
@@ -257,15 +221,23 @@ def extract_categories_with_ai(model, file_path: str) -> List[Dict[str, str]]:
         return []
 
 
-def extract_categories(model, file_path: str) -> List[Dict[str, str]]:
+def extract_categories(model, file_path: str, use_ocr: bool = True,
+                       ocr_dpi: int = OCR_DPI) -> List[Category]:
     """ファイルタイプに応じてカテゴリを抽出（メイン関数）"""
     file_type = detect_file_type(file_path)
     logger.info(f"ファイルタイプ: {file_type}")
     
     if file_type == 'pdf':
-        return extract_categories_from_pdf(file_path)
+        return extract_categories_from_pdf(file_path, use_ocr=use_ocr, ocr_dpi=ocr_dpi)
     elif file_type == 'excel':
         return extract_categories_from_excel(file_path)
+    elif file_type == 'image' and use_ocr and is_ocr_available():
+        # オフラインOCRを優先し、抽出できなければAIにフォールバック
+        categories = extract_categories_with_ocr(file_path, ocr_dpi=ocr_dpi)
+        if categories:
+            return categories
+        logger.info("OCRで抽出できなかったため、AIで処理します")
+        return extract_categories_with_ai(model, file_path)
     elif file_type in ('word', 'image'):
         return extract_categories_with_ai(model, file_path)
     else:
@@ -273,79 +245,52 @@ def extract_categories(model, file_path: str) -> List[Dict[str, str]]:
         return extract_categories_with_ai(model, file_path)
 
 
-# ============================================================================
-# PPTX Utilities
-# ============================================================================
-def get_slide_title(slide) -> str:
-    """スライドからタイトルを取得"""
-    if slide.shapes.title:
-        return slide.shapes.title.text.strip()
-    return ""
-
-
-def get_slide_first_text(slide) -> str:
-    """スライドから最初のテキストを取得"""
-    for shape in slide.shapes:
-        if shape.has_text_frame:
-            text = shape.text_frame.text.strip()
-            if text:
-                return text
-    return ""
-
-
-def get_slide_full_content(slide) -> str:
+def extract_categories_from_files(model, file_paths: List[str], use_ocr: bool = True,
+                                  ocr_dpi: int = OCR_DPI) -> List[Category]:
     """
-    スライドの全テキスト内容を取得（AIマッチング精度向上用）
+    複数の審査基準ファイルから並列にカテゴリを抽出し、No と名称で統合する
+    （ファイルごとに形式に応じた抽出方法を使う。統合は指定した順で先のファイルを優先）
     """
-    texts = []
-    for shape in slide.shapes:
-        if shape.has_text_frame:
-            text = shape.text_frame.text.strip()
-            if text and len(text) > 2:  # 2文字以上のテキストのみ
-                texts.append(text)
-    return "\n".join(texts)[:500]  # 最大500文字
+    if len(file_paths) == 1:
+        return extract_categories(model, file_paths[0], use_ocr=use_ocr, ocr_dpi=ocr_dpi)
+    
+    def extract_one(file_path):
+        try:
+            return extract_categories(model, file_path, use_ocr=use_ocr, ocr_dpi=ocr_dpi)
+        except Exception as e:
+            logger.error(f"カテゴリ抽出エラー（{file_path}）: {e}")
+            return []
+    
+    with ThreadPoolExecutor(max_workers=min(4, len(file_paths))) as pool:
+        results = list(pool.map(extract_one, file_paths))
+    
+    for file_path, categories in zip(file_paths, results):
+        logger.info(f"  {Path(file_path).name}: {len(categories)} 件")
+    categories = merge_categories(results)
+    log_categories(categories)
+    return categories
 
 
-def get_slide_groups(prs) -> List[Dict]:
+# ============================================================================
+# PPTX Utilities
+# ============================================================================
+def get_slide_groups(prs) -> List[SlideGroup]:
     """スライドをグループ化（タイトル付きスライドを先頭に）"""
-    groups = []
-    current_group = None
-    
-    for idx, slide in enumerate(prs.slides):
-        title = get_slide_title(slide)
-        
-        if title:
-            if current_group:
-                groups.append(current_group)
-            current_group = {
-                'title': title,
-                'slides': [idx],
-                'first_index': idx
-            }
-        else:
-            if current_group:
-                current_group['slides'].append(idx)
-            else:
-                first_text = get_slide_first_text(slide)
-                current_group = {
-                    'title': first_text[:50] if first_text else f"[Untitled {idx}]",
-                    'slides': [idx],
-                    'first_index': idx
-                }
-    
-    if current_group:
-        groups.append(current_group)
-    
-    return groups
+    return build_slide_groups(prs, start=0, with_content=False)
 
 
 # ============================================================================
 # AI Matching with Gemini
 # ============================================================================
-def create_matching_with_ai(model, pdf_categories: List[Dict], pptx_groups: List[Dict]) -> Dict[int, int]:
+def create_matching_with_ai(model, pdf_categories: List[Category], pptx_groups: List[SlideGroup],
+                            token_budget: int = DEFAULT_TOKEN_BUDGET,
+                            confidences: Optional[Dict[int, float]] = None,
+                            candidates: Optional[Dict[int, List[int]]] = None) -> Dict[int, int]:
     """
     Gemini AIを使用してPDFカテゴリとPPTXグループをマッチング。
     大項目・小項目とスライドの全テキスト内容を考慮してマッチング精度を向上。
+    confidences を渡すと確信度付きで依頼し、{No: 確信度} を入れる（カスケード用）
+    candidates（{No: [グループ番号, ...]}）はテキスト索引のキーワード候補としてプロンプトに添える
     
     Returns:
         Dict[int, int]: {pdf_no: pptx_group_index} のマッピング
@@ -355,28 +300,18 @@ def create_matching_with_ai(model, pdf_categories: List[Dict], pptx_groups: List
     logger.info("Gemini AI マッチング開始（精度向上版）")
     logger.info("=" * 60)
     
-    # プロンプト用のデータを準備（階層構造を含める）
-    pdf_entries = []
-    for cat in pdf_categories:
-        main_cat = cat.get('MainCategory', cat.get('Category', ''))
-        sub_items = cat.get('SubItems', [])
-        entry = f"PDF{cat['No']}: 【大項目】 {main_cat}"
-        if sub_items:
-            entry += f"\n  小項目: {', '.join(sub_items[:3])}"
-        pdf_entries.append(entry)
-    pdf_list = "\n".join(pdf_entries)
-    
-    # PPTXグループ情報（タイトル + 内容の要約）
-    pptx_entries = []
-    for i, g in enumerate(pptx_groups):
-        content_summary = g.get('content', '')[:200] if g.get('content') else ''
-        entry = f"PPTX{i}: {g['title']}"
-        if content_summary:
-            entry += f"\n  内容: {content_summary}..."
-        pptx_entries.append(entry)
-    pptx_list = "\n".join(pptx_entries)
-    
-    prompt = f"""あなたはドキュメント整理の専門家です。以下のタスクを実行してください。
+    confidence_rule = (
+        '\n各要素には、その判断の確信度（0〜1の数値）を "Confidence" として付ける。'
+        if confidences is not None else ''
+    )
+    hint_rule = (
+        '\n5. 「キーワード候補」はカテゴリの語がスライドに含まれるグループ（参考。最終的には内容で判断する）'
+        if candidates else ''
+    )
+    
+    # プロンプトを構築（定型文を除き、トークン予算内で小項目・内容を詰める）
+    def render(pdf_list: str, pptx_list: str) -> str:
+        return f"""あなたはドキュメント整理の専門家です。以下のタスクを実行してください。
 
 ## タスク
 PDFの審査基準（大項目と小項目）と、PPTXのスライドグループを意味的にマッチングしてください。
@@ -392,48 +327,28 @@ PDFの審査基準（大項目と小項目）と、PPTXのスライドグルー
 1. 大項目のテーマに最も近いスライドグループを選ぶ
 2. 小項目の詳細内容も考慮して判断する
 3. 表現が違っても同じトピックならマッチさせる
-4. 1つのPPTXグループは1つのPDFカテゴリにのみマッチさせる
+4. 1つのPPTXグループは1つのPDFカテゴリにのみマッチさせる{hint_rule}
 
 ## 出力形式
-JSON形式で出力。PDFのNo（数字）をキー、PPTXのインデックス（数字）を値とする。
-マッチなしは-1。
-
-例: {{"1": 3, "2": 5, "3": -1, "4": 7}}
-
-必ずJSON形式のみを出力してください（説明は不要）。
-
-出力:"""
+JSON配列で出力。各要素は PDFのNo（数字）を "No"、PPTXのインデックス（数字）を "Group" とする。
+全てのPDFカテゴリについて1件ずつ出力し、マッチなしは -1。{confidence_rule}
 
+例: [{{"No": 1, "Group": 3}}, {{"No": 2, "Group": 5}}, {{"No": 3, "Group": -1}}]"""
+    
+    prompt, prompt_stats = build_matching_lists(
+        pdf_categories, pptx_groups, render, token_budget=token_budget,
+        cat_label='PDF', grp_label='PPTX', hints=candidates
+    )
+    
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # JSONを抽出（マークダウンコードブロックに囲まれている場合の対応）
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        logger.info(f"AI応答: {response_text}")
-        
-        # JSONをパース
-        mapping_raw = json.loads(response_text)
-        
-        # キーを整数に変換
-        mapping = {}
-        for pdf_no, pptx_idx in mapping_raw.items():
-            pdf_no_int = int(pdf_no)
-            if pptx_idx >= 0:
-                mapping[pdf_no_int] = pptx_idx
-        
+        mapping = request_mapping(
+            model, prompt, [cat.no for cat in pdf_categories], len(pptx_groups),
+            on_response=lambda response: log_usage(response, prompt_stats),
+            confidences=confidences
+        )
         logger.info(f"マッチング結果: {len(mapping)} 件")
-        
         return mapping
         
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON解析エラー: {e}")
-        logger.error(f"応答テキスト: {response_text}")
-        return {}
     except Exception as e:
         logger.error(f"AI マッチングエラー: {e}")
         return {}
@@ -442,99 +357,32 @@ JSON形式で出力。PDFのNo（数字）をキー、PPTXのインデックス
 # ============================================================================
 # Main Processing
 # ============================================================================
-def populate_toc(prs, categories: List[Dict], toc_slide_index: int = 1):
-    """
-    目次スライドに審査基準カテゴリを階層構造で入力
-    大項目は太字、小項目はインデントして表示
+def process_pptx(model, pdf_categories: List[Category], pptx_path: str, output_path: str,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET, unmatched: str = UNMATCHED_KEEP,
+                 split: bool = False, grouping: str = DEFAULT_GROUPING,
+                 recorder: Optional[RunRecorder] = None,
+                 cascade: Optional[List[Tuple[str, object]]] = None,
+                 confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD,
+                 mapping: Optional[Dict[int, int]] = None) -> Optional[str]:
     """
-    from pptx.util import Pt
-    from pptx.dml.color import RGBColor
+    PDFカテゴリに基づいてPPTXを処理（表紙・目次を固定）
+    unmatched: 未使用スライドの扱い（keep: 末尾に残す / drop: 削除 / hide: 非表示セクション）
+    split: True の場合、カテゴリごとに表紙・目次付きのPPTXを作り、
+           output_path の拡張子を .zip にしたZIPへまとめる
+    grouping: スライドのグループ化方法（slide_grouping.GROUPING_STRATEGIES）
+    recorder: 実行記録（グループ・マッピング・段階ごとの処理時間・出力ハッシュを記録）
+    cascade: [(モデル名, モデル), ...]。2段階以上の場合、確信度が confidence_threshold 未満の
+             カテゴリだけを次のモデルに聞き直す（match_cascade）。1段階の場合はそのモデルだけで
+             マッチングし、"local" だけの場合はAIを使わない
+    mapping: 計算済みの {カテゴリNo: グループ番号}（batch の assign_scores の結果など）。
+             指定した場合はマッチングを行わずにこの割り当てで出力する
     
-    logger.info(f"目次スライド（インデックス {toc_slide_index}）にカテゴリを入力中...")
-    
-    try:
-        toc_slide = prs.slides[toc_slide_index]
-        
-        # テンプレートの目次用テキストボックスを探す（最も大きいテキストフレーム）
-        target_shape = None
-        max_area = 0
-        
-        for shape in toc_slide.shapes:
-            if shape.has_text_frame:
-                area = shape.width * shape.height
-                existing_text = shape.text_frame.text.strip()
-                # タイトルやページ番号を除外（小さいテキストや数字のみ）
-                if len(existing_text) > 10 and area > max_area:
-                    max_area = area
-                    target_shape = shape
-        
-        if not target_shape:
-            logger.warning("  目次用のテキストフレームが見つかりませんでした")
-            return False
-        
-        # テキストフレームをクリア
-        tf = target_shape.text_frame
-        tf.clear()
-        
-        # 階層構造の目次を作成
-        for idx, cat in enumerate(categories):
-            # 大項目
-            if idx == 0:
-                p = tf.paragraphs[0]
-            else:
-                p = tf.add_paragraph()
-            
-            # 大項目の番号とタイトル
-            main_text = cat.get('MainCategory', cat.get('Category', ''))
-            p.text = f"{cat['No']}. {main_text}"
-            
-            # 大項目のフォーマット（太字）
-            for run in p.runs:
-                run.font.bold = True
-                run.font.size = Pt(11)
-            if not p.runs:
-                # テキストが直接設定された場合
-                p.font.bold = True
-                p.font.size = Pt(11)
-            
-            # 小項目を追加
-            sub_items = cat.get('SubItems', [])
-            for sub_item in sub_items[:3]:  # 最大3件の小項目を表示
-                sub_p = tf.add_paragraph()
-                sub_p.text = f"  ・ {sub_item[:40]}"  # インデント + 中点
-                sub_p.level = 1
-                
-                # 小項目のフォーマット（通常）
-                for run in sub_p.runs:
-                    run.font.bold = False
-                    run.font.size = Pt(9)
-                if not sub_p.runs:
-                    sub_p.font.bold = False
-                    sub_p.font.size = Pt(9)
-        
-        logger.info(f"  目次を更新しました: {len(categories)} 項目（階層構造）")
-        return True
-        
-    except Exception as e:
-        logger.error(f"  目次入力エラー: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-
-
-def update_slide_title(slide, new_title: str):
-    """スライドのタイトルを更新"""
-    try:
-        if slide.shapes.title:
-            slide.shapes.title.text = new_title
-            return True
-    except:
-        pass
-    return False
-
-
-def process_pptx(model, pdf_categories: List[Dict], pptx_path: str, output_path: str):
-    """PDFカテゴリに基づいてPPTXを処理（表紙・目次を固定）"""
+    Returns:
+        出力ファイルのパス（失敗時は None）
+    """
+    if recorder is None:
+        recorder = RunRecorder()
+    recorder.start('load')
     logger.info(f"PPTXを読み込み中: {pptx_path}")
     prs = Presentation(pptx_path)
     
@@ -546,61 +394,66 @@ def process_pptx(model, pdf_categories: List[Dict], pptx_path: str, output_path:
     
     if total_slides <= FIXED_SLIDES:
         logger.error("スライドが少なすぎます。")
-        return
+        return None
+    
+    # 定型文を除いたスライド要約とグループ化の結果は、テンプレートごとにキャッシュ
+    pptx_bytes = Path(pptx_path).read_bytes()
+    template_key = template_digest_key(pptx_bytes)
+    recorder.set_template(pptx_path)
+    recorder.start('digest')
+    digests = load_template_digest(pptx_bytes, prs, key=template_key)
+    # キーワード候補用のテキスト索引（目次を入れる前の prs で作る。割り当て済みなら使わない）
+    index = load_slide_index(pptx_bytes, prs, key=template_key) if mapping is None else None
     
     # 目次に審査基準カテゴリを入力
+    recorder.start('toc')
     logger.info("")
     logger.info("=" * 60)
     logger.info("目次スライドの更新")
     logger.info("=" * 60)
-    populate_toc(prs, pdf_categories, toc_slide_index=1)
-    
-    # スライド2以降をグループ化
-    groups = []
-    current_group = None
+    # 目次とタイトルの書き換えは書式を保ったXMLパッチとして集め、並べ替えの前に1回で適用する
+    patches = TextPatches()
+    toc_pages = populate_toc(prs, pdf_categories, toc_slide_index=1, patches=patches)
     
-    for idx in range(FIXED_SLIDES, total_slides):
-        slide = prs.slides[idx]
-        title = get_slide_title(slide)
-        content = get_slide_full_content(slide)  # スライドの全内容を取得
-        
-        if title:
-            if current_group:
-                groups.append(current_group)
-            current_group = {
-                'title': title,
-                'slides': [idx],
-                'first_index': idx,
-                'content': content  # AIマッチング用にコンテンツを追加
-            }
-        else:
-            if current_group:
-                current_group['slides'].append(idx)
-                # コンテンツを累積
-                current_group['content'] = (current_group.get('content', '') + '\n' + content)[:500]
-            else:
-                first_text = get_slide_first_text(slide)
-                current_group = {
-                    'title': first_text[:50] if first_text else f"[Untitled {idx}]",
-                    'slides': [idx],
-                    'first_index': idx,
-                    'content': content
-                }
+    # 目次が複数枚に分割された場合は、その分だけ固定スライドが増える
+    fixed_slides = 1 + max(toc_pages, 1)
     
-    if current_group:
-        groups.append(current_group)
+    # 目次以降をグループ化（内容はAIマッチング用）
+    recorder.start('grouping')
+    groups = group_slides(prs, start=fixed_slides, strategy=grouping,
+                          digests=digests, cache_key=template_key)
+    recorder.set_groups(groups)
     
     logger.info(f"コンテンツスライドグループ数: {len(groups)}")
     
     for i, g in enumerate(groups):
-        logger.info(f"  Group {i}: '{g['title'][:50]}...' - Slides {[idx+1 for idx in g['slides']]}")
+        logger.info(f"  Group {i}: '{g.title[:50]}...' - Slides {[idx+1 for idx in g.slides]}")
     
-    # AIでマッチング
-    mapping = create_matching_with_ai(model, pdf_categories, groups)
+    # AIでマッチング（割り当てが渡された場合はそれを使う）
+    recorder.start('matching')
+    if mapping is not None:
+        logger.info("計算済みの割り当てを使用します（マッチングは行いません）")
+    else:
+        # テキスト索引のキーワード候補をマッチングの手がかりにする（目次の複製でずれた分を戻す）
+        candidates = keyword_candidates(index, pdf_categories, groups, offset=fixed_slides - FIXED_SLIDES)
+        if cascade and uses_cascade(cascade):
+            mapping, cascade_stats = cascade_matching(
+                cascade, pdf_categories, groups,
+                lambda stage_model, cats, grps, confidences, hints: create_matching_with_ai(
+                    stage_model, cats, grps, token_budget=token_budget, confidences=confidences,
+                    candidates=hints),
+                threshold=confidence_threshold, candidates=candidates
+            )
+            recorder.set_cascade(cascade_stats)
+        else:
+            mapping = create_matching_with_ai(model, pdf_categories, groups, token_budget=token_budget,
+                                              candidates=candidates)
+    recorder.set_mapping(mapping)
     
     if not mapping:
+        recorder.finish()
         logger.error("マッチングに失敗しました。")
-        return
+        return None
     
     # マッチング結果を表示
     logger.info("")
@@ -612,14 +465,14 @@ def process_pptx(model, pdf_categories: List[Dict], pptx_path: str, output_path:
     matched_list = []
     
     for cat in pdf_categories:
-        pdf_no = cat['No']
-        main_cat = cat.get('MainCategory', cat.get('Category', ''))
+        pdf_no = cat.no
+        main_cat = cat.main_category
         if pdf_no in mapping:
             pptx_idx = mapping[pdf_no]
             if pptx_idx < len(groups):
                 group = groups[pptx_idx]
                 logger.info(f"  ✓ PDF[{pdf_no}] '{main_cat[:30]}...'")
-                logger.info(f"    → PPTX '{group['title'][:40]}...' ({len(group['slides'])} slides)")
+                logger.info(f"    → PPTX '{group.title[:40]}...' ({len(group.slides)} slides)")
                 matched_list.append((pdf_no, main_cat, group))
                 used_groups.add(pptx_idx)
         else:
@@ -632,46 +485,54 @@ def process_pptx(model, pdf_categories: List[Dict], pptx_path: str, output_path:
     logger.info("=" * 60)
     logger.info("スライド再構成開始")
     logger.info("=" * 60)
+    recorder.start('reorder')
     
     # 新しい順序を構築（表紙・目次は固定）
-    new_order = list(range(FIXED_SLIDES))  # [0, 1] = 表紙と目次
+    new_order = list(range(fixed_slides))  # 表紙と目次
     
     # マッチしたグループをPDF順に配置
     matched_list.sort(key=lambda x: x[0])
     for pdf_no, category_name, group in matched_list:
         # 大項目スライドのタイトルを更新
-        first_slide_idx = group['slides'][0]
+        first_slide_idx = group.first_index
         new_title = f"{pdf_no}. {category_name}"
-        if update_slide_title(prs.slides[first_slide_idx], new_title):
+        if patches.retitle(prs.slides[first_slide_idx], new_title):
             logger.info(f"  タイトル更新: '{new_title}'")
         
-        for slide_idx in group['slides']:
-            new_order.append(slide_idx)
-        logger.info(f"  配置 No.{pdf_no}: '{category_name[:40]}...' ({len(group['slides'])} slides)")
-    
-    # 未使用グループを末尾に配置
+        new_order.extend(group.slides)
+        logger.info(f"  配置 No.{pdf_no}: '{category_name[:40]}...' ({len(group.slides)} slides)")
+    
+    patches.apply()
+    
+    if split:
+        zip_path = Path(output_path).with_suffix('.zip')
+        recorder.start('save')
+        write_split_output(prs, fixed_slides, matched_list, zip_path)
+        recorder.finish()
+        recorder.set_output(zip_path)
+        logger.info(f"  マッチしたグループ: {len(matched_list)} / 未使用グループ: {len(unused_groups)}")
+        return str(zip_path)
+    
+    # 未使用グループを末尾に配置（unmatched に応じて削除・非表示）
+    unmatched_start = len(new_order)
     if unused_groups:
         logger.info(f"  --- 以下、未使用スライド ---")
         for g in unused_groups:
-            for slide_idx in g['slides']:
-                new_order.append(slide_idx)
-            logger.info(f"  末尾: '{g['title'][:40]}...' ({len(g['slides'])} slides)")
-    
-    # XMLレベルでスライドを並べ替え
-    xml_slides = prs.slides._sldIdLst
-    original_slides = list(xml_slides)
-    
-    while len(xml_slides) > 0:
-        xml_slides.remove(xml_slides[0])
+            new_order.extend(g.slides)
+            logger.info(f"  末尾: '{g.title[:40]}...' ({len(g.slides)} slides)")
     
-    for idx in new_order:
-        xml_slides.append(original_slides[idx])
+    # XMLレベルでスライドを並べ替え（sldIdLst を1回で置換）
+    reorder_slides(prs, new_order, unmatched_start, unmatched=unmatched)
     
     # 保存
+    recorder.start('save')
     logger.info("")
     logger.info(f"保存中: {output_path}")
     prs.save(output_path)
-    logger.info("完了!")
+    recorder.finish()
+    recorder.set_output(output_path)
+    logger.info(f"完了! ({os.path.getsize(pptx_path) / 1024 / 1024:.1f} MB -> "
+                f"{os.path.getsize(output_path) / 1024 / 1024:.1f} MB)")
     
     # サマリー
     logger.info("")
@@ -681,29 +542,286 @@ def process_pptx(model, pdf_categories: List[Dict], pptx_path: str, output_path:
     logger.info(f"  マッチしたグループ: {len(matched_list)}")
     logger.info(f"  未使用グループ: {len(unused_groups)}")
     logger.info(f"  出力ファイル: {output_path}")
+    return str(output_path)
+
+
+def write_split_output(prs, fixed_slides: int, matched_list: list, zip_path: Path):
+    """目次・タイトル更新済みの prs をカテゴリごとのPPTXに分けてZIPへ保存"""
+    logger.info("")
+    logger.info(f"分割出力中: {zip_path}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "source.pptx")
+        prs.save(source_path)
+        names = write_split_zip(source_path, fixed_slides, matched_list, str(zip_path))
+    logger.info(f"完了! {len(names)} ファイル ({os.path.getsize(zip_path) / 1024 / 1024:.1f} MB)")
 
 
 # ============================================================================
 # Main Entry Point
 # ============================================================================
+def replay(argv: List[str]) -> int:
+    """
+    記録した実行を Gemini を呼ばずに再実行し、マッピング・出力・処理時間を記録と比較する
+    
+    Returns:
+        int: 終了コード（記録と一致すれば 0、差分があれば 1）
+    """
+    parser = argparse.ArgumentParser(
+        prog='main.py replay',
+        description='実行記録（*.run.json）を Gemini を呼ばずに再実行し、結果を記録と比較'
+    )
+    parser.add_argument('record', help='実行記録ファイル')
+    parser.add_argument('--pptx', default=None, help='テンプレートPPTX（省略時は記録のパス）')
+    parser.add_argument('--output', default=None, help='出力先（省略時は {record}_replay.pptx）')
+    args = parser.parse_args(argv)
+    
+    record = load_record(args.record)
+    options = record["options"]
+    template = record["inputs"]["template"]
+    pptx_path = Path(args.pptx or template["path"])
+    if file_sha256(pptx_path) != template["sha256"]:
+        logger.warning(f"テンプレートが記録時と異なります: {pptx_path}")
+    
+    record_path = Path(args.record)
+    output_path = Path(args.output) if args.output else record_path.with_name(
+        f"{record_path.name.split('.')[0]}_replay.pptx")
+    
+    # カテゴリは記録から復元し、マッチングの応答は記録を返す
+    categories = [Category.from_dict(c) for c in record["categories"]]
+    model = ReplayModel(record["calls"], stage='matching')
+    recorder = RunRecorder('replay', options)
+    recorder.set_categories(categories)
+    result_path = process_pptx(model, categories, str(pptx_path), str(output_path),
+                               token_budget=options.get('token_budget', DEFAULT_TOKEN_BUDGET),
+                               unmatched=options.get('unmatched', UNMATCHED_KEEP),
+                               split=options.get('split', False),
+                               grouping=options.get('grouping', DEFAULT_GROUPING),
+                               recorder=recorder,
+                               cascade=[(name, None if name == LOCAL_MATCHER else model)
+                                        for name in options.get('match_models', [])],
+                               confidence_threshold=options.get('confidence_threshold',
+                                                                DEFAULT_CONFIDENCE_THRESHOLD))
+    recorder.save(Path(result_path or output_path).with_suffix('.run.json'))
+    
+    # 比較
+    replayed = recorder.data
+    same_mapping = replayed["mapping"] == record["mapping"]
+    recorded_hash = (record.get("output") or {}).get("content_sha256")
+    replayed_hash = (replayed.get("output") or {}).get("content_sha256")
+    same_output = recorded_hash is not None and recorded_hash == replayed_hash
+    
+    logger.info("")
+    logger.info("=" * 60)
+    logger.info("再実行の比較")
+    logger.info("=" * 60)
+    logger.info(f"  マッピング: {'一致' if same_mapping else '相違'}")
+    logger.info(f"  出力: {'一致' if same_output else '相違'}")
+    if model.mismatches:
+        logger.info(f"  記録と異なるプロンプト: {model.mismatches} 件")
+    logger.info("  処理時間（記録 -> 再実行）:")
+    for stage, seconds in replayed["timings"].items():
+        before = record["timings"].get(stage)
+        before_text = f"{before:.3f}s" if before is not None else "-"
+        logger.info(f"    {stage:10s} {before_text} -> {seconds:.3f}s")
+    return 0 if same_mapping and same_output else 1
+
+
+def batch(argv: List[str]) -> int:
+    """
+    1つのテンプレートを多数の入札に使う一括モード（審査基準ファイル1つ = 1入札）
+    グループ化とグループ側の行列（group_matrix）はテンプレートにつき1回だけ作り、
+    入札ごとにはカテゴリとのスコア行列の計算と出力だけを行う
+    
+    Returns:
+        int: 終了コード（全入札の出力に成功すれば 0）
+    """
+    parser = argparse.ArgumentParser(
+        prog='main.py batch',
+        description='1つのテンプレートを多数の審査基準（入札）で続けて整理（グループ側の照合結果を共有）'
+    )
+    parser.add_argument('master_pptx', help='テンプレートPPTX')
+    parser.add_argument('criteria', nargs='+', help='審査基準ファイル（1ファイル = 1入札）')
+    parser.add_argument('--output-dir', default=None,
+                        help='出力先ディレクトリ（省略時は {master}_batch）')
+    parser.add_argument('--match-models', default=LOCAL_MATCHER, metavar='MODELS',
+                        help='マッチングのカスケード（既定: local = AIを使わずスコア行列だけで割り当て）')
+    parser.add_argument('--confidence-threshold', type=float, default=confidence_threshold_from_env(),
+                        help=f'カスケードで確定とみなす確信度（既定: {DEFAULT_CONFIDENCE_THRESHOLD}）')
+    parser.add_argument('--grouping', choices=list(GROUPING_STRATEGIES), default=DEFAULT_GROUPING,
+                        help='スライドのグループ化（既定: structure）')
+    parser.add_argument('--unmatched', choices=UNMATCHED_MODES, default=UNMATCHED_KEEP,
+                        help='未使用スライドの扱い（既定: keep）')
+    parser.add_argument('--split', action='store_true', help='入札ごとにカテゴリ別のZIPで出力')
+    parser.add_argument('--no-ocr', action='store_true', help='スキャンPDF／画像のローカルOCRを使用しない')
+    parser.add_argument('--scores-only', action='store_true',
+                        help='PPTXを出力せず、スコアと割り当ての一覧（scores.json）だけを書く')
+    args = parser.parse_args(argv)
+    
+    pptx_path = Path(args.master_pptx)
+    output_dir = Path(args.output_dir) if args.output_dir else pptx_path.parent / f"{pptx_path.stem}_batch"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    match_models = [name.strip() for name in args.match_models.split(',') if name.strip()]
+    
+    # AIはカスケードにAIのモデルがあるか、Word／画像の審査基準がある場合だけ使う
+    needs_ai = any(name != LOCAL_MATCHER for name in match_models) or any(
+        detect_file_type(path) not in ('pdf', 'excel') for path in args.criteria)
+    model = setup_gemini() if needs_ai else None
+    cascade = [(name, None if name == LOCAL_MATCHER else setup_gemini(name)) for name in match_models]
+    
+    # グループ側: テンプレートにつき1回（目次を入れる前の状態でグループ化）
+    prs = Presentation(str(pptx_path))
+    pptx_bytes = pptx_path.read_bytes()
+    template_key = template_digest_key(pptx_bytes)
+    digests = load_template_digest(pptx_bytes, prs, key=template_key)
+    groups = group_slides(prs, start=2, strategy=args.grouping, digests=digests, cache_key=template_key)
+    matrix = load_group_matrix(groups)
+    # 候補の確認用のテキスト索引（目次を入れる前のテンプレートなので位置のずれは無い）
+    index = load_slide_index(pptx_bytes, prs, key=template_key)
+    
+    tenders = [extract_categories(model, path, use_ocr=not args.no_ocr) for path in args.criteria]
+    
+    # 入札ごとのスコア行列（グループ側の行列は共有）
+    started = time.perf_counter()
+    all_scores = matrix.score_batch(tenders)
+    logger.info(f"スコア行列: {len(tenders)} 入札 × {len(groups)} グループ, "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms")
+    
+    summary = []
+    mappings = []
+    for path, categories, scores in zip(args.criteria, tenders, all_scores):
+        # キーワード候補のスコアを上げてから割り当てる（local_matching と同じ）
+        candidates = keyword_candidates(index, categories, groups)
+        mapping, confidences = assign_scores(categories, boost_candidates(scores, categories, candidates))
+        mappings.append(mapping)
+        confident = sum(1 for no in mapping if confidences[no] >= args.confidence_threshold)
+        logger.info(f"  {Path(path).name}: カテゴリ {len(categories)} 件, 割り当て {len(mapping)} 件, "
+                    f"確信度 {args.confidence_threshold} 以上 {confident} 件")
+        summary.append({
+            "criteria": str(path),
+            "categories": [
+                {
+                    "no": cat.no,
+                    "category": cat.main_category,
+                    "group": mapping.get(cat.no, -1),
+                    "group_title": groups[mapping[cat.no]].title if cat.no in mapping else None,
+                    "score": round(float(row[mapping[cat.no]]), 3) if cat.no in mapping else 0.0,
+                    "confidence": confidences[cat.no],
+                    "keyword_candidates": candidates.get(cat.no, []),
+                }
+                for cat, row in zip(categories, scores)
+            ],
+        })
+    scores_path = output_dir / "scores.json"
+    scores_path.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+    logger.info(f"スコアの一覧: {scores_path}")
+    if args.scores_only:
+        return 0
+    
+    # 出力（目次・並べ替えは入札ごと。グループ化とグループ側の行列はキャッシュを使う）
+    # カスケードが local だけなら、上の割り当てをそのまま使い、入札ごとにスコアを計算し直さない
+    # （目次の後でグループ化しても、グループの順序と数は目次を入れる前と同じ）
+    local_only = all(name == LOCAL_MATCHER for name in match_models)
+    failed = 0
+    for path, categories, mapping in zip(args.criteria, tenders, mappings):
+        if not categories:
+            logger.error(f"カテゴリを抽出できませんでした: {path}")
+            failed += 1
+            continue
+        output_path = output_dir / f"{Path(path).stem}.pptx"
+        result_path = process_pptx(model, categories, str(pptx_path), str(output_path),
+                                   unmatched=args.unmatched, split=args.split, grouping=args.grouping,
+                                   cascade=cascade, confidence_threshold=args.confidence_threshold,
+                                   mapping=mapping if local_only else None)
+        if result_path is None:
+            failed += 1
+    logger.info(f"一括処理: {len(tenders) - failed}/{len(tenders)} 件を出力しました（{output_dir}）")
+    return 1 if failed else 0
+
+
+def search(argv: List[str]) -> int:
+    """
+    テンプレートの全文検索（どのスライドのどのシェイプに書いてあるか）
+    索引はテンプレートのハッシュごとにキャッシュし、2回目以降は読み込むだけ
+    
+    Returns:
+        int: 終了コード（見つかれば 0、見つからなければ 1）
+    """
+    parser = argparse.ArgumentParser(
+        prog='main.py search',
+        description='テンプレートのスライド（表・グループ・ノートを含む）から語を検索'
+    )
+    parser.add_argument('master_pptx', help='テンプレートPPTX')
+    parser.add_argument('query', nargs='+', help='検索語（複数指定時は同じスライドにすべて含むもの）')
+    parser.add_argument('--limit', type=int, default=50, help='表示件数の上限（既定: 50）')
+    args = parser.parse_args(argv)
+    
+    index = load_slide_index(Path(args.master_pptx).read_bytes())
+    started = time.perf_counter()
+    hits = index.search(" ".join(args.query), limit=args.limit)
+    elapsed = time.perf_counter() - started
+    for hit in hits:
+        print(f"{hit.slide:4d}  {hit.title[:30]:30s}  {hit.shape} [{hit.kind}]  {hit.snippet}")
+    logger.info(f"{len(hits)} 件（{len(index.slides)} スライド, {len(index)} シェイプ, "
+                f"{elapsed * 1000:.2f} ms）")
+    return 0 if hits else 1
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'replay':
+        sys.exit(replay(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'search':
+        sys.exit(search(sys.argv[2:]))
+    
     parser = argparse.ArgumentParser(
-        description='Gemini AIを使用してPPTXスライドを並べ替え（表紙・目次を固定、タイトル自動更新）'
+        description='Gemini AIを使用してPPTXスライドを並べ替え（表紙・目次を固定、タイトル自動更新）',
+        epilog='記録した実行の再実行: python main.py replay RECORD.run.json / '
+               '多数の入札の一括処理: python main.py batch MASTER.pptx CRITERIA ... / '
+               'テンプレート内の検索: python main.py search MASTER.pptx QUERY ...'
     )
     parser.add_argument('source_file', 
                         help='審査基準ファイル（PDF, Excel, Word, 画像に対応）')
     parser.add_argument('master_pptx', help='編集対象のPPTXファイル')
     parser.add_argument('output_pptx', nargs='?', default=None,
                         help='出力PPTXファイル（省略時は {master}_output.pptx）')
+    parser.add_argument('-c', '--criteria', action='append', default=[], metavar='FILE',
+                        help='追加の審査基準ファイル（複数指定可。source_file と統合して1回でマッチング）')
+    parser.add_argument('--no-ocr', action='store_true',
+                        help='スキャンPDF／画像のローカルOCRを使用しない')
+    parser.add_argument('--ocr-dpi', type=int, default=OCR_DPI,
+                        help=f'OCR時のラスタライズ解像度（既定: {OCR_DPI}）')
+    parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help=f'マッチングプロンプトのトークン予算（既定: {DEFAULT_TOKEN_BUDGET}）')
+    parser.add_argument('--unmatched', choices=UNMATCHED_MODES, default=UNMATCHED_KEEP,
+                        help='未使用スライドの扱い: keep=末尾に残す / drop=削除（不要なレイアウト・画像も除去）'
+                             ' / hide=非表示にしてセクションへ（既定: keep）')
+    parser.add_argument('--grouping', choices=list(GROUPING_STRATEGIES), default=DEFAULT_GROUPING,
+                        help='スライドのグループ化: structure=セクション・レイアウト・タイトルの類似度も考慮'
+                             ' / title=タイトルのみ（既定: structure）')
+    parser.add_argument('--split', action='store_true',
+                        help='カテゴリごとに表紙・目次付きのPPTXを作り、ZIPにまとめて出力')
+    parser.add_argument('--match-models', default=','.join(cascade_models_from_env()), metavar='MODELS',
+                        help='マッチングのカスケード（カンマ区切り。例: local,models/gemini-2.5-flash,'
+                             'models/gemini-2.5-pro）。確信度の低いカテゴリだけを次のモデルに聞き直す'
+                             '（既定: 環境変数 MATCH_MODELS。未指定なら既定のモデル。local だけならAIを使わない）')
+    parser.add_argument('--confidence-threshold', type=float, default=confidence_threshold_from_env(),
+                        help='カスケードで確定とみなす確信度（0〜1、既定: 環境変数 MATCH_CONFIDENCE または '
+                             f'{DEFAULT_CONFIDENCE_THRESHOLD}）')
+    parser.add_argument('--record', default=None, metavar='PATH',
+                        help='実行記録（JSON）の保存先（省略時は {output}.run.json）')
+    parser.add_argument('--no-record', action='store_true',
+                        help='実行記録を保存しない')
     
     args = parser.parse_args()
     
-    source_path = Path(args.source_file)
+    source_paths = [Path(args.source_file)] + [Path(p) for p in args.criteria]
     pptx_path = Path(args.master_pptx)
     
-    if not source_path.exists():
-        logger.error(f"審査基準ファイルが見つかりません: {source_path}")
-        sys.exit(1)
+    for source_path in source_paths:
+        if not source_path.exists():
+            logger.error(f"審査基準ファイルが見つかりません: {source_path}")
+            sys.exit(1)
     
     if not pptx_path.exists():
         logger.error(f"PPTXファイルが見つかりません: {pptx_path}")
@@ -717,24 +835,53 @@ def main():
     logger.info("=" * 60)
     logger.info("PPTX Organizer v5 (AI-Powered) - スライド自動整理ツール")
     logger.info("=" * 60)
-    logger.info(f"入力ファイル: {source_path} ({detect_file_type(str(source_path))})")
+    for source_path in source_paths:
+        logger.info(f"入力ファイル: {source_path} ({detect_file_type(str(source_path))})")
     logger.info(f"入力PPTX: {pptx_path}")
     logger.info(f"出力PPTX: {output_path}")
     logger.info("")
     
+    match_models = [name.strip() for name in args.match_models.split(',') if name.strip()]
+    
+    recorder = RunRecorder('organize', {
+        'token_budget': args.token_budget,
+        'unmatched': args.unmatched,
+        'grouping': args.grouping,
+        'split': args.split,
+        'use_ocr': not args.no_ocr,
+        'ocr_dpi': args.ocr_dpi,
+        'match_models': match_models,
+        'confidence_threshold': args.confidence_threshold,
+    })
+    
     try:
-        # Gemini API初期化
-        model = setup_gemini()
+        # Gemini API初期化（呼び出しと応答は実行記録に残す）
+        model = RecordingModel(setup_gemini(), recorder)
+        cascade = [
+            (name, None if name == LOCAL_MATCHER else RecordingModel(setup_gemini(name), recorder))
+            for name in match_models
+        ]
         
-        # ファイル形式に応じてカテゴリ抽出
-        categories = extract_categories(model, str(source_path))
+        # ファイル形式に応じてカテゴリ抽出（複数ファイルは並列に抽出して統合）
+        recorder.start('extract')
+        for source_path in source_paths:
+            recorder.add_criteria(source_path)
+        categories = extract_categories_from_files(model, [str(p) for p in source_paths],
+                                                   use_ocr=not args.no_ocr, ocr_dpi=args.ocr_dpi)
+        recorder.set_categories(categories)
         
         if not categories:
             logger.error("審査基準からカテゴリを抽出できませんでした。")
             sys.exit(1)
         
         # PPTX 処理
-        process_pptx(model, categories, str(pptx_path), str(output_path))
+        result_path = process_pptx(model, categories, str(pptx_path), str(output_path),
+                                   token_budget=args.token_budget, unmatched=args.unmatched,
+                                   split=args.split, grouping=args.grouping, recorder=recorder,
+                                   cascade=cascade, confidence_threshold=args.confidence_threshold)
+        
+        if not args.no_record:
+            recorder.save(args.record or Path(result_path or output_path).with_suffix('.run.json'))
         
     except Exception as e:
         logger.error(f"処理中にエラーが発生しました: {e}")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+マッチングのモデルカスケード
+==========================
+速く安いモデル（またはローカルの照合）でまず全カテゴリをマッチングし、
+カテゴリごとの確信度が低いもの・割り当てが競合したものだけを、
+次の（より強い）モデルに聞き直して結果をまとめる。
+
+    MATCH_MODELS="local,models/gemini-2.5-flash,models/gemini-2.5-pro"
+    MATCH_CONFIDENCE=0.7
+
+- "local" はAIを使わない文字バイグラムの照合（確信度は1位と2位の差から計算）
+- 確信度が閾値以上の回答（マッチなし -1 を含む）は確定し、そのグループは次の段階に出さない
+- 次の段階には未確定のカテゴリと、まだ割り当てられていないグループだけを送る
+- 最後の段階の回答はそのまま採用する（回答できなかったカテゴリは前の段階の候補を使う）
+- テキスト索引のキーワード候補（slide_index.keyword_candidates）を渡すと、
+  "local" ではスコアに CANDIDATE_BOOST を足し、AIの段階ではプロンプトに候補として添える
+
+MATCH_MODELS が未設定の場合はカスケードを使わない（既定のモデルでマッチングする）。
+モデルが1つの場合はそのモデルだけで（確信度付きで）マッチングする。
+"local" だけの場合はAIを使わず、ローカル照合の結果をそのまま使う
+（グループ側の行列はテンプレートごとにキャッシュするため、多数の入札を続けて処理する場合に速い）。
+"""
+
+import os
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from group_matrix import GroupMatrix, load_group_matrix
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+LOCAL_MATCHER = 'local'
+DEFAULT_CONFIDENCE_THRESHOLD = 0.7
+
+# ローカル照合で「十分に強い」とみなすカテゴリ文字の被覆率
+LOCAL_STRONG_SCORE = 0.5
+# キーワード候補のグループのスコアに足す値（1位の候補。2位以下は順位で割る）
+CANDIDATE_BOOST = 0.1
+
+# match_fn(model, categories, groups, confidences, candidates) -> {pdf_no: group_index}
+# candidates は {No: [groups の中の位置, ...]}（無ければ None）
+MatchFn = Callable[[object, Sequence, Sequence, Dict[int, float], Optional[Dict[int, List[int]]]],
+                   Dict[int, int]]
+
+
+def cascade_models_from_env() -> List[str]:
+    """環境変数 MATCH_MODELS のモデル一覧（カンマ区切り。未設定なら空）"""
+    return [name.strip() for name in os.getenv("MATCH_MODELS", "").split(',') if name.strip()]
+
+
+def confidence_threshold_from_env() -> float:
+    return float(os.getenv("MATCH_CONFIDENCE", DEFAULT_CONFIDENCE_THRESHOLD))
+
+
+def uses_cascade(stages: Sequence[Tuple[str, object]]) -> bool:
+    """
+    cascade_matching() でマッチングするか（1段階以上。AIのモデルが1つだけの場合も、
+    既定のモデルではなくそのモデルでマッチングする）
+    """
+    return len(stages) > 0
+
+
+# ============================================================================
+# Local Matcher
+# ============================================================================
+def assign_scores(categories: Sequence, scores) -> Tuple[Dict[int, int], Dict[int, float]]:
+    """
+    スコア行列（カテゴリ × グループ）から、スコアの高い組から順に1対1で割り当てる
+
+    Returns:
+        (mapping, confidences): 確信度は 1位と2位の差 × 1位の強さ。
+        1位のグループが他のカテゴリに取られた場合（競合）は 0
+    """
+    rows = {cat.no: list(row) for cat, row in zip(categories, scores.tolist())}
+    best = {}
+    for no, row in rows.items():
+        ranked = sorted(row, reverse=True) + [0.0, 0.0]
+        best[no] = (ranked[0], ranked[1], row.index(ranked[0]) if row else -1)
+
+    pairs = sorted(
+        ((score, no, idx) for no, row in rows.items() for idx, score in enumerate(row) if score > 0),
+        key=lambda item: (-item[0], item[1], item[2])
+    )
+    mapping = {}
+    used = set()
+    for score, no, idx in pairs:
+        if no not in mapping and idx not in used:
+            mapping[no] = idx
+            used.add(idx)
+
+    confidences = {}
+    for no, (top, second, top_idx) in best.items():
+        if top <= 0:
+            confidences[no] = 0.0
+        elif mapping.get(no) != top_idx:
+            confidences[no] = 0.0
+        else:
+            confidences[no] = round((top - second) / top * min(1.0, top / LOCAL_STRONG_SCORE), 3)
+    return mapping, confidences
+
+
+def boost_candidates(scores, categories: Sequence, candidates: Optional[Dict[int, List[int]]],
+                     columns: Optional[Sequence[int]] = None):
+    """
+    キーワード候補のグループのスコアに CANDIDATE_BOOST / 順位 を足した行列を返す
+
+    Args:
+        candidates: {No: [グループ番号, ...]}（keyword_candidates の結果）
+        columns: scores の列が groups のどのグループか（省略時は列の位置 = グループ番号）
+    """
+    if not candidates:
+        return scores
+    position = {group: col for col, group in enumerate(columns)} if columns is not None else None
+    boosted = scores.copy()
+    for row, cat in enumerate(categories):
+        for rank, group in enumerate(candidates.get(cat.no, [])):
+            col = position.get(group) if position is not None else group
+            if col is not None and 0 <= col < boosted.shape[1]:
+                boosted[row, col] += CANDIDATE_BOOST / (rank + 1)
+    return boosted
+
+
+def subset_candidates(candidates: Optional[Dict[int, List[int]]],
+                      columns: Sequence[int]) -> Optional[Dict[int, List[int]]]:
+    """候補のグループ番号を columns の中の位置に置き換える（columns に無いグループは除く）"""
+    if candidates is None:
+        return None
+    position = {group: col for col, group in enumerate(columns)}
+    return {no: [position[g] for g in groups if g in position] for no, groups in candidates.items()}
+
+
+def local_matching(categories: Sequence, groups: Sequence, matrix: Optional[GroupMatrix] = None,
+                   columns: Optional[Sequence[int]] = None,
+                   candidates: Optional[Dict[int, List[int]]] = None) -> Tuple[Dict[int, int], Dict[int, float]]:
+    """
+    カテゴリ（大項目＋小項目）の文字バイグラムがグループ（タイトル＋内容）に含まれる割合で照合
+    グループ側の行列はテンプレートごとにキャッシュしたもの（group_matrix）を使う
+
+    Args:
+        columns: groups のうち照合に使うグループの番号（省略時はすべて）。
+                 行列はテンプレート全体のものを使い、スコアの列だけを絞る
+                 （残りのグループごとに行列を作り直さない）
+        candidates: キーワード候補 {No: [グループ番号, ...]}。候補のスコアを boost_candidates() で上げる
+
+    Returns:
+        (mapping, confidences): assign_scores() を参照。mapping の値は columns の中の位置
+    """
+    if matrix is None:
+        matrix = load_group_matrix(groups)
+    scores = matrix.score(categories)
+    if columns is not None:
+        scores = scores[:, list(columns)]
+    return assign_scores(categories, boost_candidates(scores, categories, candidates, columns))
+
+
+# ============================================================================
+# Cascade
+# ============================================================================
+def cascade_matching(stages: Sequence[Tuple[str, object]], categories: Sequence, groups: Sequence,
+                     match_fn: MatchFn, threshold: float = DEFAULT_CONFIDENCE_THRESHOLD,
+                     progress_callback: Optional[Callable[[str], None]] = None,
+                     candidates: Optional[Dict[int, List[int]]] = None) -> Tuple[Dict[int, int], Dict]:
+    """
+    stages の順にマッチングし、確信度の低いカテゴリだけを次の段階へ送る
+
+    Args:
+        stages: [(モデル名, モデル), ...]。モデル名 "local" はローカル照合（モデルは不要）
+        match_fn: AIでのマッチング。confidences に {No: 確信度} を入れて mapping を返す
+        progress_callback: 段階ごとに progress_callback(説明) を呼ぶ
+        candidates: テキスト索引のキーワード候補 {No: [グループ番号, ...]}。各段階に
+                    その段階のグループの位置に直して渡す
+
+    Returns:
+        (mapping, stats): stats は段階ごとの件数・時間と、最初の段階で確定せず
+        強いモデルへ送ったカテゴリの件数（escalated）
+    """
+    decided: Dict[int, int] = {}
+    tentative: Dict[int, int] = {}
+    pending = list(categories)
+    stats = {"threshold": threshold, "stages": [], "escalated": 0}
+
+    for depth, (name, model) in enumerate(stages):
+        if not pending:
+            break
+        last = depth == len(stages) - 1
+        taken = {g for g in decided.values() if g >= 0}
+        available = [i for i in range(len(groups)) if i not in taken]
+        if progress_callback:
+            progress_callback(f"{name} でマッチング中（{len(pending)} 件）...")
+
+        started = time.perf_counter()
+        confidences: Dict[int, float] = {}
+        if not available:
+            sub_mapping = {}
+            confidences = {cat.no: 1.0 for cat in pending}
+        elif name == LOCAL_MATCHER:
+            sub_mapping, confidences = local_matching(pending, groups, columns=available,
+                                                      candidates=candidates)
+        else:
+            sub_mapping = match_fn(model, pending, [groups[i] for i in available], confidences,
+                                   subset_candidates(candidates, available))
+        answers = {cat.no: available[sub_mapping[cat.no]] if cat.no in sub_mapping else -1
+                   for cat in pending if cat.no in confidences}
+
+        confident = [cat for cat in pending
+                     if cat.no in answers and (last or confidences[cat.no] >= threshold)]
+        for cat in confident:
+            decided[cat.no] = answers[cat.no]
+        for no, group in answers.items():
+            tentative.setdefault(no, group)
+            if group >= 0:
+                tentative[no] = group
+        escalated = [cat for cat in pending if cat.no not in decided]
+
+        stats["stages"].append({
+            "model": name,
+            "categories": len(pending),
+            "groups": len(available),
+            "confident": len(confident),
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+        if not last:
+            if depth == 0:
+                stats["escalated"] = len(escalated)
+            if escalated:
+                logger.info(f"  {name}: 確定 {len(confident)} 件, 次の段階へ {len(escalated)} 件 "
+                            f"{[cat.no for cat in escalated]}")
+        pending = escalated
+
+    # 最後まで回答が得られなかったカテゴリは、空いていれば前の段階の候補を使う
+    used = {g for g in decided.values() if g >= 0}
+    for cat in pending:
+        group = tentative.get(cat.no, -1)
+        if group >= 0 and group not in used:
+            decided[cat.no] = group
+            used.add(group)
+
+    mapping = {no: group for no, group in decided.items() if group >= 0}
+    logger.info(
+        f"カスケード: {' -> '.join(s['model'] for s in stats['stages'])}, "
+        f"エスカレーション {stats['escalated']} 件 / {len(categories)} 件（閾値 {threshold}）"
+    )
+    return mapping, stats
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+モデルのバックエンド切り替え
+=========================
+generate_content / count_tokens を持つモデルを、環境変数で選んだバックエンドから作る。
+
+    MODEL_BACKEND=gemini  Google Gemini（既定。GOOGLE_API_KEY が必要）
+    MODEL_BACKEND=http    Gemini REST API と同じ形式のHTTPサーバー
+                          （fake_gemini_server.py 等。MODEL_BASE_URL で指定）
+
+http バックエンドは APIキーもネットワークも不要なため、負荷試験やオフラインのCIで使う。
+リクエストと応答の形式（contents / generationConfig / candidates / usageMetadata）は
+Gemini の generateContent・countTokens と同じ。
+"""
+
+import os
+import json
+import base64
+import logging
+import mimetypes
+import dataclasses
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+BACKEND_GEMINI = 'gemini'
+BACKEND_HTTP = 'http'
+BACKENDS = (BACKEND_GEMINI, BACKEND_HTTP)
+
+DEFAULT_MODEL_NAME = "models/gemini-2.5-flash"
+DEFAULT_BASE_URL = "http://127.0.0.1:8765"
+# http バックエンドの1リクエストのタイムアウト（秒）
+HTTP_TIMEOUT = 300
+
+
+class ModelHTTPError(RuntimeError):
+    """http バックエンドのエラー応答（429 の場合は retry_after に待ち秒数）"""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+# ============================================================================
+# HTTP Backend
+# ============================================================================
+class InlineFile:
+    """upload_file の代わりにリクエストへ埋め込むファイル"""
+
+    def __init__(self, path: str):
+        self.mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.data = Path(path).read_bytes()
+
+
+class _Usage:
+    def __init__(self, metadata: Dict):
+        self.prompt_token_count = metadata.get("promptTokenCount")
+        self.candidates_token_count = metadata.get("candidatesTokenCount")
+        self.total_token_count = metadata.get("totalTokenCount")
+
+
+class _TokenCount:
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+class HttpResponse:
+    """generateContent の応答（genai の応答と同じく text と usage_metadata を持つ）"""
+
+    def __init__(self, body: Dict):
+        parts = []
+        for candidate in body.get("candidates") or []:
+            parts = (candidate.get("content") or {}).get("parts") or []
+            break
+        self.text = "".join(p.get("text", "") for p in parts)
+        self.usage_metadata = _Usage(body.get("usageMetadata") or {})
+
+
+def _camel(name: str) -> str:
+    head, *rest = name.split('_')
+    return head + "".join(word.title() for word in rest)
+
+
+def generation_config_dict(config) -> Dict:
+    """GenerationConfig（dataclass / dict）を REST の generationConfig にする（None は省く）"""
+    if config is None:
+        return {}
+    if dataclasses.is_dataclass(config):
+        config = {f.name: getattr(config, f.name) for f in dataclasses.fields(config)}
+    return {_camel(key): value for key, value in dict(config).items() if value is not None}
+
+
+def _part(item) -> Dict:
+    if isinstance(item, str):
+        return {"text": item}
+    if isinstance(item, InlineFile):
+        return {"inline_data": {"mime_type": item.mime_type,
+                                "data": base64.b64encode(item.data).decode('ascii')}}
+    raise TypeError(f"http バックエンドで送れない入力です: {type(item).__name__}")
+
+
+class HttpModel:
+    """Gemini REST API と同じ形式のサーバーを呼ぶモデル"""
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, model_name: str = DEFAULT_MODEL_NAME,
+                 timeout: float = HTTP_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.model_name = model_name
+        self.timeout = timeout
+
+    def _post(self, method: str, payload: Dict) -> Dict:
+        url = f"{self.base_url}/v1beta/{self.model_name}:{method}"
+        request = urllib.request.Request(
+            url, data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8'))["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                message = e.reason
+            retry_after = e.headers.get("Retry-After")
+            raise ModelHTTPError(e.code, message, float(retry_after) if retry_after else None) from None
+
+    def generate_content(self, prompt, generation_config=None, **kwargs) -> HttpResponse:
+        items = prompt if isinstance(prompt, (list, tuple)) else [prompt]
+        payload = {"contents": [{"role": "user", "parts": [_part(item) for item in items]}]}
+        config = generation_config_dict(generation_config)
+        if config:
+            payload["generationConfig"] = config
+        return HttpResponse(self._post("generateContent", payload))
+
+    def count_tokens(self, text) -> _TokenCount:
+        items = text if isinstance(text, (list, tuple)) else [text]
+        body = self._post("countTokens", {"contents": [{"role": "user", "parts": [_part(i) for i in items]}]})
+        return _TokenCount(int(body["totalTokens"]))
+
+    def upload_file(self, path: str) -> InlineFile:
+        return InlineFile(path)
+
+
+# ============================================================================
+# Entry Point
+# ============================================================================
+def selected_backend() -> str:
+    backend = os.getenv("MODEL_BACKEND", BACKEND_GEMINI).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"未対応のモデルバックエンド: {backend}（{' / '.join(BACKENDS)}）")
+    return backend
+
+
+def create_model(backend: Optional[str] = None, api_key: Optional[str] = None,
+                 model_name: Optional[str] = None):
+    """
+    バックエンドに応じたモデルを作る
+
+    Args:
+        backend: 省略時は環境変数 MODEL_BACKEND（既定: gemini）
+        api_key: gemini の APIキー（省略時は環境変数 GOOGLE_API_KEY）
+        model_name: 省略時は環境変数 MODEL_NAME（既定: gemini-2.5-flash）
+
+    Raises:
+        ValueError: 未対応のバックエンド、または gemini で APIキーが無い場合
+    """
+    backend = backend or selected_backend()
+    model_name = model_name or os.getenv("MODEL_NAME", DEFAULT_MODEL_NAME)
+    if backend == BACKEND_HTTP:
+        base_url = os.getenv("MODEL_BASE_URL", DEFAULT_BASE_URL)
+        logger.info(f"モデル: {model_name}（http: {base_url}）")
+        return HttpModel(base_url, model_name)
+
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY が設定されていません")
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    logger.info(f"モデル: {model_name}（gemini）")
+    return genai.GenerativeModel(model_name)
+
+
+def upload_file(model, path: str):
+    """画像等のファイルをプロンプトに添付できる形にする（バックエンドごとの方法で）"""
+    uploader = getattr(model, 'upload_file', None)
+    if uploader is not None:
+        return uploader(path)
+    import google.generativeai as genai
+    return genai.upload_file(path)
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ローカルOCRによる審査基準表の抽出
+================================
+テキストレイヤーの無いスキャンPDFや画像の審査基準表を、
+Tesseract（日本語データ）でオフラインOCRし、pdfplumber の
+extract_tables() と同じ形（ページ → テーブル → 行 → セル）に復元する。
+
+復元したテーブルは通常のカテゴリパーサーにそのまま渡せる。
+OCR結果はページ単位のハッシュ（ページの内容ストリームと、そこから描画する画像等の
+XObject のデータ）でキャッシュされるため、同じファイルの再実行や、ページを追加・差し替えた
+ファイル、同じページを含む別のファイルでは、変わっていないページのOCRを行わない。
+
+Requirements:
+    pytesseract + tesseract 本体（jpn 言語データ）
+"""
+
+import io
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+OCR_DPI = 300
+OCR_LANG = "jpn+eng"
+OCR_CACHE_DIR = Path(__file__).parent / ".ocr_cache"
+
+# キャッシュ形式を変えた場合はここを上げる（古いキャッシュを無効化）
+_CACHE_VERSION = 2
+
+
+def is_ocr_available() -> bool:
+    """pytesseract と tesseract 本体が利用可能か"""
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+# ============================================================================
+# Rasterize
+# ============================================================================
+def _rasterize_page(file_bytes: bytes, file_type: str, page_index: int, dpi: int):
+    """1ページを画像化する（PIL.Image）。ページごとに開くため、別スレッドから並行に呼べる"""
+    if file_type == 'image':
+        from PIL import Image
+        return Image.open(io.BytesIO(file_bytes)).convert('RGB')
+
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+        return pdf.pages[page_index].to_image(resolution=dpi).original.convert('RGB')
+
+
+def _hash_stream_tree(digest, obj, seen: set):
+    """ストリーム（XObject）のデータと、それが参照する XObject を再帰的にハッシュへ加える"""
+    from pdfminer.pdftypes import PDFStream, resolve1
+
+    obj = resolve1(obj)
+    if isinstance(obj, PDFStream):
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+        digest.update(obj.get_rawdata() or b'')
+        resources = resolve1(obj.attrs.get('Resources'))
+        if isinstance(resources, dict):
+            _hash_stream_tree(digest, resources.get('XObject'), seen)
+    elif isinstance(obj, dict):
+        for name in sorted(obj, key=str):
+            digest.update(str(name).encode('utf-8'))
+            _hash_stream_tree(digest, obj[name], seen)
+
+
+def _page_hashes(file_bytes: bytes, file_type: str) -> List[str]:
+    """
+    ページごとの内容のハッシュ（ファイル全体ではなくページ単位）
+    PDFは内容ストリーム・描画する XObject（スキャン画像）・寸法と回転から作る
+    """
+    if file_type == 'image':
+        return [hashlib.sha256(file_bytes).hexdigest()]
+
+    import pdfplumber
+    from pdfminer.pdftypes import resolve1
+
+    hashes = []
+    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+        for page in pdf.pages:
+            page_obj = page.page_obj
+            digest = hashlib.sha256(f"{page_obj.mediabox}:{page_obj.rotate}".encode('utf-8'))
+            for stream in page_obj.contents or []:
+                digest.update(resolve1(stream).get_data() or b'')
+            resources = resolve1(page_obj.resources)
+            if isinstance(resources, dict):
+                _hash_stream_tree(digest, resources.get('XObject'), set())
+            hashes.append(digest.hexdigest())
+    return hashes
+
+
+# ============================================================================
+# OCR + Cache
+# ============================================================================
+def _page_key(page_hash: str, dpi: int, lang: str) -> str:
+    raw = f"{_CACHE_VERSION}:{page_hash}:{dpi}:{lang}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _load_cached(cache_dir: Optional[Path], key: str) -> Optional[list]:
+    if cache_dir is None:
+        return None
+    path = cache_dir / f"{key}.json"
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached(cache_dir: Optional[Path], key: str, words: list):
+    if cache_dir is None:
+        return
+    tmp_path = None
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # 一時ファイルは書き込みごとに別名にし、同じページを同時にOCRしたセッションと衝突させない
+        fd, tmp_path = tempfile.mkstemp(suffix='.json', dir=cache_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+            json.dump(words, tmp, ensure_ascii=False)
+        os.replace(tmp_path, cache_dir / f"{key}.json")
+    except OSError as e:
+        logger.warning(f"OCRキャッシュを保存できませんでした: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def _ocr_page(file_bytes: bytes, file_type: str, page_index: int, dpi: int, lang: str) -> List[Dict]:
+    """
+    1ページを画像化してOCRする
+    画像化もワーカーの中で行い、同時にメモリに置くページ画像をワーカー数までに抑える
+    """
+    return _ocr_words(_rasterize_page(file_bytes, file_type, page_index, dpi), lang)
+
+
+def _ocr_words(image, lang: str) -> List[Dict]:
+    """1ページ分のOCR。単語ごとの矩形とテキストを返す"""
+    import pytesseract
+
+    data = pytesseract.image_to_data(
+        image, lang=lang, config='--psm 6',
+        output_type=pytesseract.Output.DICT
+    )
+    words = []
+    for i, text in enumerate(data['text']):
+        text = (text or '').strip()
+        if not text or float(data['conf'][i]) < 0:
+            continue
+        words.append({
+            'text': text,
+            'left': int(data['left'][i]),
+            'top': int(data['top'][i]),
+            'width': int(data['width'][i]),
+            'height': int(data['height'][i]),
+        })
+    return words
+
+
+# ============================================================================
+# Table Reconstruction (Box Geometry)
+# ============================================================================
+def _median(values: List[float], default: float) -> float:
+    if not values:
+        return default
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def _join_text(parts: List[str]) -> str:
+    """日本語は詰めて、英数字同士は空白で連結"""
+    out = ""
+    for part in parts:
+        if out and out[-1].isascii() and out[-1].isalnum() and part[0].isascii() and part[0].isalnum():
+            out += " "
+        out += part
+    return out
+
+
+def reconstruct_table(words: List[Dict]) -> List[List[Optional[str]]]:
+    """
+    単語の矩形から表を復元する
+
+    1. 縦位置の近い単語を1行にまとめる
+    2. 行内で大きく離れた単語の塊をセル候補（セグメント）とする
+    3. ページ全体のセグメント左端をクラスタリングして列の境界を決める
+    4. 各セグメントを列に割り当て、pdfplumber と同じ行リストを返す
+    """
+    if not words:
+        return []
+
+    char_h = _median([w['height'] for w in words], 20)
+
+    # 1. 行に分割（縦位置順に1パス）
+    lines = []
+    for w in sorted(words, key=lambda w: w['top'] + w['height'] / 2):
+        center = w['top'] + w['height'] / 2
+        if lines and abs(center - lines[-1]['center']) <= char_h * 0.5:
+            line = lines[-1]
+            line['words'].append(w)
+            line['center'] = (line['center'] * (len(line['words']) - 1) + center) / len(line['words'])
+        else:
+            lines.append({'center': center, 'words': [w]})
+
+    # 2. 行内のセグメントに分割
+    gap_limit = char_h * 1.5
+    line_segments = []
+    for line in lines:
+        segments = []
+        for w in sorted(line['words'], key=lambda w: w['left']):
+            if segments and w['left'] - segments[-1]['right'] <= gap_limit:
+                seg = segments[-1]
+                seg['parts'].append(w['text'])
+                seg['right'] = max(seg['right'], w['left'] + w['width'])
+            else:
+                segments.append({'left': w['left'], 'right': w['left'] + w['width'], 'parts': [w['text']]})
+        line_segments.append(segments)
+
+    # 3. 列の境界（セグメント左端のクラスタ）
+    tolerance = char_h * 2
+    lefts = sorted(seg['left'] for segments in line_segments for seg in segments)
+    anchors = []
+    for x in lefts:
+        if not anchors or x - anchors[-1][-1] > tolerance:
+            anchors.append([x])
+        else:
+            anchors[-1].append(x)
+    # 1行にしか現れない位置は列とみなさない（ただし先頭列は常に残す）
+    columns = [c[0] for i, c in enumerate(anchors) if i == 0 or len(c) >= 2]
+
+    # 4. セル割り当て
+    rows = []
+    for segments in line_segments:
+        cells = [[] for _ in columns]
+        for seg in segments:
+            col = 0
+            for i, x in enumerate(columns):
+                if seg['left'] + tolerance / 2 >= x:
+                    col = i
+            cells[col].append(_join_text(seg['parts']))
+        rows.append([" ".join(c) if c else None for c in cells])
+    return rows
+
+
+# ============================================================================
+# Public API
+# ============================================================================
+def ocr_extract_tables(file_bytes: bytes, file_type: str = 'pdf', dpi: int = OCR_DPI,
+                       lang: str = OCR_LANG, max_workers: Optional[int] = None,
+                       cache_dir: Optional[Path] = OCR_CACHE_DIR) -> List[List[List[List[Optional[str]]]]]:
+    """
+    スキャンPDF／画像をOCRし、ページごとのテーブル一覧を返す
+
+    Returns:
+        List[List[table]]: pdfplumber の page.extract_tables() をページ分並べたものと同じ構造
+    """
+    page_keys = [_page_key(page_hash, dpi, lang) for page_hash in _page_hashes(file_bytes, file_type)]
+    page_count = len(page_keys)
+
+    cached = {}
+    for key in page_keys:
+        words = _load_cached(cache_dir, key)
+        if words is not None:
+            cached[key] = words
+
+    if len(cached) == page_count:
+        logger.info(f"OCRキャッシュを使用: {page_count} ページ")
+    else:
+        pending = [idx for idx, key in enumerate(page_keys) if key not in cached]
+        logger.info(f"OCR実行中: {len(pending)} ページ（{dpi} dpi, {lang}）")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {idx: executor.submit(_ocr_page, file_bytes, file_type, idx, dpi, lang)
+                       for idx in pending}
+            for idx, future in futures.items():
+                words = future.result()
+                cached[page_keys[idx]] = words
+                _store_cached(cache_dir, page_keys[idx], words)
+
+    pages = []
+    for key in page_keys:
+        table = reconstruct_table(cached[key])
+        pages.append([table] if table else [])
+    return pages
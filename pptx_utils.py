@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+PPTX 共通ユーティリティ
+=====================
+スライドのテキスト取得とスライドグループ化。main.py と app.py の両方から利用する。
+"""
+
+from typing import Dict, List, Optional
+
+from records import CONTENT_LIMIT, SlideGroup
+
+
+def get_slide_title(slide) -> str:
+    """スライドからタイトルを取得"""
+    if slide.shapes.title:
+        return slide.shapes.title.text.strip()
+    return ""
+
+
+def get_slide_first_text(slide) -> str:
+    """スライドから最初のテキストを取得"""
+    for shape in slide.shapes:
+        if shape.has_text_frame:
+            text = shape.text_frame.text.strip()
+            if text:
+                return text
+    return ""
+
+
+def get_slide_full_content(slide, limit: int = CONTENT_LIMIT) -> str:
+    """
+    スライドの全テキスト内容を取得（AIマッチング精度向上用）
+    上限文字数に達した時点で残りのシェイプは読まない
+    """
+    texts = []
+    size = 0
+    for shape in slide.shapes:
+        if shape.has_text_frame:
+            text = shape.text_frame.text.strip()
+            if text and len(text) > 2:  # 2文字以上のテキストのみ
+                texts.append(text)
+                size += len(text) + 1
+                if size > limit:
+                    break
+    return "\n".join(texts)[:limit]
+
+
+def build_slide_groups(prs, start: int = 0, with_content: bool = True,
+                       digests: Optional[Dict[int, str]] = None) -> List[SlideGroup]:
+    """
+    start 以降のスライドをグループ化（タイトル付きスライドを先頭に）
+    タイトルの無いスライドは直前のグループに追加する
+
+    Args:
+        digests: {slide_id: 定型文を除いた要約}（template_digest）。
+                 含まれるスライドは本文の代わりに要約を内容とする
+    """
+    groups = []
+    current_group = None
+
+    # prs.slides[idx] は毎回 sldIdLst を走査するため、イテレータで1回だけ辿る
+    for idx, slide in enumerate(prs.slides):
+        if idx < start:
+            continue
+        title = get_slide_title(slide)
+        if not with_content:
+            content = ""
+        elif digests is not None and slide.slide_id in digests:
+            content = digests[slide.slide_id]
+        else:
+            content = get_slide_full_content(slide)
+
+        if title:
+            if current_group:
+                groups.append(current_group)
+            current_group = SlideGroup(title, (idx,), content)
+        elif current_group:
+            current_group.add_slide(idx, content)
+        else:
+            first_text = get_slide_first_text(slide)
+            current_group = SlideGroup(
+                first_text[:50] if first_text else f"[Untitled {idx}]", (idx,), content
+            )
+
+    if current_group:
+        groups.append(current_group)
+
+    return groups
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+マッチング用プロンプトのトークン予算管理
+====================================
+カテゴリ一覧とスライドグループ一覧を、指定したトークン予算に収まるように組み立てる。
+
+1. 多くのグループに繰り返し現れる定型文（フッター、ロゴ文言、ページ番号）を除去
+2. グループごとに、他のグループと区別しやすいフレーズから順に並べる
+3. 必須部分（テンプレート・大項目・グループタイトル）の残りの予算を、
+   小項目とフレーズへ順番（ラウンドロビン）に割り当てる
+
+テキスト索引のキーワード候補（slide_index.keyword_candidates）を渡すと、
+カテゴリごとに「キーワード候補」として大項目の下に添える（必須部分として数える）。
+
+トークン数は日本語向けのローカル推定で見積もり、実際の値は
+Gemini 応答の usage_metadata でログに出す（log_usage）。
+"""
+
+import re
+import math
+import logging
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# マッチングプロンプト全体の既定トークン予算
+DEFAULT_TOKEN_BUDGET = 8000
+
+# 何割以上のグループに現れる行を定型文とみなすか
+BOILERPLATE_RATIO = 0.3
+
+# 1フレーズの最大文字数
+PHRASE_MAX_CHARS = 80
+
+_PAGE_NUMBER = re.compile(
+    r'^(?:[-‐–—]\s*)?(?:p\.?\s*|page\s*)?\d{1,4}(?:\s*[/／]\s*\d{1,4})?(?:\s*[-‐–—])?$',
+    re.IGNORECASE
+)
+_PHRASE_SPLIT = re.compile(r'[\n。！？!?]+')
+_DIGITS = re.compile(r'\d+')
+_CJK = re.compile(r'[　-ヿ㐀-鿿豈-﫿＀-￯]')
+
+
+# ============================================================================
+# Token Counting
+# ============================================================================
+def estimate_tokens(text: str) -> int:
+    """ローカルのトークン数推定（日本語は約1文字1トークン、英数字は約4文字1トークン）"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def log_usage(response, stats: Dict):
+    """応答の usage_metadata から実際のトークン数をログに出す"""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    output_tokens = getattr(usage, 'candidates_token_count', None)
+    stats['actual_prompt_tokens'] = prompt_tokens
+    stats['actual_output_tokens'] = output_tokens
+    logger.info(
+        f"プロンプトトークン: 推定 {stats.get('estimated_tokens')} / 実測 {prompt_tokens} "
+        f"(予算 {stats.get('budget')}), 出力トークン: {output_tokens}"
+    )
+
+
+# ============================================================================
+# Boilerplate & Phrase Ranking
+# ============================================================================
+def normalize_line(line: str) -> str:
+    return re.sub(r'\s+', ' ', line).strip()
+
+
+def line_key(line: str) -> str:
+    """定型文判定用のキー（数字の違いは同じ行とみなす: 「社外秘 - 12」等）"""
+    return _DIGITS.sub('#', line)
+
+
+def find_boilerplate(contents: Sequence[str], ratio: float = BOILERPLATE_RATIO) -> set:
+    """複数のグループに繰り返し現れる行を定型文として返す（line_key() の集合）"""
+    if len(contents) < 3:
+        return set()
+    df = Counter()
+    for content in contents:
+        df.update({line_key(normalize_line(line)) for line in content.split('\n') if line.strip()})
+    threshold = max(2, math.ceil(len(contents) * ratio))
+    return {line for line, n in df.items() if n >= threshold}
+
+
+def is_noise_line(line: str) -> bool:
+    """ページ番号や記号だけの行"""
+    return len(line) <= 2 or bool(_PAGE_NUMBER.match(line))
+
+
+def _bigrams(text: str) -> set:
+    text = text.replace(' ', '')
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def rank_group_phrases(groups: Sequence, boilerplate: Optional[set] = None) -> List[List[str]]:
+    """
+    グループごとに、他と区別しやすいフレーズ順のリストを返す
+    （文字バイグラムのIDFの平均でスコア付け）
+    """
+    contents = [g.content for g in groups]
+    if boilerplate is None:
+        boilerplate = find_boilerplate(contents)
+
+    group_phrases = []
+    for g, content in zip(groups, contents):
+        phrases = []
+        seen = {g.title}
+        for line in content.split('\n'):
+            line = normalize_line(line)
+            if not line or is_noise_line(line) or line_key(line) in boilerplate:
+                continue
+            for phrase in _PHRASE_SPLIT.split(line):
+                phrase = phrase.strip()[:PHRASE_MAX_CHARS]
+                if len(phrase) > 2 and phrase not in seen:
+                    seen.add(phrase)
+                    phrases.append(phrase)
+        group_phrases.append(phrases)
+
+    df = Counter()
+    for phrases in group_phrases:
+        df.update(set().union(*(_bigrams(p) for p in phrases)) if phrases else ())
+    n = max(1, len(groups))
+
+    ranked = []
+    for phrases in group_phrases:
+        def score(item):
+            grams = _bigrams(item[1])
+            if not grams:
+                return 0.0
+            return sum(math.log(n / df[gram]) + 1 for gram in grams) / len(grams)
+        order = sorted(enumerate(phrases), key=lambda item: (-score(item), item[0]))
+        ranked.append([p for _, p in order])
+    return ranked
+
+
+# ============================================================================
+# Prompt Builder
+# ============================================================================
+def build_matching_lists(categories: Sequence, groups: Sequence,
+                         render: Callable[[str, str], str],
+                         token_budget: int = DEFAULT_TOKEN_BUDGET,
+                         cat_label: str = 'PDF', grp_label: str = 'PPTX',
+                         hints: Optional[Dict[int, List[int]]] = None) -> Tuple[str, Dict]:
+    """
+    予算内に収まるカテゴリ一覧・グループ一覧を作り、render() でプロンプトにする
+
+    Args:
+        render: render(cat_list, grp_list) -> プロンプト全文
+        token_budget: プロンプト全体のトークン予算（推定値）
+        hints: {カテゴリNo: [groups の中の位置, ...]}。カテゴリの語を含むグループの候補
+
+    Returns:
+        (prompt, stats): stats には推定トークン数・除去した定型文の数などを入れる
+    """
+    boilerplate = find_boilerplate([g.content for g in groups])
+    phrases = rank_group_phrases(groups, boilerplate)
+
+    # 必須部分: テンプレート・大項目・グループタイトル
+    cat_heads = [f"{cat_label}{cat.no}: 【大項目】 {cat.main_category}" for cat in categories]
+    if hints:
+        cat_heads = [
+            head + (f"\n  キーワード候補: {', '.join(f'{grp_label}{g}' for g in hints[cat.no])}"
+                    if hints.get(cat.no) else "")
+            for head, cat in zip(cat_heads, categories)
+        ]
+    grp_heads = [f"{grp_label}{i}: {g.title}" for i, g in enumerate(groups)]
+    used = estimate_tokens(render("\n".join(cat_heads), "\n".join(grp_heads)))
+
+    cat_subs = [[] for _ in categories]
+    grp_body = [[] for _ in groups]
+
+    # 残りの予算を小項目とフレーズへラウンドロビンで割り当て（収まらない項目は飛ばす）
+    candidates = list(zip([cat.sub_items for cat in categories] + phrases, cat_subs + grp_body))
+    max_depth = max((len(items) for items, _ in candidates), default=0)
+    for depth in range(max_depth):
+        if used >= token_budget:
+            break
+        for items, chosen in candidates:
+            if depth >= len(items):
+                continue
+            cost = estimate_tokens(items[depth]) + (1 if chosen else 4)
+            if used + cost <= token_budget:
+                chosen.append(items[depth])
+                used += cost
+
+    cat_entries = []
+    for head, subs in zip(cat_heads, cat_subs):
+        cat_entries.append(head + (f"\n  小項目: {', '.join(subs)}" if subs else ""))
+    grp_entries = []
+    for head, body in zip(grp_heads, grp_body):
+        grp_entries.append(head + (f"\n  内容: {' / '.join(body)}" if body else ""))
+
+    prompt = render("\n".join(cat_entries), "\n".join(grp_entries))
+    stats = {
+        'budget': token_budget,
+        'estimated_tokens': estimate_tokens(prompt),
+        'boilerplate_lines': len(boilerplate),
+        'sub_items_used': sum(len(s) for s in cat_subs),
+        'phrases_used': sum(len(b) for b in grp_body),
+        'phrases_total': sum(len(p) for p in phrases),
+        'hints': sum(1 for cat in categories if hints and hints.get(cat.no)),
+    }
+    logger.info(
+        f"プロンプト構築: 推定 {stats['estimated_tokens']} トークン / 予算 {token_budget} "
+        f"(定型文 {stats['boilerplate_lines']} 行を除外, "
+        f"フレーズ {stats['phrases_used']}/{stats['phrases_total']}, 小項目 {stats['sub_items_used']})"
+    )
+    return prompt, stats
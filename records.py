@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+パイプライン共通のレコード型
+==========================
+審査基準カテゴリとスライドグループを、__slots__ を持つ軽量なクラスで表す。
+
+- スライド番号は array('H')（1スライド2バイト）
+- グループタイトルは sys.intern で共有
+- グループ内容は上限に達した時点で追記を止めるバッファ
+
+既存コードとの互換のため、辞書と同じキーでの読み出し
+（cat['No'], g['slides'], g.get('content') 等）にも対応する。
+"""
+
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+# グループ内容（AIマッチング用）の最大文字数
+CONTENT_LIMIT = 500
+
+
+class _Record:
+    """辞書互換の読み出しを提供する基底クラス"""
+    __slots__ = ()
+    _KEYS: Dict[str, str] = {}
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self._KEYS[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        attr = self._KEYS.get(key)
+        if attr is None:
+            return default
+        value = getattr(self, attr)
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return key in self._KEYS
+
+
+class Category(_Record):
+    """審査基準の大項目（No・大項目名・小項目）"""
+    __slots__ = ('no', 'main_category', 'sub_items')
+    _KEYS = {
+        'No': 'no',
+        'MainCategory': 'main_category',
+        'Category': 'main_category',
+        'SubItems': 'sub_items',
+    }
+
+    def __init__(self, no: int, main_category: str, sub_items: Optional[List[str]] = None):
+        self.no = no
+        self.main_category = main_category
+        self.sub_items = sub_items if sub_items is not None else []
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Category':
+        """{'No', 'MainCategory' or 'Category', 'SubItems'} 形式から生成"""
+        return cls(
+            int(data['No']),
+            str(data.get('MainCategory', data.get('Category', ''))),
+            list(data.get('SubItems', [])),
+        )
+
+    def to_dict(self) -> Dict:
+        return {'No': self.no, 'MainCategory': self.main_category, 'SubItems': list(self.sub_items)}
+
+    def __eq__(self, other):
+        if not isinstance(other, Category):
+            return NotImplemented
+        return (self.no, self.main_category, self.sub_items) == (other.no, other.main_category, other.sub_items)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Category(no={self.no!r}, main_category={self.main_category!r}, sub_items={self.sub_items!r})"
+
+
+class ContentBuffer:
+    """上限文字数に達したら追記をやめる文字列バッファ"""
+    __slots__ = ('_parts', '_size', 'limit')
+
+    def __init__(self, text: str = "", limit: int = CONTENT_LIMIT):
+        self.limit = limit
+        self._parts = []
+        self._size = 0
+        if text:
+            self._push(text)
+
+    def _push(self, text: str):
+        room = self.limit - self._size
+        if len(text) > room:
+            text = text[:room]
+        self._parts.append(text)
+        self._size += len(text)
+
+    @property
+    def full(self) -> bool:
+        return self._size >= self.limit
+
+    def append(self, text: str, sep: str = '\n'):
+        """sep + text を追記（上限到達後は何もしない）"""
+        if self._size >= self.limit:
+            return
+        self._push(sep)
+        if self._size < self.limit:
+            self._push(text)
+
+    def __str__(self):
+        if len(self._parts) > 1:
+            self._parts = [''.join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+
+class SlideGroup(_Record):
+    """タイトル付きスライドとそれに続くスライドのまとまり"""
+    __slots__ = ('title', 'slides', '_content')
+    _KEYS = {
+        'title': 'title',
+        'slides': 'slides',
+        'first_index': 'first_index',
+        'content': 'content',
+    }
+
+    def __init__(self, title: str, slides: Iterable[int] = (), content: str = "",
+                 content_limit: int = CONTENT_LIMIT):
+        self.title = sys.intern(title)
+        self.slides = array('H', slides)
+        self._content = ContentBuffer(content, content_limit)
+
+    @property
+    def first_index(self) -> int:
+        return self.slides[0]
+
+    @property
+    def content(self) -> str:
+        return str(self._content)
+
+    def add_slide(self, idx: int, content: str = ""):
+        """スライドを追加し、内容を上限まで累積"""
+        self.slides.append(idx)
+        self._content.append(content)
+
+    def to_dict(self) -> Dict:
+        return {
+            'title': self.title,
+            'slides': list(self.slides),
+            'first_index': self.first_index,
+            'content': self.content,
+        }
+
+    def __repr__(self):
+        return f"SlideGroup(title={self.title!r}, slides={list(self.slides)!r})"
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+AIリクエストのスケジューラ（レート制限対応）
+=========================================
+プロセス内のすべての generate_content 呼び出しを1つのキューに並べ、
+1分あたりのリクエスト数（RPM）とトークン数（TPM）のトークンバケットで送り出す。
+Streamlit では st.cache_resource で1つだけ作り、全セッションで共有する。
+
+- 優先度: 短いカテゴリ抽出（PRIORITY_EXTRACT）を長いマッチング（PRIORITY_MATCH）より先に送る
+- 公平性: 同じ優先度の中ではセッションごとに順番に送る（1人が大量に送っても他を待たせない）
+- 待ち状況: 待機中は on_wait(順番, 待機数) を呼ぶ（進捗表示用。送信開始時は順番 0）
+- 429: 応答が Retry-After を返した場合は全体を一時停止し、同じリクエストを送り直す
+
+バケットの容量は上限の BURST_FRACTION 分だけにし、残りを補充速度に回す。
+これで任意の60秒間に送る量が上限を超えない。
+"""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from typing import Callable, Optional
+
+from prompt_builder import estimate_tokens
+from run_record import prompt_text
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+PRIORITY_EXTRACT = 0
+PRIORITY_MATCH = 1
+
+# 既定の上限（環境変数 GEMINI_RPM / GEMINI_TPM で変更。0 は無制限）
+DEFAULT_RPM = 60
+DEFAULT_TPM = 250_000
+
+# 上限のうち一度に送れる量（バケットの容量）の割合
+BURST_FRACTION = 0.2
+# 応答のトークン数の見込み（実際の値は応答の usage_metadata で精算する）
+OUTPUT_TOKEN_ALLOWANCE = 1000
+# 429 のときに送り直す回数と、Retry-After が無い場合の待ち秒数
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF = 10.0
+
+# 待機中に状態を確認する間隔（秒）
+_POLL_SECONDS = 0.5
+
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """レート制限（429）のエラーなら待つべき秒数、それ以外は None"""
+    status = getattr(error, 'status', None) or getattr(error, 'code', None)
+    if status != 429 and type(error).__name__ != 'ResourceExhausted':
+        return None
+    return getattr(error, 'retry_after', None) or RATE_LIMIT_BACKOFF
+
+
+class _Bucket:
+    """上限 limit / 分 のトークンバケット（limit <= 0 は無制限）"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.capacity = max(1.0, limit * BURST_FRACTION)
+        self.rate = (limit - self.capacity) / 60.0 if limit > self.capacity else limit / 60.0
+        self.level = self.capacity
+
+    def refill(self, elapsed: float):
+        if self.limit > 0:
+            self.level = min(self.capacity, self.level + elapsed * self.rate)
+
+    def wait_time(self, amount: float) -> float:
+        if self.limit <= 0 or self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if self.limit > 0:
+            self.level -= amount
+
+    def give(self, amount: float):
+        if self.limit > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+
+# ============================================================================
+# Scheduler
+# ============================================================================
+class RequestScheduler:
+    """
+    RPM・TPM の上限を守ってリクエストを送り出すキュー（スレッドセーフ）
+
+    待機中のリクエストは (優先度, 順番, 到着順) の小さい順に送る。
+    順番はセッションごとに1つずつ進み、しばらく送っていなかったセッションは
+    現在の順番から並ぶ（開始時刻による公平キューイング）。
+    """
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM, clock: Callable[[], float] = time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._clock = clock
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiting = []      # heap: (優先度, 順番, 到着順)
+        self._turns = {}        # セッション -> 最後に割り当てた順番
+        self._turn = 0          # 最後に送り出したリクエストの順番
+        self._seq = itertools.count()
+        self.stats = {"granted": 0, "waited_seconds": 0.0, "rate_limited": 0}
+
+    @classmethod
+    def from_env(cls) -> 'RequestScheduler':
+        return cls(rpm=int(os.getenv("GEMINI_RPM", DEFAULT_RPM)), tpm=int(os.getenv("GEMINI_TPM", DEFAULT_TPM)))
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if elapsed > 0:
+            self._requests.refill(elapsed)
+            self._tokens.refill(elapsed)
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        if now < self._paused_until:
+            return self._paused_until - now
+        return max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+
+    def _position(self, key) -> int:
+        return sum(1 for other in self._waiting if other < key) + 1
+
+    def acquire(self, session_id: str, tokens: int, priority: int = PRIORITY_MATCH,
+                on_wait: Optional[Callable[[int, int], None]] = None):
+        """
+        送信できるまで待ち、RPM と見込みのトークン数を予約する
+
+        Args:
+            tokens: このリクエストの見込みトークン数（プロンプト＋応答）
+            on_wait: 待機中に順番が変わるたびに on_wait(順番, 待機数) を呼ぶ
+                     （待った後に送信できた時点で順番 0 として1回呼ぶ）
+        """
+        tokens = min(float(tokens), self._tokens.capacity) if self.tpm > 0 else 0.0
+        started = self._clock()
+        with self._cond:
+            turn = max(self._turns.get(session_id, 0) + 1, self._turn)
+            self._turns[session_id] = turn
+            key = (priority, turn, next(self._seq))
+            heapq.heappush(self._waiting, key)
+        reported = None
+        try:
+            while True:
+                # 順番はロックの中で記録だけし、on_wait（UIの更新等）はロックを放してから呼ぶ
+                # （遅いコールバックが他のセッションの割り当てを止めないように）
+                report = None
+                granted = False
+                with self._cond:
+                    now = self._clock()
+                    self._refill(now)
+                    wait = _POLL_SECONDS
+                    if self._waiting[0] == key:
+                        wait = self._wait_time(tokens, now)
+                        if wait <= 0:
+                            heapq.heappop(self._waiting)
+                            self._requests.take(1)
+                            self._tokens.take(tokens)
+                            self._turn = max(self._turn, turn)
+                            self._forget_idle_sessions()
+                            self.stats["granted"] += 1
+                            self.stats["waited_seconds"] += now - started
+                            self._cond.notify_all()
+                            granted = True
+                            if reported is not None:
+                                report = (0, len(self._waiting))
+                    if not granted:
+                        position = (self._position(key), len(self._waiting))
+                        if on_wait is not None and position != reported:
+                            reported = report = position
+                        else:
+                            self._cond.wait(min(wait, _POLL_SECONDS))
+                if on_wait is not None and report is not None:
+                    on_wait(*report)
+                if granted:
+                    return
+        except BaseException:
+            # 中断（セッションの再実行・停止など）された場合は列から外す
+            with self._cond:
+                if key in self._waiting:
+                    self._waiting.remove(key)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+            raise
+
+    def _forget_idle_sessions(self):
+        """現在の順番より前のセッションは、記録が無くても同じ順番になるため消す"""
+        if len(self._turns) > 256:
+            self._turns = {s: t for s, t in self._turns.items() if t >= self._turn}
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """予約した見込みのトークン数を、応答の実際のトークン数で精算する"""
+        if actual is None or self.tpm <= 0:
+            return
+        with self._cond:
+            self._refill(self._clock())
+            difference = min(float(estimated), self._tokens.capacity) - actual
+            if difference > 0:
+                self._tokens.give(difference)
+            else:
+                self._tokens.take(-difference)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """429 を受けた場合に全体の送信を止める"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+            self.stats["rate_limited"] += 1
+            self._cond.notify_all()
+
+    @property
+    def waiting(self) -> int:
+        with self._cond:
+            return len(self._waiting)
+
+
+# ============================================================================
+# Model Wrapper
+# ============================================================================
+def _usage_tokens(response) -> Optional[int]:
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    if prompt_tokens is None:
+        return None
+    return prompt_tokens + (getattr(usage, 'candidates_token_count', None) or 0)
+
+
+class ScheduledModel:
+    """generate_content を RequestScheduler の順番で送るラッパー"""
+
+    def __init__(self, model, scheduler: RequestScheduler, session_id: str,
+                 priority: int = PRIORITY_MATCH, on_wait: Optional[Callable[[int, int], None]] = None):
+        self._model = model
+        self._scheduler = scheduler
+        self._session_id = session_id
+        self._priority = priority
+        self._on_wait = on_wait
+
+    def with_priority(self, priority: int) -> 'ScheduledModel':
+        return ScheduledModel(self._model, self._scheduler, self._session_id, priority, self._on_wait)
+
+    def generate_content(self, prompt, **kwargs):
+        estimated = estimate_tokens(prompt_text(prompt)) + OUTPUT_TOKEN_ALLOWANCE
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self._scheduler.acquire(self._session_id, estimated, self._priority, self._on_wait)
+            try:
+                response = self._model.generate_content(prompt, **kwargs)
+            except Exception as e:
+                delay = rate_limit_delay(e)
+                if delay is None or attempt == RATE_LIMIT_RETRIES:
+                    raise
+                logger.warning(f"レート制限のため {delay:.1f} 秒待って再送します（{attempt + 1}/{RATE_LIMIT_RETRIES}）")
+                self._scheduler.pause(delay)
+                continue
+            self._scheduler.settle(estimated, _usage_tokens(response))
+            return response
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
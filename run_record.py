@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+実行記録と再実行（replay）
+========================
+1回の実行を機械可読なJSONとして記録する。
+
+- 入力ファイル（審査基準・テンプレート）のハッシュ
+- 抽出したカテゴリ、スライドグループ
+- AIへのプロンプトと生の応答
+- 最終的なマッピング（カスケードの場合は段階ごとの件数）、段階ごとの処理時間、出力のハッシュ
+
+記録した応答を返す ReplayModel を使えば、Gemini を呼ばずに同じ処理を
+再実行でき、マッピング・出力・処理時間を記録と比較できる。
+
+出力のハッシュはZIP内の各パーツの名前と内容から計算する
+（ZIPのタイムスタンプに左右されない）。
+"""
+
+import json
+import time
+import hashlib
+import logging
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from model_backend import _TokenCount
+from prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 記録形式を変えた場合はここを上げる
+RECORD_VERSION = 1
+
+
+# ============================================================================
+# Hashing
+# ============================================================================
+def file_sha256(path: Union[str, Path]) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def package_content_hash(path: Union[str, Path]) -> str:
+    """PPTX / ZIP の内容ハッシュ（パーツ名順に名前と中身を連結。タイムスタンプは含めない）"""
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(path) as zf:
+        for name in sorted(zf.namelist()):
+            digest.update(name.encode('utf-8') + b'\0')
+            with zf.open(name) as member:
+                for chunk in iter(lambda: member.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prompt_text(prompt) -> str:
+    """generate_content に渡したプロンプトを記録用の文字列にする（アップロードファイル等は型名のみ）"""
+    if isinstance(prompt, str):
+        return prompt
+    if isinstance(prompt, (list, tuple)):
+        return "\n".join(p if isinstance(p, str) else f"<{type(p).__name__}>" for p in prompt)
+    return f"<{type(prompt).__name__}>"
+
+
+# ============================================================================
+# Recorder
+# ============================================================================
+class RunRecorder:
+    """1回の実行の記録。start(段階名) から次の start() / finish() までを段階の処理時間とする"""
+
+    def __init__(self, command: str = "organize", options: Optional[Dict] = None):
+        self.data = {
+            "version": RECORD_VERSION,
+            "command": command,
+            "created_at": datetime.now().isoformat(timespec='seconds'),
+            "options": dict(options or {}),
+            "inputs": {"criteria": [], "template": None},
+            "categories": [],
+            "groups": [],
+            "calls": [],
+            "mapping": {},
+            "cascade": None,
+            "timings": {},
+            "output": None,
+        }
+        self._stage = None
+        self._started = 0.0
+
+    def start(self, stage: str):
+        self.finish()
+        self._stage = stage
+        self._started = time.perf_counter()
+
+    def finish(self):
+        if self._stage is not None:
+            timings = self.data["timings"]
+            timings[self._stage] = round(timings.get(self._stage, 0.0) + time.perf_counter() - self._started, 4)
+            self._stage = None
+
+    def add_criteria(self, path: Union[str, Path]):
+        self.data["inputs"]["criteria"].append({"path": str(path), "sha256": file_sha256(path)})
+
+    def set_template(self, path: Union[str, Path], sha256: Optional[str] = None):
+        self.data["inputs"]["template"] = {"path": str(path), "sha256": sha256 or file_sha256(path)}
+
+    def set_categories(self, categories):
+        self.data["categories"] = [cat.to_dict() for cat in categories]
+
+    def set_groups(self, groups):
+        self.data["groups"] = [
+            {"Title": g.title, "Slides": list(g.slides), "ContentSha256": text_sha256(g.content)}
+            for g in groups
+        ]
+
+    def set_mapping(self, mapping: Dict[int, int]):
+        self.data["mapping"] = {str(no): group for no, group in sorted(mapping.items())}
+
+    def set_cascade(self, stats: Dict):
+        self.data["cascade"] = stats
+
+    def add_call(self, prompt, response):
+        usage = getattr(response, 'usage_metadata', None)
+        text = prompt_text(prompt)
+        self.data["calls"].append({
+            "stage": self._stage,
+            "prompt": text,
+            "prompt_sha256": text_sha256(text),
+            "response": response.text,
+            "prompt_tokens": getattr(usage, 'prompt_token_count', None),
+            "output_tokens": getattr(usage, 'candidates_token_count', None),
+        })
+
+    def set_output(self, path: Union[str, Path]):
+        self.data["output"] = {"path": str(path), "content_sha256": package_content_hash(path)}
+
+    def save(self, path: Union[str, Path]):
+        Path(path).write_text(json.dumps(self.data, ensure_ascii=False, indent=2), encoding='utf-8')
+        logger.info(f"実行記録を保存しました: {path}")
+
+
+def load_record(path: Union[str, Path]) -> Dict:
+    data = json.loads(Path(path).read_text(encoding='utf-8'))
+    if data.get("version") != RECORD_VERSION:
+        raise ValueError(f"未対応の記録形式です: version={data.get('version')}")
+    return data
+
+
+# ============================================================================
+# Models
+# ============================================================================
+class RecordingModel:
+    """generate_content の呼び出しと応答を RunRecorder に記録するラッパー"""
+
+    def __init__(self, model, recorder: RunRecorder):
+        self._model = model
+        self._recorder = recorder
+
+    def generate_content(self, prompt, **kwargs):
+        response = self._model.generate_content(prompt, **kwargs)
+        self._recorder.add_call(prompt, response)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class _ReplayResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class ReplayModel:
+    """
+    記録した応答を返すモデル（Gemini を呼ばない）
+    プロンプトのハッシュが一致する応答を優先し、無ければ未使用の応答を記録順に返す
+
+    Args:
+        stage: 指定した段階で記録された応答だけを使う
+    """
+
+    def __init__(self, calls: List[Dict], stage: Optional[str] = None):
+        self._calls = [c for c in calls if stage is None or c.get("stage") == stage]
+        self._used = [False] * len(self._calls)
+        self.mismatches = 0
+
+    def generate_content(self, prompt, **kwargs):
+        prompt_hash = text_sha256(prompt_text(prompt))
+        candidates = [i for i, used in enumerate(self._used) if not used]
+        exact = [i for i in candidates if self._calls[i]["prompt_sha256"] == prompt_hash]
+        if exact:
+            idx = exact[0]
+        elif candidates:
+            idx = candidates[0]
+            self.mismatches += 1
+            logger.warning("プロンプトが記録と異なります（記録順の応答を使用）")
+        else:
+            raise RuntimeError("記録された応答が残っていません")
+        self._used[idx] = True
+        return _ReplayResponse(self._calls[idx]["response"])
+
+    def count_tokens(self, text):
+        """replay ではモデルを呼ばないため、ローカルの推定値を返す"""
+        return _TokenCount(estimate_tokens(prompt_text(text)))
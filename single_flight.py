@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+同一処理の相乗り（single-flight）
+==============================
+同じキーの処理が実行中であれば、新しく実行せずにその結果を待って共有する。
+チームで同じ審査基準を同じテンプレートに対して同時にアップロードした場合に、
+カテゴリ抽出・AIマッチング・保存を1回だけ行う。
+
+キーは (審査基準の内容のハッシュ, テンプレートのハッシュ, オプション) から作る。
+共有するのは実行中の処理だけで、完了した結果は保持しない
+（完了後の同じ要求は新しく実行する）。
+
+先に実行していた側が中断された場合（Streamlit の再実行・停止など）は、
+待っていた側のうち1つが改めて実行する。
+"""
+
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class _Abandoned(Exception):
+    """先に実行していた側が結果を出さずに中断した"""
+
+
+def flight_key(criteria: Sequence[bytes], template_key: str, options: Dict) -> str:
+    """
+    (審査基準の内容, テンプレート, オプション) のキー。審査基準はファイルの順序も区別する
+    テンプレートは内容の代わりに計算済みのハッシュ（template_digest_key）を受け取る
+    """
+    digest = hashlib.sha256()
+    for data in criteria:
+        digest.update(hashlib.sha256(data).digest())
+    digest.update(b'\0')
+    digest.update(template_key.encode('utf-8'))
+    digest.update(json.dumps(options, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """キーごとに実行中の処理を1つにまとめる（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Future] = {}
+        self.stats = {"executed": 0, "shared": 0}
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._flights
+
+    def do(self, key: str, fn: Callable[[], T], on_wait: Callable[[], None] = None) -> Tuple[T, bool]:
+        """
+        key の処理が実行中ならその結果を待ち、無ければ fn() を実行する
+
+        Args:
+            on_wait: 実行中の処理を待つ前に呼ぶ（進捗表示用）
+
+        Returns:
+            (result, shared): shared は他の実行の結果を共有した場合 True
+
+        Raises:
+            fn() の例外（待っていた側にも同じ例外を送る）
+        """
+        while True:
+            with self._lock:
+                future = self._flights.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._flights[key] = future
+
+            if leader:
+                return self._run(key, future, fn), False
+
+            if on_wait is not None:
+                on_wait()
+            try:
+                result = future.result()
+            except _Abandoned:
+                logger.info("先行の処理が中断されたため、改めて実行します")
+                continue
+            with self._lock:
+                self.stats["shared"] += 1
+            return result, True
+
+    def _run(self, key: str, future: Future, fn: Callable[[], T]) -> T:
+        try:
+            result = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.set_exception(_Abandoned())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                self.stats["executed"] += 1
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スライドのグループ化エンジン
+==========================
+スライドを1回だけ走査して、タイトル・最初のテキスト・レイアウト名・セクション名を集め、
+選んだ戦略でグループに分ける。
+
+戦略:
+    title      タイトルのあるスライドで新しいグループを始める（従来の動作）
+    structure  さらに次の区切りを考慮する
+               - PowerPoint のセクション（p14:sectionLst）が変わる位置で必ず区切る
+               - セクション見出し・タイトルスライド等のレイアウトで区切る
+               - 「〇〇（続き）」「〇〇 (2)」のように直前と同じタイトルは区切らない
+
+戦略は GROUPING_STRATEGIES に関数を登録して追加できる。
+グループ化の結果はスライドの sldId（slide_id）の列としてテンプレートごとにキャッシュする。
+"""
+
+import os
+import re
+import json
+import logging
+import tempfile
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from records import SlideGroup
+from pptx_utils import get_slide_title, get_slide_first_text, get_slide_full_content
+from slide_order import slide_sections
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+GROUPING_TITLE = 'title'
+GROUPING_STRUCTURE = 'structure'
+DEFAULT_GROUPING = GROUPING_STRUCTURE
+
+# 区切りとみなすレイアウト名（小文字で部分一致）
+HEADER_LAYOUT_KEYWORDS = ("section header", "title slide", "セクション見出し", "タイトル スライド", "中表紙", "扉")
+# 直前のタイトルと同じグループとみなす類似度
+TITLE_SIMILARITY = 0.92
+
+GROUP_CACHE_DIR = Path(__file__).parent / ".group_cache"
+
+# キャッシュ形式やルールを変えた場合はここを上げる（古いキャッシュを無効化）
+_CACHE_VERSION = 1
+
+# 「（続き）」「(2)」「2/3」などの続きを表す表記
+_CONTINUATION = re.compile(
+    r'[（(]\s*(?:続き|続|つづき|cont(?:inued|\.)?|\d+\s*(?:/\s*\d+)?)\s*[）)]|\s+\d+\s*/\s*\d+\s*$',
+    re.IGNORECASE
+)
+
+
+class SlideInfo(NamedTuple):
+    """グループ化に使うスライドの特徴"""
+    index: int
+    slide_id: int
+    title: str
+    first_text: str
+    layout: str
+    section: Optional[str]
+
+
+# ============================================================================
+# Features
+# ============================================================================
+def collect_slide_info(prs, start: int = 0) -> List[SlideInfo]:
+    """start 以降のスライドの特徴を1回の走査で集める"""
+    sections = slide_sections(prs)
+    infos = []
+    for idx, slide in enumerate(prs.slides):
+        if idx < start:
+            continue
+        title = get_slide_title(slide)
+        infos.append(SlideInfo(
+            index=idx,
+            slide_id=slide.slide_id,
+            title=title,
+            first_text="" if title else get_slide_first_text(slide),
+            layout=slide.slide_layout.name or "",
+            section=sections.get(str(slide.slide_id)),
+        ))
+    return infos
+
+
+def is_header_layout(layout_name: str) -> bool:
+    name = layout_name.lower()
+    return any(keyword in name for keyword in HEADER_LAYOUT_KEYWORDS)
+
+
+def normalize_title(title: str) -> str:
+    """続きを表す表記・空白を除いたタイトル"""
+    return re.sub(r'\s+', '', _CONTINUATION.sub('', title))
+
+
+def similar_titles(a: str, b: str, threshold: float = TITLE_SIMILARITY) -> bool:
+    """同じ内容の続きのスライドとみなせるタイトルか"""
+    a, b = normalize_title(a), normalize_title(b)
+    if not a or not b:
+        return False
+    return a == b or SequenceMatcher(None, a, b).ratio() >= threshold
+
+
+# ============================================================================
+# Strategies
+# ============================================================================
+def _fallback_title(info: SlideInfo) -> str:
+    return info.first_text[:50] if info.first_text else f"[Untitled {info.index}]"
+
+
+def group_by_title(infos: Sequence[SlideInfo]) -> List[Tuple[str, List[SlideInfo]]]:
+    """タイトル付きスライドを先頭にグループ化（タイトルの無いスライドは直前のグループへ）"""
+    groups = []
+    for info in infos:
+        if info.title or not groups:
+            groups.append((info.title or _fallback_title(info), [info]))
+        else:
+            groups[-1][1].append(info)
+    return groups
+
+
+def group_by_structure(infos: Sequence[SlideInfo]) -> List[Tuple[str, List[SlideInfo]]]:
+    """セクション・レイアウト・タイトルの類似度を考慮してグループ化"""
+    groups = []
+    last_title = ""
+    for info in infos:
+        if not groups:
+            boundary = True
+        elif info.section != groups[-1][1][-1].section:
+            boundary = True
+        elif is_header_layout(info.layout):
+            boundary = True
+        elif info.title:
+            boundary = not similar_titles(info.title, last_title)
+        else:
+            boundary = False
+
+        if boundary:
+            groups.append((info.title or _fallback_title(info), [info]))
+        else:
+            groups[-1][1].append(info)
+        if info.title:
+            last_title = info.title
+        elif boundary:
+            last_title = ""
+    return groups
+
+
+GROUPING_STRATEGIES: Dict[str, Callable[[Sequence[SlideInfo]], List[Tuple[str, List[SlideInfo]]]]] = {
+    GROUPING_TITLE: group_by_title,
+    GROUPING_STRUCTURE: group_by_structure,
+}
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+def _cache_file(cache_key: str, strategy: str, cache_dir: Path) -> Path:
+    return Path(cache_dir) / f"v{_CACHE_VERSION}_{cache_key[:32]}_{strategy}.json"
+
+
+def _load_cached(path: Path, prs, start: int) -> Optional[List[Tuple[str, List[int]]]]:
+    """キャッシュした [(title, [slide_id, ...])] を現在のスライド番号に変換（合わなければ None）"""
+    try:
+        cached = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    # sldIdLst の要素だけを読む（スライド本体は開かない）
+    positions = {int(sld_id.get('id')): idx for idx, sld_id in enumerate(prs.slides._sldIdLst)}
+    groups = []
+    seen = 0
+    for title, slide_ids in cached:
+        indices = [positions.get(slide_id, -1) for slide_id in slide_ids]
+        if any(idx < start for idx in indices):
+            return None
+        groups.append((title, indices))
+        seen += len(indices)
+    if seen != len(positions) - start:
+        return None
+    return groups
+
+
+# ============================================================================
+# Entry Point
+# ============================================================================
+def group_slides(prs, start: int = 0, strategy: str = DEFAULT_GROUPING,
+                 digests: Optional[Dict[int, str]] = None, cache_key: Optional[str] = None,
+                 cache_dir: Path = GROUP_CACHE_DIR) -> List[SlideGroup]:
+    """
+    start 以降のスライドを strategy でグループ化
+
+    Args:
+        digests: {slide_id: 要約}（template_digest）。無いスライドは本文を読む
+        cache_key: テンプレートのハッシュ。指定するとグループ化の結果をキャッシュする
+    """
+    if strategy not in GROUPING_STRATEGIES:
+        raise ValueError(f"未対応のグループ化方法: {strategy}")
+
+    cache_path = _cache_file(cache_key, strategy, cache_dir) if cache_key else None
+    layout = _load_cached(cache_path, prs, start) if cache_path is not None else None
+
+    if layout is None:
+        infos = collect_slide_info(prs, start)
+        grouped = GROUPING_STRATEGIES[strategy](infos)
+        layout = [(title, [info.index for info in members]) for title, members in grouped]
+        if cache_path is not None:
+            tmp_path = None
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                # 準備のスレッドが全方法を書く間も各セッションが読むため、別名の一時ファイルに
+                # 書き終えてから置き換える
+                fd, tmp_path = tempfile.mkstemp(suffix='.json', dir=cache_path.parent)
+                with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+                    json.dump([(title, [info.slide_id for info in members]) for title, members in grouped],
+                              tmp, ensure_ascii=False)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                logger.warning(f"グループ化の結果をキャッシュできません: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+        logger.info(f"スライドのグループ化（{strategy}）: {len(layout)} グループ")
+    else:
+        logger.info(f"スライドのグループ化（{strategy}, キャッシュ）: {len(layout)} グループ")
+
+    # 内容: 要約があればそれを使い、無いスライドだけ本文を読む
+    contents = {}
+    need_text = set()
+    sld_ids = list(prs.slides._sldIdLst)
+    for _, indices in layout:
+        for idx in indices:
+            slide_id = int(sld_ids[idx].get('id'))
+            if digests is not None and slide_id in digests:
+                contents[idx] = digests[slide_id]
+            else:
+                need_text.add(idx)
+    if need_text:
+        for idx, slide in enumerate(prs.slides):
+            if idx in need_text:
+                contents[idx] = get_slide_full_content(slide)
+
+    groups = []
+    for title, indices in layout:
+        group = SlideGroup(title, (indices[0],), contents[indices[0]])
+        for idx in indices[1:]:
+            group.add_slide(idx, contents[idx])
+        groups.append(group)
+    return groups
+
+
+def offset_groups(groups: Sequence[SlideGroup], offset: int) -> List[SlideGroup]:
+    """
+    スライド番号を offset だけずらしたグループ
+    （目次を入れる前のテンプレートでグループ化し、目次の複製で増えた枚数だけずらす場合に使う）
+    """
+    if not offset:
+        return list(groups)
+    return [SlideGroup(g.title, [idx + offset for idx in g.slides], g.content) for g in groups]
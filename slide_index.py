@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+テンプレートのテキスト索引（どのスライドに書いてあるかの検索）
+========================================================
+テンプレートの全スライドのテキストを、シェイプ単位（テキストボックス・表・グループ内の
+シェイプ・ノート）で集め、文字と文字バイグラムの転置索引を作る。
+
+    index = load_slide_index(pptx_bytes)
+    index.search("実施体制")                       # [Hit(slide=12, shape='表 3', kind='table', ...)]
+    keyword_candidates(index, categories, groups)  # {No: [グループ番号, ...]}
+
+検索は語のバイグラムの出現リストを短い順に積集合して候補を絞り、正規化した本文に
+語が含まれるかを確かめる（全シェイプの走査はしない）。空白区切りの複数語は、
+すべての語が同じスライドにある場合だけ返す。
+
+索引はテンプレートの保存時（template_warmup）に作り、テンプレートのハッシュごとに
+.slide_index_cache に保存する。スライドは sldId（slide_id）とテンプレートでの位置で持つ。
+"""
+
+import io
+import os
+import re
+import json
+import logging
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+from pptx_utils import get_slide_title
+from template_digest import template_digest_key
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+SLIDE_INDEX_CACHE_DIR = Path(__file__).parent / ".slide_index_cache"
+# メモリに保持する索引の数
+MEMORY_CACHE_SIZE = 4
+# 検索結果の抜粋の前後の文字数
+SNIPPET_CHARS = 30
+# キーワード候補に使う語（漢字・カタカナ・英数字の2文字以上の並び）
+_KEYWORD = re.compile(r'[一-鿿々゠-ヿA-Za-z0-9]{2,}')
+
+KIND_TEXT = 'text'
+KIND_TABLE = 'table'
+KIND_GROUP = 'group'
+KIND_NOTES = 'notes'
+
+# キャッシュ形式や正規化を変えた場合はここを上げる（古いキャッシュを無効化）
+_CACHE_VERSION = 1
+
+_memory: 'OrderedDict[str, SlideIndex]' = OrderedDict()
+_lock = threading.Lock()
+
+
+class Hit(NamedTuple):
+    """検索で見つかったシェイプ"""
+    slide: int          # テンプレートでのスライド番号（1始まり）
+    slide_id: int
+    title: str
+    shape: str
+    kind: str
+    snippet: str
+
+
+def normalize(text: str) -> str:
+    """照合用の文字列（全角・半角を揃え、小文字にし、空白を除く）"""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', text).lower())
+
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _grams(text: str) -> set:
+    """索引に載せる語（1文字の検索にも使えるよう、文字とバイグラム）"""
+    return set(text) | _bigrams(text)
+
+
+# ============================================================================
+# Extraction
+# ============================================================================
+def _table_text(table) -> str:
+    cells = []
+    for row in table.rows:
+        for cell in row.cells:
+            text = cell.text.strip()
+            # 結合セルは同じ内容が続くため1回だけ数える
+            if text and (not cells or cells[-1] != text):
+                cells.append(text)
+    return "\n".join(cells)
+
+
+def _walk_shapes(shapes, in_group: bool = False) -> Iterator[Tuple[str, str, str]]:
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from _walk_shapes(shape.shapes, in_group=True)
+        elif getattr(shape, 'has_table', False) and shape.has_table:
+            yield shape.name, KIND_TABLE, _table_text(shape.table)
+        elif shape.has_text_frame:
+            yield shape.name, KIND_GROUP if in_group else KIND_TEXT, shape.text_frame.text
+
+
+def shape_texts(slide) -> List[Tuple[str, str, str]]:
+    """スライドのシェイプごとのテキスト [(シェイプ名, 種類, テキスト), ...]（ノートを含む）"""
+    texts = [(name, kind, text.strip()) for name, kind, text in _walk_shapes(slide.shapes)]
+    if slide.has_notes_slide:
+        notes = slide.notes_slide.notes_text_frame
+        if notes is not None:
+            texts.append(("ノート", KIND_NOTES, notes.text.strip()))
+    return [item for item in texts if item[2]]
+
+
+# ============================================================================
+# Index
+# ============================================================================
+class SlideIndex:
+    """シェイプ単位のテキストの転置索引（文字・文字バイグラム → シェイプ番号）"""
+
+    def __init__(self, slides: Sequence, shapes: Sequence, postings: Optional[Dict[str, List[int]]] = None):
+        # slides: [(slide_id, title), ...]（テンプレートの順）
+        # shapes: [(スライドの位置, シェイプ名, 種類, テキスト), ...]
+        self.slides = [(int(slide_id), title) for slide_id, title in slides]
+        self.shapes = [tuple(shape) for shape in shapes]
+        self._normalized = [normalize(shape[3]) for shape in self.shapes]
+        if postings is None:
+            postings = {}
+            for i, text in enumerate(self._normalized):
+                for gram in _grams(text):
+                    postings.setdefault(gram, []).append(i)
+        self.postings = postings
+        # 積集合に使う集合（検索で使った語の分だけ作る）
+        self._sets: Dict[str, frozenset] = {}
+
+    @classmethod
+    def build(cls, prs) -> 'SlideIndex':
+        slides = []
+        shapes = []
+        for position, slide in enumerate(prs.slides):
+            slides.append((slide.slide_id, get_slide_title(slide)))
+            for name, kind, text in shape_texts(slide):
+                shapes.append((position, name, kind, text))
+        return cls(slides, shapes)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    # ------------------------------------------------------------------
+    def find(self, term: str) -> List[int]:
+        """term を含むシェイプの番号（昇順）"""
+        term = normalize(term)
+        if not term:
+            return []
+        if len(term) == 1:
+            return list(self.postings.get(term, []))
+        grams = sorted(_bigrams(term), key=lambda gram: len(self.postings.get(gram, [])))
+        found = self._posting_set(grams[0])
+        for gram in grams[1:]:
+            if not found:
+                return []
+            found = found & self._posting_set(gram)
+        # バイグラムがすべて含まれても、並びが違う場合があるため本文で確かめる
+        return [i for i in sorted(found) if term in self._normalized[i]]
+
+    def _posting_set(self, gram: str) -> frozenset:
+        found = self._sets.get(gram)
+        if found is None:
+            found = self._sets[gram] = frozenset(self.postings.get(gram, ()))
+        return found
+
+    def search(self, query: str, limit: Optional[int] = 50) -> List[Hit]:
+        """
+        空白区切りの語をすべて含むスライドの、語を含むシェイプ（スライド順）
+
+        Args:
+            limit: 返す件数の上限（None の場合はすべて）
+        """
+        terms = [term for term in query.split() if normalize(term)]
+        if not terms:
+            return []
+        matches = [self.find(term) for term in terms]
+        if len(matches) == 1:
+            hit_shapes = matches[0]
+        else:
+            slides = set.intersection(*({self.shapes[i][0] for i in found} for found in matches))
+            hit_shapes = sorted({i for found in matches for i in found if self.shapes[i][0] in slides})
+        hits = []
+        for i in hit_shapes[:limit]:
+            position, name, kind, text = self.shapes[i]
+            slide_id, title = self.slides[position]
+            hits.append(Hit(position + 1, slide_id, title, name, kind, snippet(text, terms)))
+        return hits
+
+    def slide_hits(self, terms: Sequence[str]) -> Dict[int, set]:
+        """{スライドの位置: 含まれる語の集合}（いずれかの語を含むスライドだけ）"""
+        found: Dict[int, set] = {}
+        for term in terms:
+            for i in self.find(term):
+                found.setdefault(self.shapes[i][0], set()).add(term)
+        return found
+
+    # ------------------------------------------------------------------
+    def to_dict(self) -> Dict:
+        return {"slides": self.slides, "shapes": self.shapes, "postings": self.postings}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SlideIndex':
+        return cls(data["slides"], data["shapes"], data["postings"])
+
+
+def snippet(text: str, terms: Sequence[str], chars: int = SNIPPET_CHARS) -> str:
+    """
+    最初に見つかった語の前後を切り出した抜粋（改行は空白にする）
+    切り出す範囲だけを整形する。語が原文のままでは見つからない場合（全角・半角の違い等）は先頭
+    """
+    lowered = text.lower()
+    start, end = 0, chars * 2
+    for term in terms:
+        pos = lowered.find(term.lower())
+        if pos >= 0:
+            start, end = max(0, pos - chars), pos + len(term) + chars
+            break
+    body = re.sub(r'\s+', ' ', text[start:end]).strip()
+    return ("…" if start else "") + body + ("…" if end < len(text) else "")
+
+
+# ============================================================================
+# Candidate Generation
+# ============================================================================
+def category_keywords(category) -> List[str]:
+    """カテゴリ（大項目＋小項目）の検索語（漢字・カタカナ・英数字の並び。重複なし）"""
+    text = unicodedata.normalize('NFKC', " ".join([category.main_category] + list(category.sub_items)))
+    return list(dict.fromkeys(_KEYWORD.findall(text)))
+
+
+def keyword_candidates(index: SlideIndex, categories: Sequence, groups: Sequence,
+                       offset: int = 0, limit: int = 3) -> Dict[int, List[int]]:
+    """
+    カテゴリの検索語を多く含むグループを候補として返す {No: [グループ番号, ...]}
+    語は文字数で重み付けし、グループ内のどこか1枚に含まれれば数える
+    マッチングでは AI のプロンプトに候補として添え、local 照合ではスコアを上げる（match_cascade）
+
+    Args:
+        offset: グループのスライド番号とテンプレートでの位置の差（目次の複製で増えた枚数）
+    """
+    slide_group = {idx - offset: g for g, group in enumerate(groups) for idx in group.slides}
+    candidates = {}
+    for cat in categories:
+        scores: Dict[int, set] = {}
+        for position, terms in index.slide_hits(category_keywords(cat)).items():
+            group = slide_group.get(position)
+            if group is not None:
+                scores.setdefault(group, set()).update(terms)
+        ranked = sorted(scores, key=lambda g: (-sum(len(term) for term in scores[g]), g))
+        candidates[cat.no] = ranked[:limit]
+    return candidates
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+def load_slide_index(pptx_bytes: bytes, prs=None,
+                     cache_dir: Optional[Path] = SLIDE_INDEX_CACHE_DIR,
+                     key: Optional[str] = None) -> SlideIndex:
+    """
+    テンプレートの索引を返す（メモリ・ディスクのキャッシュがあれば作り直さない）
+
+    Args:
+        prs: 読み込み済みのテンプレート（未変更のもの）。省略時は pptx_bytes から読み込む
+        cache_dir: キャッシュの保存先（None の場合はメモリだけ）
+        key: 計算済みの template_digest_key(pptx_bytes)（他のキャッシュと共有する場合）
+    """
+    key = key or template_digest_key(pptx_bytes)
+    with _lock:
+        index = _memory.get(key)
+        if index is not None:
+            _memory.move_to_end(key)
+            return index
+
+    cache_file = Path(cache_dir) / f"v{_CACHE_VERSION}_{key[:32]}.json" if cache_dir else None
+    index = None
+    if cache_file is not None and cache_file.exists():
+        try:
+            index = SlideIndex.from_dict(json.loads(cache_file.read_text(encoding='utf-8')))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"テキスト索引のキャッシュを読めません: {e}")
+            index = None
+
+    if index is None:
+        if prs is None:
+            from pptx import Presentation
+            prs = Presentation(io.BytesIO(pptx_bytes))
+        index = SlideIndex.build(prs)
+        logger.info(f"テキスト索引を作成: {len(index.slides)} スライド, {len(index)} シェイプ, "
+                    f"バイグラム {len(index.postings)}")
+        if cache_file is not None:
+            tmp_path = None
+            try:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                # 一時ファイルは書き込みごとに別名にし、同時に書くプロセスと衝突させない
+                fd, tmp_path = tempfile.mkstemp(suffix='.json', dir=cache_file.parent)
+                with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+                    json.dump(index.to_dict(), tmp, ensure_ascii=False)
+                # 書きかけのファイルをキャッシュとして読まないよう、書き終えてから置き換える
+                os.replace(tmp_path, cache_file)
+            except OSError as e:
+                logger.warning(f"テキスト索引をキャッシュできません: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+    with _lock:
+        _memory[key] = index
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+    return index
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スライドの並べ替え
+================
+sldIdLst を置換1回で並べ替える。
+要素を1つずつ remove/append する方法（lxml ではリストが長いほど遅くなる）を使わない。
+
+未使用スライドは、そのまま末尾に残す／削除する／非表示にして
+「未使用スライド」セクションへまとめる、のいずれかを選べる。
+削除する場合は、残ったスライドから使われなくなったレイアウト・マスターも外し、
+それらだけが参照していた画像・メディアを出力に含めない。
+"""
+
+import uuid
+import logging
+from typing import List, Optional, Sequence
+
+from pptx.oxml.ns import qn
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+logger = logging.getLogger(__name__)
+
+# 未使用スライドの扱い
+UNMATCHED_KEEP = 'keep'    # 末尾にそのまま残す（従来の動作）
+UNMATCHED_DROP = 'drop'    # 出力から削除する
+UNMATCHED_HIDE = 'hide'    # 非表示にして専用セクションへまとめる
+UNMATCHED_MODES = (UNMATCHED_KEEP, UNMATCHED_DROP, UNMATCHED_HIDE)
+
+UNUSED_SECTION_NAME = "未使用スライド"
+
+_P14_NS = 'http://schemas.microsoft.com/office/powerpoint/2010/main'
+_SECTION_EXT_URI = '{521415D9-36F7-43E2-AB2F-B90AF26B5E84}'
+
+
+def validate_permutation(order: Sequence[int], count: int):
+    """order が 0..count-1 の全単射（重複・欠落なし）であることを確認"""
+    if len(order) != count:
+        raise ValueError(f"並び順の件数がスライド数と一致しません: {len(order)} != {count}")
+    seen = bytearray(count)
+    for idx in order:
+        if not 0 <= idx < count:
+            raise ValueError(f"範囲外のスライド番号: {idx}")
+        if seen[idx]:
+            raise ValueError(f"スライド番号が重複しています: {idx}")
+        seen[idx] = 1
+
+
+# ============================================================================
+# Sections (p14:sectionLst)
+# ============================================================================
+def _section_list(prs):
+    """presentation.xml の p14:sectionLst（無ければ None）"""
+    for ext in prs.part._element.findall(f"{qn('p:extLst')}/{qn('p:ext')}"):
+        if ext.get('uri') == _SECTION_EXT_URI:
+            return ext.find(f'{{{_P14_NS}}}sectionLst')
+    return None
+
+
+def slide_sections(prs) -> dict:
+    """{sldId の id: セクション名}"""
+    section_lst = _section_list(prs)
+    if section_lst is None:
+        return {}
+    names = {}
+    for section in section_lst.iterfind(f'{{{_P14_NS}}}section'):
+        for sld_id in section.iterfind(f'{{{_P14_NS}}}sldIdLst/{{{_P14_NS}}}sldId'):
+            names[sld_id.get('id')] = section.get('name')
+    return names
+
+
+def _ensure_section_list(prs):
+    section_lst = _section_list(prs)
+    if section_lst is not None:
+        return section_lst
+    prs_elm = prs.part._element
+    ext_lst = prs_elm.find(qn('p:extLst'))
+    if ext_lst is None:
+        ext_lst = prs_elm.makeelement(qn('p:extLst'), {})
+        prs_elm.append(ext_lst)
+    ext = ext_lst.makeelement(qn('p:ext'), {'uri': _SECTION_EXT_URI})
+    ext_lst.insert(0, ext)
+    section_lst = ext.makeelement(f'{{{_P14_NS}}}sectionLst', nsmap={'p14': _P14_NS})
+    ext.append(section_lst)
+    return section_lst
+
+
+def _rebuild_sections(prs, sld_ids: List, hidden_ids: List, names: dict):
+    """
+    並べ替え後の順序でセクションを作り直す
+    セクションは連続した範囲である必要があるため、名前が切り替わるたびに新しいセクションにする
+    """
+    if not names and not hidden_ids:
+        return
+    section_lst = _ensure_section_list(prs)
+    for child in list(section_lst):
+        section_lst.remove(child)
+
+    def add_section(name, ids):
+        # 同じ並びなら同じ出力になるよう、セクションIDは名前と先頭スライドから決める
+        section_id = uuid.uuid5(uuid.NAMESPACE_OID, f"{name}:{ids[0] if ids else ''}")
+        section = section_lst.makeelement(
+            f'{{{_P14_NS}}}section', {'name': name, 'id': '{' + str(section_id).upper() + '}'}
+        )
+        lst = section.makeelement(f'{{{_P14_NS}}}sldIdLst', {})
+        for sid in ids:
+            lst.append(lst.makeelement(f'{{{_P14_NS}}}sldId', {'id': sid}))
+        section.append(lst)
+        section_lst.append(section)
+
+    default_name = next(iter(names.values()), "既定のセクション")
+    run_name, run_ids = None, []
+    for sld_id in sld_ids:
+        name = names.get(sld_id.get('id'), run_name or default_name)
+        if run_ids and name != run_name:
+            add_section(run_name, run_ids)
+            run_ids = []
+        run_name = name
+        run_ids.append(sld_id.get('id'))
+    if run_ids:
+        add_section(run_name, run_ids)
+    if hidden_ids:
+        add_section(UNUSED_SECTION_NAME, hidden_ids)
+
+
+# ============================================================================
+# Prune
+# ============================================================================
+def prune_unused_layouts(prs) -> int:
+    """
+    残ったスライドが参照しないスライドレイアウト（と、レイアウトが全て外れたマスター）を外す
+
+    マスターには最低1つのレイアウトが必要なため、使われていないマスターは丸ごと外す。
+    ただしマスターは最低1つ残す。パーツ自体は保存時にリレーションから辿れなくなった時点で
+    書き出されなくなる（テーマ・画像・メディアも同様）。
+
+    Returns:
+        int: 外したレイアウト数
+    """
+    used_layouts = set()
+    for slide in prs.slides:
+        used_layouts.add(slide.part.part_related_by(RT.SLIDE_LAYOUT))
+
+    removed = 0
+    unused_masters = []
+    for master in prs.slide_masters:
+        master_part = master.part
+        layout_id_lst = master._element.get_or_add_sldLayoutIdLst()
+        layout_ids = list(layout_id_lst)
+        kept = [lid for lid in layout_ids if master_part.related_part(lid.rId) in used_layouts]
+        if not kept:
+            unused_masters.append(master)
+            continue
+        for layout_id in layout_ids:
+            if layout_id not in kept:
+                layout_id_lst.remove(layout_id)
+                master_part.drop_rel(layout_id.rId)
+                removed += 1
+
+    # 使われていないマスターを外す（全マスターが未使用なら先頭を残す）
+    if len(unused_masters) == len(prs.slide_masters):
+        unused_masters = unused_masters[1:]
+    if unused_masters:
+        master_parts = {m.part for m in unused_masters}
+        master_id_lst = prs.part._element.sldMasterIdLst
+        for master_id in list(master_id_lst):
+            if prs.part.related_part(master_id.rId) in master_parts:
+                master_id_lst.remove(master_id)
+                prs.part.drop_rel(master_id.rId)
+        removed += sum(len(m.slide_layouts) for m in unused_masters)
+
+    if removed or unused_masters:
+        logger.info(f"  未使用のレイアウト {removed} 個（マスター {len(unused_masters)} 個）を削除しました")
+    return removed
+
+
+# ============================================================================
+# Reorder
+# ============================================================================
+def reorder_slides(prs, order: Sequence[int], unmatched_start: Optional[int] = None,
+                   unmatched: str = UNMATCHED_KEEP) -> int:
+    """
+    sldIdLst を order の順に置換1回で並べ替える
+
+    Args:
+        order: 全スライドの新しい並び（0..n-1 の全単射）
+        unmatched_start: order 内で未使用スライドが始まる位置（省略時は未使用なし）
+        unmatched: 未使用スライドの扱い（keep / drop / hide）
+            drop の場合は使われなくなったレイアウト・マスターも外す
+
+    Returns:
+        int: 出力に残るスライド数
+    """
+    if unmatched not in UNMATCHED_MODES:
+        raise ValueError(f"未対応の未使用スライドモード: {unmatched}")
+
+    sld_id_lst = prs.slides._sldIdLst
+    original = list(sld_id_lst)
+    validate_permutation(order, len(original))
+
+    if unmatched_start is None:
+        unmatched_start = len(order)
+    kept = [original[idx] for idx in order[:unmatched_start]]
+    rest = [original[idx] for idx in order[unmatched_start:]]
+    names = slide_sections(prs)
+
+    if unmatched == UNMATCHED_DROP:
+        sld_id_lst[:] = kept
+        for sld_id in rest:
+            # リレーションを外すと、保存時にそのスライドと参照元の無くなった画像等は書き出されない
+            prs.part.drop_rel(sld_id.rId)
+        _rebuild_sections(prs, kept, [], names)
+        if rest:
+            logger.info(f"  未使用スライド {len(rest)} 枚を削除しました")
+        prune_unused_layouts(prs)
+        return len(kept)
+
+    sld_id_lst[:] = kept + rest
+    if unmatched == UNMATCHED_HIDE and rest:
+        for sld_id in rest:
+            prs.part.related_part(sld_id.rId)._element.set('show', '0')
+        _rebuild_sections(prs, kept, [s.get('id') for s in rest], names)
+        logger.info(f"  未使用スライド {len(rest)} 枚を非表示にし「{UNUSED_SECTION_NAME}」セクションへ移動しました")
+    else:
+        _rebuild_sections(prs, kept + rest, [], names)
+    return len(kept) + len(rest)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+カテゴリごとの分割出力
+===================
+マッチ結果を (pdf_no, グループ) ごとに1つのPPTXへ分け、ZIPにまとめる。
+
+各デッキは表紙・目次とそのグループのスライドだけを残し、他のスライドと
+使われなくなったレイアウトを外して保存する。画像・メディアは元のZIPのバイト列を
+そのまま書き戻すため再エンコードは行わない。
+
+デッキの生成は複数プロセスで並列に行い、できたものから順にZIPへ書き込む
+（ZIP全体をメモリに持たない）。PPTX自体が圧縮済みのため、ZIPは無圧縮で格納する。
+"""
+
+import io
+import os
+import re
+import logging
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import BinaryIO, Iterator, List, Sequence, Tuple, Union
+
+from pptx import Presentation
+
+from slide_order import UNMATCHED_DROP, reorder_slides
+
+logger = logging.getLogger(__name__)
+
+# 並列に生成するデッキ数の上限（1プロセスごとに元PPTXを1つ読み込む）
+SPLIT_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+# ファイル名に使うカテゴリ名の最大文字数
+FILE_TITLE_CHARS = 40
+
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def deck_file_name(pdf_no: int, category_name: str) -> str:
+    """分割デッキのファイル名（例: 03_実施体制.pptx）"""
+    title = _UNSAFE_CHARS.sub('_', category_name).strip('_')[:FILE_TITLE_CHARS]
+    return f"{pdf_no:02d}_{title or 'category'}.pptx"
+
+
+def build_deck(source_path: str, keep: Sequence[int]) -> bytes:
+    """
+    source_path のうち keep のスライドだけを、この順で残したPPTXを作る
+    （ワーカープロセスで実行されるため、モジュールの最上位に置く）
+    """
+    prs = Presentation(source_path)
+    keep_set = set(keep)
+    order = list(keep) + [i for i in range(len(prs.slides)) if i not in keep_set]
+    reorder_slides(prs, order, len(keep), unmatched=UNMATCHED_DROP)
+    output = io.BytesIO()
+    prs.save(output)
+    return output.getvalue()
+
+
+def iter_split_decks(source_path: str, fixed_slides: int, matched_list: Sequence,
+                     max_workers: int = SPLIT_MAX_WORKERS) -> Iterator[Tuple[str, bytes]]:
+    """
+    マッチしたグループごとのデッキを、できた順に (ファイル名, バイト列) で返す
+
+    Args:
+        source_path: 目次・タイトル更新済みのPPTX
+        fixed_slides: 各デッキの先頭に残す表紙・目次の枚数
+        matched_list: [(pdf_no, category_name, SlideGroup), ...]
+    """
+    head = list(range(fixed_slides))
+    with ProcessPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {
+            pool.submit(build_deck, source_path, head + list(group.slides)):
+                deck_file_name(pdf_no, category_name)
+            for pdf_no, category_name, group in matched_list
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def write_split_zip(source_path: str, fixed_slides: int, matched_list: Sequence,
+                    zip_file: Union[str, BinaryIO], max_workers: int = SPLIT_MAX_WORKERS,
+                    progress_callback=None) -> List[str]:
+    """
+    分割デッキをZIPに書き込む
+
+    Args:
+        progress_callback: progress_callback(完了数, 総数) をデッキごとに呼ぶ
+
+    Returns:
+        List[str]: ZIP内のファイル名（ファイル名順）
+    """
+    names = []
+    total = len(matched_list)
+    with zipfile.ZipFile(zip_file, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for name, data in iter_split_decks(source_path, fixed_slides, matched_list, max_workers):
+            zf.writestr(name, data)
+            names.append(name)
+            logger.info(f"  分割出力: {name} ({len(data) / 1024 / 1024:.1f} MB)")
+            if progress_callback:
+                progress_callback(len(names), total)
+    return sorted(names)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+テンプレートのスライド要約（定型文の除去）
+=====================================
+テンプレート全体のスライドを走査し、多くのスライドに繰り返し現れる行
+（ヘッダー、社外秘表記、ページ番号など）を定型文として数える。
+各スライドからそれらを除いた特徴的なテキストだけを要約として残す。
+
+先頭から CONTENT_LIMIT 文字を切り出す前に定型文を除くため、グループの内容が
+ヘッダー類で埋まらない。結果はテンプレートのハッシュごとにキャッシュし、
+同じテンプレートの2回目以降は再計算しない。
+
+要約はスライドの sldId（slide_id）をキーにする。目次の複製でスライドの
+位置がずれても、元のスライドの要約をそのまま引ける。
+"""
+
+import io
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from records import CONTENT_LIMIT
+from prompt_builder import find_boilerplate, is_noise_line, line_key, normalize_line
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+# 何割以上のスライドに現れる行を定型文とみなすか
+STOP_PHRASE_RATIO = 0.2
+DIGEST_CACHE_DIR = Path(__file__).parent / ".digest_cache"
+
+# キャッシュ形式を変えた場合はここを上げる（古いキャッシュを無効化）
+_CACHE_VERSION = 1
+
+
+# ============================================================================
+# Analysis
+# ============================================================================
+def slide_lines(slide) -> List[str]:
+    """スライドの全テキスト行（文字数の上限なし）"""
+    lines = []
+    for shape in slide.shapes:
+        if shape.has_text_frame:
+            for line in shape.text_frame.text.split('\n'):
+                line = normalize_line(line)
+                if line:
+                    lines.append(line)
+    return lines
+
+
+def slide_digest(lines: List[str], stop_phrases: set, limit: int = CONTENT_LIMIT) -> str:
+    """定型文・ページ番号・重複を除いたスライドの要約"""
+    kept = []
+    seen = set()
+    size = 0
+    for line in lines:
+        if is_noise_line(line) or line in seen or line_key(line) in stop_phrases:
+            continue
+        seen.add(line)
+        kept.append(line)
+        size += len(line) + 1
+        if size > limit:
+            break
+    return "\n".join(kept)[:limit]
+
+
+def analyze_template(prs, ratio: float = STOP_PHRASE_RATIO) -> Dict:
+    """
+    テンプレート全体から定型文を数え、スライドごとの要約を作る
+
+    Returns:
+        Dict: {"stop_phrases": [...], "slides": {slide_id: 要約}}
+    """
+    slides = [(slide.slide_id, slide_lines(slide)) for slide in prs.slides]
+    stop_phrases = find_boilerplate(["\n".join(lines) for _, lines in slides], ratio=ratio)
+
+    digests = {}
+    raw_chars = digest_chars = 0
+    for slide_id, lines in slides:
+        digests[slide_id] = slide_digest(lines, stop_phrases)
+        raw_chars += min(CONTENT_LIMIT, sum(len(line) + 1 for line in lines))
+        digest_chars += len(digests[slide_id])
+
+    logger.info(
+        f"テンプレート分析: {len(slides)} スライド, 定型文 {len(stop_phrases)} 行, "
+        f"内容 {raw_chars} -> {digest_chars} 文字"
+    )
+    return {"stop_phrases": sorted(stop_phrases), "slides": digests}
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+def template_digest_key(pptx_bytes: bytes) -> str:
+    digest = hashlib.sha256(f"{_CACHE_VERSION}:".encode())
+    digest.update(pptx_bytes)
+    return digest.hexdigest()
+
+
+def load_template_digest(pptx_bytes: bytes, prs=None,
+                         cache_dir: Optional[Path] = DIGEST_CACHE_DIR,
+                         key: Optional[str] = None) -> Dict[int, str]:
+    """
+    テンプレートのスライド要約 {slide_id: 要約} を返す（キャッシュがあれば再計算しない）
+
+    Args:
+        prs: 読み込み済みのテンプレート（未変更のもの）。省略時は pptx_bytes から読み込む
+        cache_dir: キャッシュの保存先（None の場合はキャッシュしない）
+        key: 計算済みの template_digest_key(pptx_bytes)（他のキャッシュと共有する場合）
+    """
+    key = key or template_digest_key(pptx_bytes)
+    cache_file = Path(cache_dir) / f"{key}.json" if cache_dir else None
+    if cache_file is not None and cache_file.exists():
+        try:
+            data = json.loads(cache_file.read_text(encoding='utf-8'))
+            return {int(slide_id): text for slide_id, text in data["slides"].items()}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"テンプレート要約のキャッシュを読めません: {e}")
+
+    if prs is None:
+        from pptx import Presentation
+        prs = Presentation(io.BytesIO(pptx_bytes))
+    data = analyze_template(prs)
+
+    if cache_file is not None:
+        tmp_path = None
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # 準備のスレッドと各セッションが同時に読み書きするため、別名の一時ファイルに
+            # 書き終えてから置き換える（書きかけのファイルをキャッシュとして読まない）
+            fd, tmp_path = tempfile.mkstemp(suffix='.json', dir=cache_file.parent)
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+                json.dump(data, tmp, ensure_ascii=False)
+            os.replace(tmp_path, cache_file)
+        except OSError as e:
+            logger.warning(f"テンプレート要約をキャッシュできません: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    return data["slides"]
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+テンプレートの事前準備（ウォームアップ）
+====================================
+テンプレートを保存した直後に、バックグラウンドで次を済ませておく。
+
+    1. テンプレートの読み込み
+    2. スライド要約（定型文の除去。template_digest のキャッシュ）
+    3. テキストの索引（slide_index のキャッシュ）
+    4. グループ化（全戦略。slide_grouping のキャッシュ）
+    5. 読み込み済みの Presentation の予備（整理処理でそのまま使う）
+    6. サムネイル（LibreOffice がある場合。thumbnails のキャッシュ）
+
+要約・索引・グループ化・サムネイルはディスクのキャッシュに残るため、プロセスを再起動しても使える。
+グループ化の結果と読み込み済みの Presentation はメモリに持ち、最新のテンプレートの分だけ保持する。
+
+Presentation は目次・タイトルの書き込みで変更されるため、予備は1回ずつ払い出し、
+払い出した分はバックグラウンドで読み込み直して補充する。
+"""
+
+import io
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from records import SlideGroup
+from template_digest import load_template_digest, template_digest_key
+from slide_grouping import GROUPING_STRATEGIES, group_slides
+from slide_index import load_slide_index
+from thumbnails import is_thumbnail_available, submit_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+# 予備の Presentation の数（整理1回でグループ化用と出力用に1つずつ使う）
+SPARE_PRESENTATIONS = 2
+# グループ化する範囲の先頭（表紙と目次の次）
+WARM_START_SLIDE = 2
+
+# 準備はCPUを使うため1件ずつ行う（予備の補充はサムネイルの描画を待たないよう別に行う）
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="template-warmup")
+_refill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="template-refill")
+_lock = threading.Lock()
+_warmups: Dict[str, 'Warmup'] = {}
+_groups: Dict[Tuple[str, str], List[SlideGroup]] = {}
+_spares: Dict[str, List] = {}
+_current_key: Optional[str] = None
+
+
+class Warmup:
+    """1つのテンプレートの準備の進捗"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.progress = 0.0
+        self.text = "待機中"
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def _update(self, progress: float, text: str):
+        self.progress = progress
+        self.text = text
+
+
+# ============================================================================
+# Warm Artifacts
+# ============================================================================
+def _parse(pptx_bytes: bytes):
+    from pptx import Presentation
+    return Presentation(io.BytesIO(pptx_bytes))
+
+
+def _copy_groups(groups: List[SlideGroup]) -> List[SlideGroup]:
+    return [SlideGroup(g.title, g.slides, g.content) for g in groups]
+
+
+def warm_groups(key: str, strategy: str) -> Optional[List[SlideGroup]]:
+    """準備済みのグループ（未変更のテンプレートで WARM_START_SLIDE 以降。無ければ None）"""
+    with _lock:
+        groups = _groups.get((key, strategy))
+    return _copy_groups(groups) if groups is not None else None
+
+
+def take_presentation(pptx_bytes: bytes, key: Optional[str] = None):
+    """
+    テンプレートの Presentation を返す（予備があれば読み込まずに払い出し、後で補充する）
+    返した Presentation は呼び出し側で自由に変更してよい
+    """
+    key = key or template_digest_key(pptx_bytes)
+    with _lock:
+        spares = _spares.get(key)
+        prs = spares.pop() if spares else None
+    if prs is None:
+        return _parse(pptx_bytes)
+    _refill_executor.submit(_refill, pptx_bytes, key)
+    return prs
+
+
+def _refill(pptx_bytes: bytes, key: str):
+    with _lock:
+        if key != _current_key or len(_spares.get(key, [])) >= SPARE_PRESENTATIONS:
+            return
+    prs = _parse(pptx_bytes)
+    with _lock:
+        if key == _current_key:
+            _spares.setdefault(key, []).append(prs)
+
+
+# ============================================================================
+# Warmup
+# ============================================================================
+def _warm(pptx_bytes: bytes, state: Warmup):
+    started = time.perf_counter()
+    key = state.key
+    try:
+        state._update(0.1, "テンプレートを読み込み中...")
+        prs = _parse(pptx_bytes)
+
+        state._update(0.3, "スライドを分析中...")
+        digests = load_template_digest(pptx_bytes, prs, key=key)
+
+        state._update(0.35, "テキストの索引を作成中...")
+        load_slide_index(pptx_bytes, prs, key=key)
+
+        strategies = list(GROUPING_STRATEGIES)
+        for done, strategy in enumerate(strategies):
+            state._update(0.4 + 0.2 * done / len(strategies), f"スライドをグループ化中（{strategy}）...")
+            groups = group_slides(prs, start=WARM_START_SLIDE, strategy=strategy,
+                                  digests=digests, cache_key=key)
+            with _lock:
+                _groups[(key, strategy)] = groups
+
+        # グループ化は読むだけのため、読み込んだものをそのまま予備の1つにする
+        state._update(0.6, "読み込み済みのテンプレートを準備中...")
+        spares = [prs] + [_parse(pptx_bytes) for _ in range(SPARE_PRESENTATIONS - 1)]
+        with _lock:
+            if key == _current_key:
+                _spares[key] = spares
+
+        if is_thumbnail_available():
+            state._update(0.8, "サムネイルを描画中...")
+            submit_thumbnails(pptx_bytes, key=key).result()
+
+        state.seconds = time.perf_counter() - started
+        state._update(1.0, f"準備完了（{state.seconds:.1f} 秒）")
+        logger.info(f"テンプレートの準備が完了しました: {state.seconds:.2f}s")
+    except Exception as e:
+        state.error = f"{type(e).__name__}: {e}"
+        state._update(1.0, f"準備に失敗しました: {e}")
+        logger.warning(f"テンプレートの準備に失敗しました: {e}")
+
+
+def start_warmup(pptx_bytes: bytes, key: Optional[str] = None) -> Warmup:
+    """
+    テンプレートの準備をバックグラウンドで開始する
+    同じテンプレートの準備が実行中・完了済みならその進捗を返す。
+    以前のテンプレートのメモリ上の準備結果は破棄する
+    key は計算済みの template_digest_key（省略時はここで計算）
+    """
+    global _current_key
+    key = key or template_digest_key(pptx_bytes)
+    with _lock:
+        state = _warmups.get(key)
+        if state is not None and state.error is None:
+            _current_key = key
+            return state
+        if key != _current_key:
+            _warmups.clear()
+            _groups.clear()
+            _spares.clear()
+        _current_key = key
+        state = Warmup(key)
+        _warmups[key] = state
+        state.future = _executor.submit(_warm, pptx_bytes, state)
+    return state
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+構造化JSON出力の検証と再質問の動作確認
+====================================
+validate_mapping が重複・範囲外・欠落の回答を聞き直しの対象にすること、
+request_mapping / request_categories が不正なキーだけを1回だけ聞き直すことを、
+応答を決め打ちしたモデルで確かめる（AI・疑似サーバーは使わない）。
+
+Usage:
+    python test_ai_json.py
+"""
+
+import json
+
+from ai_json import (CATEGORY_SCHEMA, MAPPING_CONFIDENCE_SCHEMA, MAPPING_SCHEMA, parse_json_lenient,
+                     request_categories, request_mapping, validate_categories, validate_mapping)
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """generate_content の応答を順に返し、受け取ったプロンプトと設定を記録する"""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.prompts = []
+        self.configs = []
+
+    def generate_content(self, prompt, generation_config=None):
+        self.prompts.append(prompt)
+        self.configs.append(generation_config)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return Response(answer if isinstance(answer, str) else json.dumps(answer))
+
+
+def pairs(mapping, confidence=None):
+    return [dict({"No": no, "Group": group}, **({"Confidence": confidence[no]} if confidence else {}))
+            for no, group in mapping.items()]
+
+
+def test_parse_json_lenient():
+    assert parse_json_lenient('```json\n[{"No": 1, "Group": 0}]\n```') == [{"No": 1, "Group": 0}]
+    assert parse_json_lenient('回答です: [{"No": 1, "Group": 0},]\n以上') == [{"No": 1, "Group": 0}]
+    try:
+        parse_json_lenient("回答できません")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError にならない")
+
+
+def test_validate_mapping():
+    # 重複したグループは先に回答した No に割り当て、後の No は聞き直す
+    mapping, invalid = validate_mapping(pairs({1: 0, 2: 0, 3: 1}), [1, 2, 3], 3)
+    assert mapping == {1: 0, 3: 1} and invalid == [2], (mapping, invalid)
+    # 範囲外・欠落・読めない値は聞き直し、マッチなし -1 は有効（mapping には入れない）
+    raw = [{"No": 1, "Group": 3}, {"No": 2, "Group": -2}, {"No": 3, "Group": -1},
+           {"No": 4, "Group": "x"}, {"No": 9, "Group": 0}]
+    mapping, invalid = validate_mapping(raw, [1, 2, 3, 4, 5], 3)
+    assert mapping == {} and invalid == [1, 2, 4, 5], (mapping, invalid)
+    # {"1": 0} 形式と文字列・小数の番号も読む
+    assert validate_mapping({"1": "2", "2": 1.0}, [1, 2], 3) == ({1: 2, 2: 1}, [])
+    # 同じ No の2つ目以降の回答は無視する
+    assert validate_mapping(pairs({1: 0}) + [{"No": 1, "Group": 1}], [1], 2) == ({1: 0}, [])
+
+
+def test_request_mapping_reask_once():
+    model = StubModel(pairs({1: 0, 2: 0, 3: 5}), pairs({2: 1, 3: 0}))
+    responses = []
+    mapping = request_mapping(model, "PROMPT", [1, 2, 3], 3, on_response=responses.append)
+    # 2回目は不正だった No.2・3 だけを聞き直し、割り当て済みのグループ 0 と重なる回答は捨てる
+    assert mapping == {1: 0, 2: 1}, mapping
+    assert len(model.prompts) == 2 and len(responses) == 2
+    assert model.prompts[1].startswith("PROMPT") and "[2, 3]" in model.prompts[1]
+    assert "割り当て済みのグループ [0]" in model.prompts[1], model.prompts[1]
+    assert all(config.response_schema == MAPPING_SCHEMA for config in model.configs)
+
+
+def test_request_mapping_no_reask():
+    model = StubModel(pairs({1: 1, 2: -1}))
+    assert request_mapping(model, "PROMPT", [1, 2], 2) == {1: 1}
+    assert len(model.prompts) == 1
+
+    # 再質問が失敗しても、1回目の有効な回答は残す
+    model = StubModel("壊れた応答 [", RuntimeError("接続エラー"))
+    assert request_mapping(model, "PROMPT", [1, 2], 2) == {}
+    model = StubModel(pairs({1: 1, 2: 1}), RuntimeError("接続エラー"))
+    assert request_mapping(model, "PROMPT", [1, 2], 2) == {1: 1}
+    assert len(model.prompts) == 2
+
+
+def test_request_mapping_confidences():
+    model = StubModel(pairs({1: 0, 2: 0, 3: -1}, {1: 0.9, 2: 0.8, 3: 1.5}), pairs({2: 1}, {2: 0.4}))
+    confidences = {}
+    mapping = request_mapping(model, "PROMPT", [1, 2, 3], 2, confidences=confidences)
+    assert mapping == {1: 0, 2: 1}, mapping
+    # 確信度は有効な回答だけ（範囲外の値は 0〜1 に収める）。再質問の回答の確信度も入れる
+    assert confidences == {1: 0.9, 2: 0.4, 3: 1.0}, confidences
+    assert all(config.response_schema == MAPPING_CONFIDENCE_SCHEMA for config in model.configs)
+
+
+def test_validate_categories():
+    raw = [{"No": 2, "Category": " 品質管理 ", "SubItems": ["検査", "", 3]},
+           {"No": 1, "MainCategory": "実施体制"},
+           {"No": 2, "Category": "重複"},
+           {"No": "x", "Category": "番号なし"},
+           {"No": 3, "Category": ""},
+           "文字列"]
+    categories, invalid = validate_categories(raw)
+    assert [(c.no, c.main_category, c.sub_items) for c in categories] == [
+        (1, "実施体制", []), (2, "品質管理", ["検査"])
+    ], categories
+    assert invalid == 3
+
+
+def test_request_categories_reask_once():
+    model = StubModel([{"No": 1, "Category": "実施体制"}, {"No": "?", "Category": "不明"}],
+                      [{"No": 1, "Category": "別名"}, {"No": 2, "Category": "品質管理"}])
+    categories = request_categories(model, ["PROMPT", "PDF"])
+    # 1回目の有効な要素を優先し、再質問で得た No で補う
+    assert [(c.no, c.main_category) for c in categories] == [(1, "実施体制"), (2, "品質管理")]
+    assert len(model.prompts) == 2 and model.prompts[1][:2] == ["PROMPT", "PDF"]
+    assert len(model.prompts[1]) == 3
+    assert all(config.response_schema == CATEGORY_SCHEMA for config in model.configs)
+
+    # 完全な回答なら聞き直さない
+    model = StubModel([{"No": 1, "Category": "実施体制"}])
+    assert len(request_categories(model, ["PROMPT"])) == 1 and len(model.prompts) == 1
+
+    # 読めない応答で再質問も失敗した場合は空
+    model = StubModel("該当なし", RuntimeError("接続エラー"))
+    assert request_categories(model, ["PROMPT"]) == []
+    assert len(model.prompts) == 2
+
+
+if __name__ == '__main__':
+    for name, check in list(globals().items()):
+        if name.startswith('test_'):
+            check()
+            print(f"OK  {name}")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+グループ行列の動作確認
+====================
+GroupMatrix.score がバイグラムの式（|bigrams(c) ∩ bigrams(g)| / |bigrams(c)|）と一致すること、
+ディスクキャッシュの保存・読み込みと、壊れたキャッシュからの作り直しを確かめる。
+
+Usage:
+    python test_group_matrix.py
+"""
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import group_matrix
+from records import Category, SlideGroup
+from group_matrix import GroupMatrix, bigrams, category_text, group_text, load_group_matrix
+
+
+def make_groups():
+    return [
+        SlideGroup("実施体制", [2], "業務の実施体制と責任者の配置"),
+        SlideGroup("品質管理", [3, 4], "品質管理 ISO9001 に基づく検査"),
+        SlideGroup("安全対策", [5], "安全対策 事故防止の訓練"),
+        SlideGroup("空", [6], ""),
+    ]
+
+
+def make_categories():
+    return [
+        Category(1, "実施体制", ["責任者の配置", "業務分担"]),
+        Category(2, "品質管理", ["ISO 9001"]),
+        Category(3, "環境保全"),         # どのグループとも重ならない
+        Category(4, "安"),               # バイグラムが無い
+    ]
+
+
+def expected_scores(categories, groups):
+    """式どおりにカテゴリ × グループのスコアを計算"""
+    scores = np.zeros((len(categories), len(groups)))
+    for i, cat in enumerate(categories):
+        grams = bigrams(category_text(cat))
+        for j, group in enumerate(groups):
+            scores[i, j] = len(grams & bigrams(group_text(group))) / max(len(grams), 1)
+    return scores
+
+
+def test_score_matches_formula():
+    categories, groups = make_categories(), make_groups()
+    scores = GroupMatrix.build(groups).score(categories)
+    assert scores.shape == (len(categories), len(groups))
+    assert np.allclose(scores, expected_scores(categories, groups)), scores
+    assert scores[0, 0] > scores[0, 1] and scores[1, 1] > scores[1, 0]
+    assert not scores[2:].any()
+
+
+def test_score_batch():
+    categories, groups = make_categories(), make_groups()
+    matrix = GroupMatrix.build(groups)
+    first, second = matrix.score_batch([categories, categories[1:2]])
+    assert np.array_equal(first, matrix.score(categories))
+    assert np.array_equal(second, matrix.score(categories[1:2]))
+
+
+def test_disk_cache():
+    categories, groups = make_categories(), make_groups()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = Path(tmp_dir)
+        built = load_group_matrix(groups, cache_dir=cache_dir)
+        cache_files = list(cache_dir.iterdir())
+        assert len(cache_files) == 1 and cache_files[0].suffix == '.npz', cache_files
+
+        group_matrix._memory.clear()
+        loaded = load_group_matrix(groups, cache_dir=cache_dir)
+        assert loaded is not built
+        assert np.array_equal(loaded.score(categories), built.score(categories))
+
+        # 書きかけ（途中で切れた .npz）は読み込まずに作り直す
+        cache_files[0].write_bytes(cache_files[0].read_bytes()[:64])
+        group_matrix._memory.clear()
+        rebuilt = load_group_matrix(groups, cache_dir=cache_dir)
+        assert np.array_equal(rebuilt.score(categories), built.score(categories))
+        assert [path.name for path in cache_dir.iterdir()] == [cache_files[0].name]
+        group_matrix._memory.clear()
+
+
+if __name__ == '__main__':
+    for name, check in list(globals().items()):
+        if name.startswith('test_'):
+            check()
+            print(f"OK  {name}")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+マッチングのカスケードの動作確認
+==============================
+AIの代わりに回答を決め打ちした match_fn を使い、確信度の計算・エスカレーションの件数・
+最後の段階で回答が無かったカテゴリの候補の引き継ぎ、キーワード候補の受け渡しを確かめる
+（AI・疑似サーバーは使わない）。
+
+Usage:
+    python test_match_cascade.py
+"""
+
+import numpy as np
+
+from records import Category, SlideGroup
+from group_matrix import GroupMatrix
+from prompt_builder import build_matching_lists
+from match_cascade import (CANDIDATE_BOOST, assign_scores, boost_candidates, cascade_matching, local_matching,
+                           uses_cascade)
+
+
+def make_groups():
+    return [
+        SlideGroup("実施体制", [2], "実施体制 責任者 配置"),
+        SlideGroup("品質管理", [3], "品質管理 ISO9001 検査"),
+        SlideGroup("安全対策", [4], "安全対策 事故防止 訓練"),
+    ]
+
+
+def make_categories():
+    return [Category(1, "実施体制"), Category(2, "品質管理"), Category(3, "安全対策")]
+
+
+def scripted_match(answers):
+    """
+    モデルごとに決め打ちの回答を返す match_fn
+    answers: {モデル: ({No: 渡されたグループの中の位置}, {No: 確信度})}
+    """
+    calls = []
+    hints = []
+
+    def match_fn(model, categories, groups, confidences, candidates=None):
+        calls.append((model, [cat.no for cat in categories], [group.title for group in groups]))
+        hints.append(candidates)
+        mapping, scores = answers[model]
+        confidences.update({cat.no: scores[cat.no] for cat in categories if cat.no in scores})
+        return {cat.no: mapping[cat.no] for cat in categories if cat.no in mapping}
+
+    match_fn.hints = hints
+    return match_fn, calls
+
+
+def test_assign_scores_confidence():
+    categories = make_categories()
+    scores = np.array([
+        [0.8, 0.2, 0.0],    # 1位と2位の差が大きい
+        [0.7, 0.1, 0.0],    # 1位のグループを No.1 に取られる（競合）
+        [0.0, 0.0, 0.0],    # どのグループとも重ならない
+    ])
+    mapping, confidences = assign_scores(categories, scores)
+    assert mapping == {1: 0, 2: 1}, mapping
+    # (0.8 - 0.2) / 0.8 × min(1, 0.8 / LOCAL_STRONG_SCORE)
+    assert confidences == {1: 0.75, 2: 0.0, 3: 0.0}, confidences
+
+
+def test_local_matching_columns():
+    categories = make_categories()[1:]
+    groups = make_groups()
+    matrix = GroupMatrix.build(groups)
+    # 列を絞った照合は、残りのグループだけで行列を作った照合と同じ
+    mapping, confidences = local_matching(categories, groups, matrix=matrix, columns=[1, 2])
+    expected = assign_scores(categories, GroupMatrix.build(groups[1:]).score(categories))
+    assert (mapping, confidences) == expected, (mapping, confidences)
+    assert mapping == {2: 0, 3: 1}, mapping
+
+
+def test_cascade_escalation():
+    categories = make_categories()
+    groups = make_groups()
+    match_fn, calls = scripted_match({
+        "fast": ({1: 0, 2: 1, 3: 2}, {1: 0.9, 2: 0.3, 3: 0.5}),
+        "strong": ({2: 0, 3: 1}, {2: 0.8, 3: 0.2}),
+    })
+    mapping, stats = cascade_matching([("fast", "fast"), ("strong", "strong")],
+                                      categories, groups, match_fn, threshold=0.7)
+    # No.1 は最初の段階で確定し、そのグループは次の段階に出さない
+    assert calls[1] == ("strong", [2, 3], ["品質管理", "安全対策"]), calls
+    assert stats["escalated"] == 2, stats
+    assert [stage["confident"] for stage in stats["stages"]] == [1, 2], stats
+    # 最後の段階の回答は確信度によらず採用する
+    assert mapping == {1: 0, 2: 1, 3: 2}, mapping
+
+
+def test_single_model_stage():
+    categories = make_categories()
+    groups = make_groups()
+    # AIのモデルが1つだけでも、既定のモデルではなくそのモデルでマッチングする
+    stages = [("models/gemini-2.5-pro", "pro")]
+    assert uses_cascade(stages) and uses_cascade([("local", None)]) and not uses_cascade([])
+    match_fn, calls = scripted_match({
+        "pro": ({1: 0, 2: 1, 3: 2}, {1: 0.9, 2: 0.3, 3: 0.0}),
+    })
+    mapping, stats = cascade_matching(stages, categories, groups, match_fn, threshold=0.7)
+    assert [call[0] for call in calls] == ["pro"], calls
+    # 1段階だけなら最後の段階なので、確信度が低くても採用する
+    assert mapping == {1: 0, 2: 1, 3: 2}, mapping
+    assert [stage["model"] for stage in stats["stages"]] == ["models/gemini-2.5-pro"], stats
+    assert stats["escalated"] == 0, stats
+
+
+def test_cascade_tentative_fallback():
+    categories = make_categories()
+    groups = make_groups()
+    # 最後の段階が No.3 に回答しない場合は、前の段階の候補（グループ2）を使う
+    match_fn, _ = scripted_match({
+        "fast": ({1: 0, 2: 1, 3: 2}, {1: 0.9, 2: 0.3, 3: 0.5}),
+        "strong": ({2: 0}, {2: 0.8}),
+    })
+    mapping, _ = cascade_matching([("fast", "fast"), ("strong", "strong")],
+                                  categories, groups, match_fn, threshold=0.7)
+    assert mapping == {1: 0, 2: 1, 3: 2}, mapping
+
+    # 前の段階の候補が他のカテゴリに割り当て済みなら、マッチなしにする
+    match_fn, _ = scripted_match({
+        "fast": ({1: 0, 2: 1, 3: 2}, {1: 0.9, 2: 0.3, 3: 0.5}),
+        "strong": ({2: 1}, {2: 0.8}),
+    })
+    mapping, _ = cascade_matching([("fast", "fast"), ("strong", "strong")],
+                                  categories, groups, match_fn, threshold=0.7)
+    assert mapping == {1: 0, 2: 2}, mapping
+
+
+
+def test_keyword_candidates_boost():
+    categories = make_categories()[:2]
+    # 同点の No.1 はキーワード候補（グループ1）に割り当て、No.2 の2位の候補には半分だけ足す
+    scores = np.array([[0.3, 0.3, 0.0], [0.0, 0.0, 0.4]])
+    boosted = boost_candidates(scores, categories, {1: [1], 2: [0, 2]})
+    assert np.allclose(boosted, [[0.3, 0.3 + CANDIDATE_BOOST, 0.0],
+                                 [CANDIDATE_BOOST, 0.0, 0.4 + CANDIDATE_BOOST / 2]]), boosted
+    assert assign_scores(categories, boosted)[0] == {1: 1, 2: 2}
+    assert boost_candidates(scores, categories, None) is scores
+
+    # 列を絞った場合は、グループ番号を列の位置に直して足す（絞った外の候補は無視）
+    boosted = boost_candidates(scores[:, [1, 2]], categories, {1: [1], 2: [0]}, columns=[1, 2])
+    assert np.allclose(boosted, [[0.3 + CANDIDATE_BOOST, 0.0], [0.0, 0.4]]), boosted
+
+
+def test_cascade_passes_candidates():
+    categories = make_categories()
+    groups = make_groups()
+    match_fn, calls = scripted_match({
+        "fast": ({1: 0, 2: 1, 3: 2}, {1: 0.9, 2: 0.3, 3: 0.5}),
+        "strong": ({2: 0, 3: 1}, {2: 0.8, 3: 0.8}),
+    })
+    candidates = {1: [0], 2: [1, 0], 3: [2]}
+    cascade_matching([("fast", "fast"), ("strong", "strong")], categories, groups, match_fn,
+                     threshold=0.7, candidates=candidates)
+    # 2段階目はグループ1・2だけを渡すため、候補もその中の位置に直す（確定済みのグループ0は除く）
+    assert match_fn.hints == [candidates, {1: [], 2: [0], 3: [1]}], match_fn.hints
+
+    # local では候補のスコアを上げる（内容の重ならない No.4 も候補のグループに割り当てる）
+    extra = categories[:2] + [Category(4, "提出書類")]
+    mapping, _ = local_matching(extra, groups, matrix=GroupMatrix.build(groups), candidates={4: [2]})
+    assert mapping == {1: 0, 2: 1, 4: 2}, mapping
+
+
+
+def test_prompt_hints():
+    categories = make_categories()
+    groups = make_groups()
+    prompt, stats = build_matching_lists(categories, groups, lambda cats, grps: f"{cats}\n---\n{grps}",
+                                         cat_label='CAT', grp_label='GRP', hints={1: [0, 2], 3: []})
+    cat_list = prompt.split("---")[0]
+    assert "CAT1: 【大項目】 実施体制\n  キーワード候補: GRP0, GRP2" in cat_list, prompt
+    assert cat_list.count("キーワード候補") == 1 and stats["hints"] == 1, prompt
+
+
+if __name__ == '__main__':
+    for name, check in list(globals().items()):
+        if name.startswith('test_'):
+            check()
+            print(f"OK  {name}")
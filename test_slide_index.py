@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+テキスト索引の動作確認
+====================
+小さな索引で SlideIndex.find / search を確かめる（複数語は同じスライドにすべて含む場合だけ、
+全角・半角と大文字・小文字の違い、1文字の語、バイグラムは揃っても並びが違う語）。
+
+Usage:
+    python test_slide_index.py
+"""
+
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from pptx import Presentation
+
+import slide_index
+from slide_index import KIND_NOTES, KIND_TABLE, KIND_TEXT, SlideIndex, load_slide_index
+
+SLIDES = [(256, "表紙"), (257, "実施体制"), (258, "品質管理"), (259, "体制と品質")]
+SHAPES = [
+    (0, "タイトル 1", KIND_TEXT, "提案書"),
+    (1, "テキスト 2", KIND_TEXT, "業務の実施体制について"),
+    (1, "表 3", KIND_TABLE, "責任者\n品質管理担当"),
+    (2, "テキスト 2", KIND_TEXT, "ＩＳＯ９００１に基づく品質管理"),
+    (2, "ノート", KIND_NOTES, "体制図は別紙"),
+    (3, "テキスト 2", KIND_TEXT, "制体の確認"),
+]
+
+
+def make_index():
+    return SlideIndex(SLIDES, SHAPES)
+
+
+def test_find():
+    index = make_index()
+    assert index.find("品質管理") == [2, 3]
+    # 全角・半角、大文字・小文字、空白を揃えて照合する
+    assert index.find("iso 9001") == [3]
+    # 1文字の語は文字の索引から引く
+    assert index.find("体") == [1, 4, 5]
+    # バイグラム（体制・制体）が揃っても並びが違えば含まない
+    assert index.find("体制体") == []
+    assert index.find("存在しない") == []
+    assert index.find("  ") == []
+
+
+def test_search_multiple_terms():
+    index = make_index()
+    # 2語とも含むスライドは 2（表紙から数えて）と 3。各スライドの語を含むシェイプを返す
+    hits = index.search("体制 品質管理")
+    assert [(hit.slide, hit.shape) for hit in hits] == [
+        (2, "テキスト 2"), (2, "表 3"), (3, "テキスト 2"), (3, "ノート")
+    ], hits
+    assert hits[0].slide_id == 257 and hits[0].title == "実施体制"
+    assert hits[1].kind == KIND_TABLE
+    # 1語だけ含むスライドは返さない
+    assert index.search("実施体制 ISO9001") == []
+    assert [hit.slide for hit in index.search("提案書")] == [1]
+    assert len(index.search("体制 品質管理", limit=1)) == 1
+    assert index.search("   ") == []
+
+
+def test_snippet():
+    index = make_index()
+    hit, = index.search("実施")
+    assert hit.snippet == "業務の実施体制について"
+
+
+def test_disk_cache():
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    slide.shapes.title.text = "実施体制"
+    buffer = BytesIO()
+    prs.save(buffer)
+    pptx_bytes = buffer.getvalue()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = Path(tmp_dir)
+        built = load_slide_index(pptx_bytes, prs, cache_dir=cache_dir, key="test")
+        assert [path.suffix for path in cache_dir.iterdir()] == ['.json']
+        slide_index._memory.clear()
+        loaded = load_slide_index(pptx_bytes, cache_dir=cache_dir, key="test")
+        assert loaded is not built
+        assert loaded.search("体制") == built.search("体制")
+        slide_index._memory.clear()
+
+
+if __name__ == '__main__':
+    for name, check in list(globals().items()):
+        if name.startswith('test_'):
+            check()
+            print(f"OK  {name}")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スライドの並べ替えの動作確認
+==========================
+validate_permutation が全単射でない並び（重複・欠落・範囲外）を拒むこと、
+reorder_slides の未使用スライドの扱い（keep / drop / hide）とセクションの作り直しを確かめる。
+
+Usage:
+    python test_slide_order.py
+"""
+
+import re
+from io import BytesIO
+from zipfile import ZipFile
+
+from pptx import Presentation
+
+from slide_order import (UNMATCHED_DROP, UNMATCHED_HIDE, UNMATCHED_KEEP, UNUSED_SECTION_NAME,
+                         reorder_slides, slide_sections, validate_permutation)
+
+
+def make_deck(count=5):
+    """タイトルが "S0".."S{count-1}" のデッキ（S0 だけ別のレイアウト）"""
+    prs = Presentation()
+    for i in range(count):
+        slide = prs.slides.add_slide(prs.slide_layouts[0 if i == 0 else 5])
+        slide.shapes.title.text = f"S{i}"
+    return prs
+
+
+def titles(prs):
+    return [slide.shapes.title.text for slide in prs.slides]
+
+
+def expect_error(order, count, message):
+    try:
+        validate_permutation(order, count)
+    except ValueError as e:
+        assert message in str(e), e
+    else:
+        raise AssertionError(f"ValueError にならない: {order}")
+
+
+def test_validate_permutation():
+    validate_permutation([2, 0, 1], 3)
+    validate_permutation([], 0)
+    expect_error([0, 1, 1], 3, "重複")
+    expect_error([0, 1], 3, "件数")              # 欠落
+    expect_error([0, 1, 2, 2], 3, "件数")
+    expect_error([0, 1, 3], 3, "範囲外")
+    expect_error([0, -1, 1], 3, "範囲外")
+
+
+def test_invalid_order_leaves_deck():
+    prs = make_deck()
+    for order in ([0, 1, 2, 3, 3], [0, 1, 2, 3], [0, 1, 2, 3, 5]):
+        try:
+            reorder_slides(prs, order)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"ValueError にならない: {order}")
+    try:
+        reorder_slides(prs, [0, 1, 2, 3, 4], unmatched='archive')
+    except ValueError as e:
+        assert "archive" in str(e)
+    else:
+        raise AssertionError("未対応のモードで ValueError にならない")
+    assert titles(prs) == ["S0", "S1", "S2", "S3", "S4"]
+
+
+def test_keep():
+    prs = make_deck()
+    assert reorder_slides(prs, [0, 3, 1, 4, 2], unmatched_start=3, unmatched=UNMATCHED_KEEP) == 5
+    assert titles(prs) == ["S0", "S3", "S1", "S4", "S2"]
+    assert all(slide._element.get('show') is None for slide in prs.slides)
+    assert slide_sections(prs) == {}
+
+
+def test_drop():
+    prs = make_deck()
+    assert reorder_slides(prs, [0, 3, 1, 4, 2], unmatched_start=3, unmatched=UNMATCHED_DROP) == 3
+    assert titles(prs) == ["S0", "S3", "S1"]
+    # 使われているレイアウト（タイトル・タイトルのみ）以外は外す
+    assert len(prs.slide_layouts) == 2
+
+    saved = BytesIO()
+    prs.save(saved)
+    reopened = Presentation(saved)
+    assert titles(reopened) == ["S0", "S3", "S1"]
+    # 削除したスライド・外したレイアウトのパーツは出力に含めない
+    parts = ZipFile(saved).namelist()
+    assert len([name for name in parts if re.fullmatch(r'ppt/slides/slide\d+\.xml', name)]) == 3
+    assert len([name for name in parts if re.fullmatch(r'ppt/slideLayouts/slideLayout\d+\.xml', name)]) == 2
+
+
+def test_hide():
+    prs = make_deck()
+    ids = [str(slide.slide_id) for slide in prs.slides]
+    assert reorder_slides(prs, [0, 3, 1, 4, 2], unmatched_start=3, unmatched=UNMATCHED_HIDE) == 5
+    assert titles(prs) == ["S0", "S3", "S1", "S4", "S2"]
+    # 未使用スライドは非表示にし、末尾の専用セクションへまとめる
+    assert [slide._element.get('show') for slide in prs.slides] == [None, None, None, '0', '0']
+    sections = slide_sections(prs)
+    assert [sections[i] for i in (ids[4], ids[2])] == [UNUSED_SECTION_NAME] * 2
+    assert UNUSED_SECTION_NAME not in {sections[i] for i in (ids[0], ids[3], ids[1])}
+
+    saved = BytesIO()
+    prs.save(saved)
+    assert slide_sections(Presentation(saved)) == sections
+
+
+def test_existing_sections_follow_slides():
+    prs = make_deck(4)
+    reorder_slides(prs, [0, 1, 2, 3], unmatched_start=2, unmatched=UNMATCHED_HIDE)
+    ids = [str(slide.slide_id) for slide in prs.slides]
+    # 未使用だったスライドを前に戻すと、元のセクション名が切り替わるたびにセクションを分ける
+    reorder_slides(prs, [2, 0, 1, 3])
+    sections = slide_sections(prs)
+    assert [sections[i] for i in (ids[2], ids[0], ids[1], ids[3])] == [
+        UNUSED_SECTION_NAME, "既定のセクション", "既定のセクション", UNUSED_SECTION_NAME
+    ], sections
+
+
+if __name__ == '__main__':
+    for name, check in list(globals().items()):
+        if name.startswith('test_'):
+            check()
+            print(f"OK  {name}")
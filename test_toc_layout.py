@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+目次のレイアウトとページ分割の動作確認
+==================================
+文字幅・段落の高さの見積もりとテキストフレームの寸法によるページ分割、
+続きのページの複製（画像のリレーションの付け替え・目次の直後への挿入）、
+目次の書き込みに失敗した場合の後始末を確かめる。
+
+Usage:
+    python test_toc_layout.py
+"""
+
+from io import BytesIO
+
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches
+
+import toc_layout
+from records import Category
+from xml_patch import TextPatches
+from toc_layout import (LINE_SPACING, SUB_INDENT, count_toc_pages, duplicate_slide, frame_inner_size_pt,
+                        paginate_toc, paragraph_height_pt, populate_toc, text_width_em, toc_entries)
+
+
+def make_categories(count: int):
+    return [Category(i + 1, f"大項目{i + 1} の名称", [f"小項目 {i + 1}-{j + 1}" for j in range(2)])
+            for i in range(count)]
+
+
+def make_deck(toc_height=Inches(2)):
+    """表紙・目次（画像付き）・本文2枚のデッキ"""
+    prs = Presentation()
+    layout = prs.slide_layouts[6]   # Blank
+    for title in ["表紙", "目次", "本文1", "本文2"]:
+        slide = prs.slides.add_slide(layout)
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(0.3), Inches(4), Inches(0.5))
+        box.text_frame.text = title
+    toc = prs.slides[1]
+    frame = toc.shapes.add_textbox(Inches(0.5), Inches(1), Inches(8), toc_height)
+    frame.text_frame.text = "ここに目次が入ります（差し替え用のテキスト）"
+    image = BytesIO()
+    Image.new("RGB", (8, 8), "red").save(image, format="PNG")
+    image.seek(0)
+    toc.shapes.add_picture(image, Inches(8.5), Inches(0.3), Inches(1), Inches(1))
+    return prs
+
+
+def slide_texts(slide):
+    return [shape.text_frame.text for shape in slide.shapes if shape.has_text_frame]
+
+
+def test_text_metrics():
+    assert text_width_em("あいう") == 3.0
+    assert abs(text_width_em("ab") - 1.1) < 1e-9
+    assert text_width_em("ｱｲ") == 1.0
+    # 全角10文字 × 10pt = 100pt。幅 100pt なら1行、50pt なら2行
+    assert paragraph_height_pt("あ" * 10, 10, 100) == 10 * LINE_SPACING
+    assert paragraph_height_pt("あ" * 10, 10, 50) == 2 * 10 * LINE_SPACING
+    assert paragraph_height_pt("あ", 10, 0) == float('inf')
+
+
+def test_frame_size():
+    prs = make_deck()
+    frame = prs.slides[1].shapes[1]
+    width, height = frame_inner_size_pt(frame)
+    # 既定の余白は左右 0.1 インチ、上下 0.05 インチ
+    assert abs(width - (8 - 0.2) * 72) < 0.01, width
+    assert abs(height - (2 - 0.1) * 72) < 0.01, height
+
+
+def test_paginate():
+    categories = make_categories(20)
+    width, height = 400, 120
+    pages = paginate_toc(categories, width, height)
+    assert len(pages) > 1
+    # 大項目単位で分け、順序と件数は変えない
+    assert [cat for page in pages for cat in page] == categories
+    for page in pages:
+        used = sum(paragraph_height_pt(text, size, width - (SUB_INDENT.pt if level else 0))
+                   for cat in page for text, size, _, level in toc_entries(cat))
+        assert used <= height or len(page) == 1, (used, len(page))
+    # 十分に高い枠なら1枚
+    assert len(paginate_toc(categories, width, 10000)) == 1
+
+
+def test_populate_with_continuation_slides():
+    categories = make_categories(12)
+    prs = make_deck()
+    expected = count_toc_pages(prs, categories)
+    assert expected > 1
+    original_ids = [slide.slide_id for slide in prs.slides]
+
+    pages = populate_toc(prs, categories, toc_slide_index=1)
+    assert pages == expected
+    slides = list(prs.slides)
+    assert len(slides) == len(original_ids) + pages - 1
+    # 続きのページは目次の直後に入り、本文はその後ろにずれる
+    assert [slide.slide_id for slide in slides[:2]] == original_ids[:2]
+    assert [slide.slide_id for slide in slides[1 + pages:]] == original_ids[2:]
+    assert slide_texts(slides[1 + pages])[0] == "本文1"
+
+    # 各ページには続きの大項目が入る
+    firsts = [slide_texts(slide)[1].split("\n")[0] for slide in slides[1:1 + pages]]
+    layout = paginate_toc(categories, *frame_inner_size_pt(slides[1].shapes[1]))
+    assert firsts == [f"{page[0].no}. {page[0].main_category}" for page in layout], firsts
+    assert firsts[0] == "1. 大項目1 の名称"
+    total = "\n".join(slide_texts(slide)[1] for slide in slides[1:1 + pages])
+    assert all(f"{cat.no}. {cat.main_category}" in total for cat in categories)
+
+    # 複製した画像は元と同じパーツを参照し、保存して開き直せる
+    source_picture = slides[1].shapes[2]
+    for slide in slides[2:1 + pages]:
+        picture = slide.shapes[2]
+        assert picture.image.blob == source_picture.image.blob
+    saved = BytesIO()
+    prs.save(saved)
+    assert len(Presentation(saved).slides) == len(slides)
+
+
+def test_duplicate_slide_remaps_relationships():
+    prs = make_deck()
+    source = prs.slides[1]
+    copy = duplicate_slide(prs, 1, 2)
+    assert prs.slides[2].slide_id == copy.slide_id
+    source_rid = source.shapes[2]._element.blipFill.blip.rEmbed
+    copy_rid = copy.shapes[2]._element.blipFill.blip.rEmbed
+    # 複製先の rId は複製先のスライドのリレーションで引け、同じ画像パーツを指す
+    assert copy.part.related_part(copy_rid) is source.part.related_part(source_rid)
+    assert copy.slide_layout is source.slide_layout
+
+
+def test_patches_are_deferred():
+    prs = make_deck()
+    patches = TextPatches()
+    pages = populate_toc(prs, make_categories(2), toc_slide_index=1, patches=patches)
+    assert pages == 1 and len(patches) == 1
+    # apply するまでは元のテキストのまま
+    assert slide_texts(prs.slides[1])[1].startswith("ここに目次")
+    patches.apply()
+    assert slide_texts(prs.slides[1])[1].startswith("1. 大項目1 の名称")
+
+
+def test_failure_removes_duplicates():
+    prs = make_deck()
+    original_ids = [slide.slide_id for slide in prs.slides]
+    original_rels = len(prs.part.rels)
+    patches = TextPatches()
+
+    def broken(shape, categories, patches):
+        raise RuntimeError("書き込みに失敗")
+
+    write_toc_frame = toc_layout.write_toc_frame
+    toc_layout.write_toc_frame = broken
+    try:
+        assert populate_toc(prs, make_categories(12), toc_slide_index=1, patches=patches) == 0
+    finally:
+        toc_layout.write_toc_frame = write_toc_frame
+    # 複製した続きのページは削除し、目次と patches には何も残さない
+    assert [slide.slide_id for slide in prs.slides] == original_ids
+    assert len(prs.part.rels) == original_rels
+    assert len(patches) == 0
+    assert slide_texts(prs.slides[1])[1].startswith("ここに目次")
+
+    # 目次用のテキストフレームが無ければ 0（スライドは変更しない）
+    prs.slides[1].shapes[1].text_frame.text = "短い"
+    assert count_toc_pages(prs, make_categories(12)) == 0
+    assert populate_toc(prs, make_categories(12), toc_slide_index=1) == 0
+    assert [slide.slide_id for slide in prs.slides] == original_ids
+
+
+if __name__ == '__main__':
+    for name, check in list(globals().items()):
+        if name.startswith('test_'):
+            check()
+            print(f"OK  {name}")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+XMLパッチの動作確認
+=================
+TextPatches でタイトル・目次を書き換えても、元の段落書式（a:pPr）・ランの書式
+（フォント・色・サイズ・太字）・a:endParaRPr が残ること、本文のエスケープと改行（a:br）、
+レベル・サイズ・太字の指定を確かめる。
+
+Usage:
+    python test_xml_patch.py
+"""
+
+from io import BytesIO
+
+from pptx import Presentation
+from pptx.dml.color import RGBColor
+from pptx.enum.text import PP_ALIGN
+from pptx.oxml.ns import qn
+from pptx.util import Inches, Pt
+
+import xml_patch
+from xml_patch import TextPatches, _build_prototype, paragraph_prototype, source_paragraph
+
+
+def format_paragraph(paragraph, text, font, size, bold, color, level=0):
+    """段落に書式付きのランを1つ入れ、endParaRPr も付ける"""
+    paragraph.level = level
+    paragraph.alignment = PP_ALIGN.CENTER if level == 0 else PP_ALIGN.LEFT
+    run = paragraph.add_run()
+    run.text = text
+    run.font.name = font
+    run.font.size = Pt(size)
+    run.font.bold = bold
+    run.font.color.rgb = RGBColor.from_string(color)
+    paragraph._p.get_or_add_endParaRPr().set('lang', 'ja-JP')
+
+
+def make_deck():
+    """タイトル付きのスライドと、レベル0・1の段落を持つ目次用のテキストボックス"""
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])   # Title Only
+    title = slide.shapes.title.text_frame
+    title.clear()
+    format_paragraph(title.paragraphs[0], "旧タイトル", "Meiryo", 28, True, "123456")
+
+    toc = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(8), Inches(4)).text_frame
+    format_paragraph(toc.paragraphs[0], "1. 大項目", "Yu Gothic", 14, True, "AA0000")
+    format_paragraph(toc.add_paragraph(), "・小項目", "Yu Mincho", 10, False, "0000AA", level=1)
+    return prs, slide
+
+
+def run_format(p):
+    """段落の最初のランの (フォント, 色, サイズ, 太字)"""
+    rPr = p.find(qn('a:r')).find(qn('a:rPr'))
+    latin = rPr.find(qn('a:latin'))
+    color = rPr.find(qn('a:solidFill')).find(qn('a:srgbClr'))
+    return latin.get('typeface'), color.get('val'), rPr.get('sz'), rPr.get('b')
+
+
+def test_prototype_keeps_formatting():
+    _, slide = make_deck()
+    source = source_paragraph(slide.shapes.title.text_frame._txBody)
+    head, run, tail = _build_prototype(source, None, None, None)
+    assert head.startswith('<a:p') and '<a:pPr algn="ctr"' in head, head
+    assert 'typeface="Meiryo"' in run and 'val="123456"' in run and 'sz="2800"' in run, run
+    assert '<a:endParaRPr lang="ja-JP"' in tail and tail.endswith('</a:p>'), tail
+
+    # レベル・サイズ・太字の指定は上書きし、それ以外の書式は残す
+    head, run, _ = _build_prototype(source, 2, 10.5, False)
+    assert 'lvl="2"' in head and 'algn="ctr"' in head, head
+    assert 'sz="1050"' in run and 'b="0"' in run and 'typeface="Meiryo"' in run, run
+    # 元の段落が無くても、指定した書式だけの段落にする
+    head, run, tail = _build_prototype(None, 1, 9, True)
+    assert 'lvl="1"' in head and 'sz="900"' in run and 'b="1"' in run and tail == '</a:p>'
+
+    # 同じ段落・指定の雛形はキャッシュから返す
+    xml_patch._prototypes.clear()
+    assert paragraph_prototype(source, 0, 11, True) is paragraph_prototype(source, 0, 11, True)
+    xml_patch._prototypes.clear()
+
+
+def test_retitle_survives():
+    prs, slide = make_deck()
+    patches = TextPatches()
+    assert patches.retitle(slide, "1. 実施体制 & 品質 <案>")
+    assert slide.shapes.title.text_frame.text == "旧タイトル"     # apply するまでは変えない
+    assert patches.apply() == 1 and len(patches) == 0
+
+    paragraphs = slide.shapes.title.text_frame._txBody.findall(qn('a:p'))
+    assert len(paragraphs) == 1
+    p = paragraphs[0]
+    assert p.find(qn('a:pPr')).get('algn') == 'ctr'
+    assert run_format(p) == ("Meiryo", "123456", "2800", "1")
+    assert p.find(qn('a:endParaRPr')).get('lang') == 'ja-JP'
+    # 記号はエスケープし、読み戻すと元の文字列になる
+    assert slide.shapes.title.text_frame.text == "1. 実施体制 & 品質 <案>"
+
+    saved = BytesIO()
+    prs.save(saved)
+    reopened = Presentation(saved).slides[0].shapes.title
+    assert reopened.text_frame.text == "1. 実施体制 & 品質 <案>"
+    assert reopened.text_frame.paragraphs[0].runs[0].font.name == "Meiryo"
+
+
+def test_toc_rewrite_survives():
+    _, slide = make_deck()
+    shape = slide.shapes[1]
+    patches = TextPatches()
+    patches.replace_paragraphs(shape, [
+        ("1. 実施体制", 0, 11, True),
+        ("・責任者\n・体制図", 1, 9, False),
+        ("2. 品質\x01管理", 0, 11, True),
+    ])
+    patches.apply()
+
+    paragraphs = shape.text_frame._txBody.findall(qn('a:p'))
+    assert len(paragraphs) == 3
+    main, sub, second = paragraphs
+    # 各段落は同じレベルの元の段落の書式を引き継ぎ、サイズ・太字だけ指定に変える
+    assert main.find(qn('a:pPr')).get('algn') == 'ctr' and main.find(qn('a:pPr')).get('lvl') is None
+    assert run_format(main) == ("Yu Gothic", "AA0000", "1100", "1")
+    assert sub.find(qn('a:pPr')).get('lvl') == '1' and sub.find(qn('a:pPr')).get('algn') == 'l'
+    assert run_format(sub) == ("Yu Mincho", "0000AA", "900", "0")
+    assert all(p.find(qn('a:endParaRPr')) is not None for p in paragraphs)
+
+    # 改行は a:br にし、前後のランは同じ書式
+    assert len(sub.findall(qn('a:br'))) == 1
+    runs = sub.findall(qn('a:r'))
+    assert [r.find(qn('a:t')).text for r in runs] == ["・責任者", "・体制図"]
+    assert len({tuple(sorted(r.find(qn('a:rPr')).attrib.items())) for r in runs}) == 1
+    # XML で使えない制御文字は取り除く
+    assert second.find(qn('a:r')).find(qn('a:t')).text == "2. 品質管理"
+
+
+def test_extend_and_empty_apply():
+    _, slide = make_deck()
+    first, second = TextPatches(), TextPatches()
+    first.retitle(slide, "表題")
+    second.replace_paragraphs(slide.shapes[1], [("目次", 0, None, None)])
+    first.extend(second)
+    assert len(first) == 2 and len(second) == 0
+    assert second.apply() == 0
+    assert first.apply() == 2
+    assert slide.shapes.title.text_frame.text == "表題"
+    assert slide.shapes[1].text_frame.text == "目次"
+
+    # タイトルの無いスライドは書き換えない
+    prs = Presentation()
+    blank = prs.slides.add_slide(prs.slide_layouts[6])
+    assert not TextPatches().retitle(blank, "表題")
+
+
+if __name__ == '__main__':
+    for name, check in list(globals().items()):
+        if name.startswith('test_'):
+            check()
+            print(f"OK  {name}")
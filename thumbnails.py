@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スライドのサムネイル（マッチング結果のプレビュー用）
+==============================================
+LibreOffice（headless）でPPTXをPDFに変換し、pdfplumber でページごとにPNGへ描画する。
+PowerPoint は使わない。
+
+サムネイルはテンプレートのハッシュごとのディレクトリに、スライド番号ごとのPNGとして
+キャッシュする。同じテンプレートの2回目以降は変換を行わない。
+
+描画はバックグラウンドのスレッドで行い、同じテンプレートの描画要求は1つにまとめる。
+
+Requirements:
+    LibreOffice（soffice）
+"""
+
+import json
+import shutil
+import logging
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from template_digest import template_digest_key
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+THUMB_WIDTH = 320
+THUMB_CACHE_DIR = Path(__file__).parent / ".thumb_cache"
+# LibreOffice での変換のタイムアウト（秒）
+CONVERT_TIMEOUT = 600
+
+# キャッシュ形式を変えた場合はここを上げる（古いキャッシュを無効化）
+_CACHE_VERSION = 2
+_INDEX_FILE = "index.json"
+
+# 非表示スライドも出力して、PDFのページ番号とスライド番号を一致させる
+_PDF_FILTER = 'pdf:impress_pdf_Export:{"ExportHiddenSlides":{"type":"boolean","value":"true"}}'
+
+# LibreOffice は重いため、描画は1件ずつ行う
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnails")
+_pending: Dict[str, Future] = {}
+_lock = threading.Lock()
+
+
+def find_soffice() -> Optional[str]:
+    """LibreOffice の実行ファイル（無ければ None）"""
+    return shutil.which("soffice") or shutil.which("libreoffice")
+
+
+def is_thumbnail_available() -> bool:
+    """サムネイルの描画が可能か"""
+    return find_soffice() is not None
+
+
+def template_hash(pptx_bytes: bytes, key: Optional[str] = None) -> str:
+    """テンプレートのハッシュ（キャッシュのキー）。key は計算済みの template_digest_key"""
+    return (key or template_digest_key(pptx_bytes))[:16]
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+def _cache_path(tpl_hash: str, width: int, cache_dir: Path) -> Path:
+    return Path(cache_dir) / f"v{_CACHE_VERSION}_{tpl_hash}_{width}"
+
+
+def cached_thumbnails(tpl_hash: str, width: int = THUMB_WIDTH,
+                      cache_dir: Path = THUMB_CACHE_DIR) -> Optional[Dict[int, Path]]:
+    """キャッシュ済みのサムネイル {スライド番号: PNGのパス}（未作成なら None）"""
+    directory = _cache_path(tpl_hash, width, cache_dir)
+    try:
+        index = json.loads((directory / _INDEX_FILE).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    return {int(idx): directory / name for idx, name in index.items()}
+
+
+# ============================================================================
+# Render
+# ============================================================================
+def _convert_to_pdf(pptx_path: Path, out_dir: Path) -> Path:
+    """LibreOffice で PPTX を PDF に変換"""
+    # 同時に別の soffice が動いていても衝突しないよう、プロファイルを分ける
+    profile = (out_dir / "profile").as_uri()
+    subprocess.run(
+        [find_soffice(), f"-env:UserInstallation={profile}", "--headless",
+         "--convert-to", _PDF_FILTER, "--outdir", str(out_dir), str(pptx_path)],
+        check=True, timeout=CONVERT_TIMEOUT,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    pdf_path = out_dir / f"{pptx_path.stem}.pdf"
+    if not pdf_path.exists():
+        raise RuntimeError("LibreOffice によるPDF変換に失敗しました")
+    return pdf_path
+
+
+def render_thumbnails(pptx_bytes: bytes, width: int = THUMB_WIDTH,
+                      cache_dir: Path = THUMB_CACHE_DIR, key: Optional[str] = None) -> Dict[int, Path]:
+    """
+    全スライドのサムネイルを描画してキャッシュする
+
+    Returns:
+        Dict[int, Path]: {スライド番号（0始まり）: PNGのパス}
+    """
+    import pdfplumber
+
+    tpl_hash = template_hash(pptx_bytes, key)
+    cached = cached_thumbnails(tpl_hash, width, cache_dir)
+    if cached is not None:
+        return cached
+
+    if not is_thumbnail_available():
+        raise RuntimeError("LibreOffice（soffice）が見つかりません")
+
+    logger.info(f"サムネイルを描画中: {tpl_hash}")
+    directory = _cache_path(tpl_hash, width, cache_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pptx_path = Path(tmp_dir) / "deck.pptx"
+        pptx_path.write_bytes(pptx_bytes)
+        pdf_path = _convert_to_pdf(pptx_path, Path(tmp_dir))
+
+        index = {}
+        with pdfplumber.open(str(pdf_path)) as pdf:
+            for idx, page in enumerate(pdf.pages):
+                name = f"slide_{idx:04d}.png"
+                page.to_image(width=width).save(str(directory / name), format="PNG")
+                index[idx] = name
+
+    # 目録は最後に書く（途中で失敗したキャッシュを完成扱いにしない）
+    (directory / _INDEX_FILE).write_text(json.dumps(index), encoding='utf-8')
+    logger.info(f"  サムネイル {len(index)} 枚をキャッシュしました")
+    return {idx: directory / name for idx, name in index.items()}
+
+
+def submit_thumbnails(pptx_bytes: bytes, width: int = THUMB_WIDTH,
+                      cache_dir: Path = THUMB_CACHE_DIR, key: Optional[str] = None) -> Future:
+    """
+    サムネイルの描画をバックグラウンドで開始する
+    キャッシュ済みなら完了済みの Future を、描画中なら同じ Future を返す
+    """
+    tpl_hash = template_hash(pptx_bytes, key)
+    cached = cached_thumbnails(tpl_hash, width, cache_dir)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    key = f"{tpl_hash}_{width}"
+    with _lock:
+        future = _pending.get(key)
+        if future is None or future.done():
+            future = _executor.submit(render_thumbnails, pptx_bytes, width, cache_dir, tpl_hash)
+            _pending[key] = future
+        return future
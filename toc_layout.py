@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+目次スライドのレイアウトとページ分割
+================================
+目次に入れる大項目・小項目の描画高さを、フォントサイズと文字幅の概算
+（全角1em・半角約0.55em）とテキストフレームの寸法から見積もる。
+PowerPoint での試し描画は行わない。
+
+1枚に収まらない場合は目次スライドを複製して続きのページを作り、
+目次スライドの直後に挿入する。
+
+目次の段落は xml_patch.TextPatches で、元のテキストフレームの段落書式
+（配置・間隔・箇条書き・フォント）を引き継いだ a:p にまとめて差し替える。
+"""
+
+import math
+import logging
+from copy import deepcopy
+from typing import List, Optional, Sequence, Tuple
+
+from pptx.util import Emu
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+from xml_patch import TextPatches
+
+logger = logging.getLogger(__name__)
+
+# 大項目・小項目の文字サイズ（pt）
+MAIN_FONT_PT = 11
+SUB_FONT_PT = 9
+# 目次に出す小項目の最大件数と最大文字数
+MAX_SUB_ITEMS = 3
+SUB_ITEM_CHARS = 40
+# 行の高さ（フォントサイズに対する倍率）
+LINE_SPACING = 1.2
+# 小項目（level=1）のインデント
+SUB_INDENT = Emu(457200)
+
+_EMU_PER_PT = 12700
+_R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+# 半角文字の幅（em）。ここに無い半角文字は 0.55em、全角は 1em とする
+_NARROW = dict.fromkeys("il.,:;'!|()[]{} ", 0.3)
+_NARROW.update(dict.fromkeys("fjrt", 0.35))
+_WIDE_ASCII = dict.fromkeys("MW@%", 0.85)
+
+
+# ============================================================================
+# Text Metrics
+# ============================================================================
+def text_width_em(text: str) -> float:
+    """文字列の幅（em単位）の概算"""
+    width = 0.0
+    for ch in text:
+        if ord(ch) < 0x80:
+            width += _NARROW.get(ch) or _WIDE_ASCII.get(ch) or 0.55
+        elif 0xFF61 <= ord(ch) <= 0xFF9F:
+            width += 0.5  # 半角カナ
+        else:
+            width += 1.0
+    return width
+
+
+def paragraph_height_pt(text: str, size_pt: float, width_pt: float) -> float:
+    """段落の高さ（pt）。折り返し行数 × 行の高さ"""
+    if width_pt <= 0:
+        return float('inf')
+    lines = max(1, math.ceil(text_width_em(text) * size_pt / width_pt))
+    return lines * size_pt * LINE_SPACING
+
+
+def frame_inner_size_pt(shape) -> Tuple[float, float]:
+    """テキストフレームの内側の幅・高さ（pt）"""
+    tf = shape.text_frame
+    width = shape.width - (tf.margin_left or 0) - (tf.margin_right or 0)
+    height = shape.height - (tf.margin_top or 0) - (tf.margin_bottom or 0)
+    return width / _EMU_PER_PT, height / _EMU_PER_PT
+
+
+# ============================================================================
+# Pagination
+# ============================================================================
+def toc_entries(category) -> List[Tuple[str, int, bool, int]]:
+    """1つの大項目の目次行 [(text, size_pt, bold, level), ...]"""
+    entries = [(f"{category.no}. {category.main_category}", MAIN_FONT_PT, True, 0)]
+    for sub_item in category.sub_items[:MAX_SUB_ITEMS]:
+        entries.append((f"  ・ {sub_item[:SUB_ITEM_CHARS]}", SUB_FONT_PT, False, 1))
+    return entries
+
+
+def paginate_toc(categories: Sequence, width_pt: float, height_pt: float) -> List[List]:
+    """
+    大項目単位（小項目ごと）で目次をページに分ける
+
+    Returns:
+        List[List[Category]]: ページごとの大項目
+    """
+    sub_width = width_pt - SUB_INDENT / _EMU_PER_PT
+    pages = [[]]
+    used = 0.0
+    for cat in categories:
+        block = 0.0
+        for text, size, _, level in toc_entries(cat):
+            block += paragraph_height_pt(text, size, sub_width if level else width_pt)
+        if pages[-1] and used + block > height_pt:
+            pages.append([])
+            used = 0.0
+        pages[-1].append(cat)
+        used += block
+    return pages
+
+
+# ============================================================================
+# Slide Duplication
+# ============================================================================
+def duplicate_slide(prs, index: int, insert_at: int):
+    """
+    スライドを複製して insert_at の位置に挿入する
+    画像等のリレーションは元スライドと同じパーツを参照する（再エンコードしない）
+    """
+    source = prs.slides[index]
+    slide = prs.slides.add_slide(source.slide_layout)
+
+    # レイアウトから自動生成されたプレースホルダーを削除
+    sp_tree = slide.shapes._spTree
+    for shape in list(slide.shapes):
+        sp_tree.remove(shape._element)
+
+    # リレーション（画像・リンク等）をコピーし、rId を対応付ける
+    rid_map = {}
+    for rid, rel in source.part.rels.items():
+        if rel.reltype in (RT.SLIDE_LAYOUT, RT.NOTES_SLIDE):
+            continue
+        if rel.is_external:
+            rid_map[rid] = slide.part.rels.get_or_add_ext_rel(rel.reltype, rel.target_ref)
+        else:
+            rid_map[rid] = slide.part.rels.get_or_add(rel.reltype, rel.target_part)
+
+    for element in source.shapes._spTree.iterchildren():
+        if element.tag.endswith('}nvGrpSpPr') or element.tag.endswith('}grpSpPr'):
+            continue
+        sp_tree.append(deepcopy(element))
+
+    # 背景
+    source_bg = source._element.cSld.bg
+    if source_bg is not None:
+        slide._element.cSld.insert(0, deepcopy(source_bg))
+
+    for element in sp_tree.iter():
+        for key, value in element.attrib.items():
+            if key.startswith(f'{{{_R_NS}}}') and value in rid_map:
+                element.set(key, rid_map[value])
+
+    # add_slide は末尾に追加するので、目的の位置へ移動
+    sld_id_lst = prs.slides._sldIdLst
+    sld_id = sld_id_lst[-1]
+    sld_id_lst.remove(sld_id)
+    sld_id_lst.insert(insert_at, sld_id)
+    return slide
+
+
+def remove_slide(prs, slide):
+    """スライドを削除する（sldIdLst とプレゼンテーションからのリレーションを外す）"""
+    sld_id_lst = prs.slides._sldIdLst
+    for sld_id in sld_id_lst:
+        if int(sld_id.get('id')) == slide.slide_id:
+            prs.part.drop_rel(sld_id.rId)
+            sld_id_lst.remove(sld_id)
+            return
+
+
+# ============================================================================
+# Populate
+# ============================================================================
+def find_toc_shape_index(slide):
+    """目次用テキストボックス（既存テキストのある最大のテキストフレーム）の位置"""
+    target = None
+    max_area = 0
+    for i, shape in enumerate(slide.shapes):
+        if shape.has_text_frame:
+            area = shape.width * shape.height
+            existing_text = shape.text_frame.text.strip()
+            # タイトルやページ番号を除外（小さいテキストや数字のみ）
+            if len(existing_text) > 10 and area > max_area:
+                max_area = area
+                target = i
+    return target
+
+
+def write_toc_frame(shape, categories: Sequence, patches: TextPatches):
+    """テキストフレームを目次で置き換える書き換えを patches に加える（大項目は太字、小項目はインデント）"""
+    paragraphs = [(text, level, size, bold)
+                  for cat in categories for text, size, bold, level in toc_entries(cat)]
+    patches.replace_paragraphs(shape, paragraphs)
+
+
+def _toc_pages(shape, categories: Sequence, paginate: bool) -> List[List]:
+    if not paginate:
+        return [list(categories)]
+    width_pt, height_pt = frame_inner_size_pt(shape)
+    return paginate_toc(categories, width_pt, height_pt)
+
+
+def count_toc_pages(prs, categories: Sequence, toc_slide_index: int = 1, paginate: bool = True) -> int:
+    """
+    populate_toc() で目次が何枚になるかを、スライドを変更せずに見積もる
+    （マッチングの段階で、グループのスライド番号のずれだけを知りたい場合に使う）
+
+    Returns:
+        int: 目次のスライド枚数（目次用のテキストフレームが無ければ 0）
+    """
+    toc_slide = prs.slides[toc_slide_index]
+    shape_index = find_toc_shape_index(toc_slide)
+    if shape_index is None:
+        return 0
+    return len(_toc_pages(toc_slide.shapes[shape_index], categories, paginate))
+
+
+def populate_toc(prs, categories: Sequence, toc_slide_index: int = 1, paginate: bool = True,
+                 patches: Optional[TextPatches] = None) -> int:
+    """
+    目次スライドに審査基準カテゴリを階層構造で入力
+    収まらない場合は目次スライドを複製し、直後に続きのページとして挿入する
+
+    Args:
+        patches: 指定した場合は目次の書き換えを加えるだけで、適用（apply）は呼び出し側で行う
+                 （タイトルの書き換えと合わせて1回で適用するため）
+
+    Returns:
+        int: 目次のスライド枚数（失敗時は 0。複製した続きのページは削除し、目次は変更しない）
+    """
+    logger.info(f"目次スライド（インデックス {toc_slide_index}）にカテゴリを入力中...")
+
+    duplicates = []
+    try:
+        toc_slide = prs.slides[toc_slide_index]
+        shape_index = find_toc_shape_index(toc_slide)
+        if shape_index is None:
+            logger.warning("  目次用のテキストフレームが見つかりませんでした")
+            return 0
+
+        pages = _toc_pages(toc_slide.shapes[shape_index], categories, paginate)
+
+        # 書き込む前に複製する（元のテキストフレームの書式を引き継ぐため）
+        for page in range(1, len(pages)):
+            duplicates.append(duplicate_slide(prs, toc_slide_index, toc_slide_index + page))
+
+        # 途中で失敗した場合に呼び出し側の patches へ書きかけを残さないよう、全ページ分を作ってから渡す
+        toc_patches = TextPatches()
+        for slide, page_categories in zip([toc_slide] + duplicates, pages):
+            write_toc_frame(slide.shapes[shape_index], page_categories, toc_patches)
+        if patches is None:
+            toc_patches.apply()
+        else:
+            patches.extend(toc_patches)
+
+        if len(pages) > 1:
+            logger.info(f"  目次が1枚に収まらないため {len(pages)} 枚に分割しました")
+        logger.info(f"  目次を更新しました: {len(categories)} 項目（階層構造）")
+        return len(pages)
+    except Exception as e:
+        logger.error(f"  目次入力エラー: {e}")
+        import traceback
+        traceback.print_exc()
+        # 複製した続きのページを残すと、本文のスライドとしてグループ化・並べ替えされてしまう
+        for slide in duplicates:
+            remove_slide(prs, slide)
+        return 0
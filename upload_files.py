@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+大きなアップロード・出力ファイルの扱い
+==================================
+アップロードは内容を読む前にサイズの上限を確認し、閾値（UPLOAD_SPOOL_MB）を超えるものは
+一時ファイルへ退避して、pdfplumber / openpyxl / python-docx にはパスを渡す
+（メモリ上の bytes と BytesIO の二重のコピーを作らない）。閾値以下はメモリに置く。
+
+    MAX_CRITERIA_MB=50    審査基準ファイル1つの上限
+    MAX_TEMPLATE_MB=200   テンプレートの上限（.streamlit/config.toml の maxUploadSize 以下）
+    UPLOAD_SPOOL_MB=8     これを超えるアップロードはディスクへ
+
+出力（PPTX / ZIP）は OUTPUT_DIR の一時ファイルに書き、ダウンロード時にディスクから読む。
+アップロードの一時ファイルは close() で、出力は破棄時に削除する。
+セッションが途中で終わって残った出力は、OUTPUT_TTL を過ぎたら prune_outputs() で削除する。
+セッションが保持している出力（OutputLease）は、古くても削除しない。
+"""
+
+import io
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+from typing import BinaryIO, Optional, Set, Union
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+MB = 1024 * 1024
+MAX_CRITERIA_MB = float(os.getenv("MAX_CRITERIA_MB", 50))
+MAX_TEMPLATE_MB = float(os.getenv("MAX_TEMPLATE_MB", 200))
+SPOOL_BYTES = int(float(os.getenv("UPLOAD_SPOOL_MB", 8)) * MB)
+
+UPLOAD_DIR = Path(tempfile.gettempdir()) / "pptx_organizer_uploads"
+OUTPUT_DIR = Path(tempfile.gettempdir()) / "pptx_organizer_outputs"
+# 削除されずに残った出力を消すまでの時間（秒）
+OUTPUT_TTL = 6 * 60 * 60
+
+_CHUNK = 1024 * 1024
+
+# セッションが保持している出力のパス（prune_outputs で削除しない）
+_in_use: Set[str] = set()
+_in_use_lock = threading.Lock()
+
+
+class UploadTooLarge(ValueError):
+    """アップロードがサイズの上限を超えた"""
+
+
+def check_upload_size(name: str, size: int, limit_mb: float):
+    """サイズが上限を超えていれば UploadTooLarge（内容を読む前に呼ぶ）"""
+    if size > limit_mb * MB:
+        raise UploadTooLarge(f"{name} は {size / MB:.1f} MB です（上限 {limit_mb:g} MB）")
+
+
+# ============================================================================
+# Uploads
+# ============================================================================
+class SpooledUpload:
+    """
+    アップロードされたファイル（閾値を超える分はディスクの一時ファイル）
+
+    source() は読み込み側に渡す値で、メモリ上なら BytesIO、ディスク上ならパスを返す。
+    """
+
+    def __init__(self, stream: BinaryIO, name: str, spool_bytes: int = SPOOL_BYTES):
+        self.name = name
+        self.size = 0
+        self.path: Optional[str] = None
+        self._data: Optional[bytes] = None
+        digest = hashlib.sha256()
+        buffer = io.BytesIO()
+        spill = None
+        try:
+            stream.seek(0)
+            for chunk in iter(lambda: stream.read(_CHUNK), b''):
+                digest.update(chunk)
+                self.size += len(chunk)
+                if spill is None and self.size > spool_bytes:
+                    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+                    spill = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, suffix=Path(name).suffix,
+                                                        delete=False)
+                    self.path = spill.name
+                    spill.write(buffer.getbuffer())
+                    buffer = None
+                if spill is not None:
+                    spill.write(chunk)
+                else:
+                    buffer.write(chunk)
+        except BaseException:
+            if spill is not None:
+                spill.close()
+            self.close()
+            raise
+        if spill is not None:
+            spill.close()
+            logger.info(f"アップロードを一時ファイルへ退避しました: {name}（{self.size / MB:.1f} MB）")
+        else:
+            self._data = buffer.getvalue()
+        self.digest = digest.digest()
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
+
+    def source(self) -> Union[str, BinaryIO]:
+        """pdfplumber / openpyxl / python-docx に渡すパスまたはファイルオブジェクト"""
+        return self.path if self.on_disk else io.BytesIO(self._data)
+
+    def read_bytes(self) -> bytes:
+        """内容の bytes（OCR等、パスを受け付けない処理用）"""
+        return Path(self.path).read_bytes() if self.on_disk else self._data
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ============================================================================
+# Outputs
+# ============================================================================
+def new_output_path(suffix: str) -> str:
+    """出力用の空の一時ファイルを作り、そのパスを返す（削除は呼び出し側）"""
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=OUTPUT_DIR)
+    os.close(fd)
+    return path
+
+
+def copy_output_file(path: str) -> str:
+    """出力ファイルを別の一時ファイルへ複製し、そのパスを返す"""
+    copy_path = new_output_path(Path(path).suffix)
+    with open(copy_path, 'wb') as dst, open(path, 'rb') as src:
+        shutil.copyfileobj(src, dst)
+    return copy_path
+
+
+def remove_file(path: Optional[str]):
+    if path and os.path.exists(path):
+        os.unlink(path)
+
+
+def _release_output(path: str):
+    with _in_use_lock:
+        _in_use.discard(path)
+
+
+class OutputLease:
+    """
+    出力ファイルを使用中として登録する（セッションの状態に保持する）
+    release() を呼ぶか、セッションの終了でこのオブジェクトが破棄されると、
+    prune_outputs の削除対象に戻る
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        with _in_use_lock:
+            _in_use.add(self.path)
+        self._finalizer = weakref.finalize(self, _release_output, self.path)
+
+    def release(self):
+        self._finalizer()
+
+
+def prune_outputs(ttl: float = OUTPUT_TTL, directories=(OUTPUT_DIR, UPLOAD_DIR)) -> int:
+    """
+    ttl 秒より古い出力・アップロードの一時ファイルを削除し、削除した数を返す
+    他のセッションが保持している出力（OutputLease）は古くても残す
+    """
+    cutoff = time.time() - ttl
+    removed = 0
+    with _in_use_lock:
+        in_use = set(_in_use)
+    for directory in directories:
+        if not directory.exists():
+            continue
+        for path in directory.iterdir():
+            if os.path.abspath(path) in in_use:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+    if removed:
+        logger.info(f"古い一時ファイルを {removed} 件削除しました")
+    return removed
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+テキストフレームのXMLパッチ（書式を保ったタイトル・目次の書き換え）
+============================================================
+python-pptx で text を代入したり tf.clear() してから段落・ランを1つずつ追加すると、
+テンプレートの段落書式（配置・間隔・箇条書き）やランの書式（フォント・色）が失われる。
+
+ここでは書き換える前のテキストフレームから「書式付きの段落の雛形」
+（a:pPr・最初のランの a:rPr・a:endParaRPr）を取り出し、新しい a:p を文字列として組み立てる。
+TextPatches に書き換えを集めておき、apply() でスライド全体の分を1回のXML解析で作って
+差し替える。雛形は元の段落ごとにキャッシュするため、同じテンプレートでは作り直さない。
+
+    patches = TextPatches()
+    patches.retitle(slide, "1. 実施体制")
+    patches.replace_paragraphs(shape, [("1. 実施体制", 0, 11, True), ...])
+    patches.apply()
+"""
+
+import re
+import logging
+import threading
+from copy import deepcopy
+from typing import Dict, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from lxml import etree
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls, qn
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Settings
+# ============================================================================
+# 雛形のキャッシュの上限（超えたら作り直す）
+PROTOTYPE_CACHE_SIZE = 256
+
+# 雛形の中で本文を入れる位置（私用領域の文字で囲み、本文と衝突しないようにする）
+_SENTINEL = "\ue000TEXT\ue000"
+# XML 1.0 で使えない制御文字（改行・垂直タブは改行 a:br として扱う）
+_INVALID_CHARS = re.compile('[\x00-\x08\x0c\x0e-\x1f]')
+_LINE_BREAK = re.compile('[\n\v]')
+
+_prototypes: Dict[Tuple, Tuple[str, str, str]] = {}
+_lock = threading.Lock()
+
+# (テキスト, レベル, 文字サイズpt, 太字)。None の項目は雛形のまま
+Paragraph = Tuple[str, Optional[int], Optional[float], Optional[bool]]
+
+
+# ============================================================================
+# Prototype
+# ============================================================================
+def _paragraph_level(p) -> int:
+    pPr = p.find(qn('a:pPr'))
+    return int(pPr.get('lvl', 0)) if pPr is not None else 0
+
+
+def source_paragraph(txBody, level: int = 0):
+    """雛形にする段落（同じレベルでランのある最初の段落。無ければランのある最初の段落）"""
+    paragraphs = txBody.findall(qn('a:p'))
+    with_runs = [p for p in paragraphs if p.find(qn('a:r')) is not None]
+    for p in with_runs:
+        if _paragraph_level(p) == level:
+            return p
+    if with_runs:
+        return with_runs[0]
+    return paragraphs[0] if paragraphs else None
+
+
+def _build_prototype(source, level: Optional[int], size_pt: Optional[float],
+                     bold: Optional[bool]) -> Tuple[str, str, str]:
+    """
+    雛形の段落を (段落の開始〜最初のランの直前, ラン, 段落の終わり) の文字列にする
+    ランの a:t は _SENTINEL
+    """
+    p = parse_xml(f'<a:p {nsdecls("a")}/>')
+    pPr = deepcopy(source.find(qn('a:pPr'))) if source is not None else None
+    if level is not None:
+        if level and pPr is None:
+            pPr = parse_xml(f'<a:pPr {nsdecls("a")}/>')
+        if pPr is not None:
+            if level:
+                pPr.set('lvl', str(level))
+            else:
+                pPr.attrib.pop('lvl', None)
+    if pPr is not None:
+        p.append(pPr)
+
+    run = etree.SubElement(p, qn('a:r'))
+    source_run = source.find(qn('a:r')) if source is not None else None
+    rPr = source_run.find(qn('a:rPr')) if source_run is not None else None
+    rPr = deepcopy(rPr) if rPr is not None else None
+    if size_pt is not None or bold is not None:
+        if rPr is None:
+            rPr = etree.Element(qn('a:rPr'))
+        if size_pt is not None:
+            rPr.set('sz', str(int(round(size_pt * 100))))
+        if bold is not None:
+            rPr.set('b', '1' if bold else '0')
+    if rPr is not None:
+        run.append(rPr)
+    etree.SubElement(run, qn('a:t')).text = _SENTINEL
+
+    end = source.find(qn('a:endParaRPr')) if source is not None else None
+    if end is not None:
+        p.append(deepcopy(end))
+
+    xml = etree.tostring(p, encoding='unicode')
+    run_start = xml.index('<a:r>')
+    run_end = xml.index('</a:r>') + len('</a:r>')
+    return xml[:run_start], xml[run_start:run_end], xml[run_end:]
+
+
+def paragraph_prototype(source, level: Optional[int] = None, size_pt: Optional[float] = None,
+                        bold: Optional[bool] = None) -> Tuple[str, str, str]:
+    """雛形の文字列（元の段落と書式の指定ごとにキャッシュ）"""
+    key = (etree.tostring(source) if source is not None else b'', level, size_pt, bold)
+    with _lock:
+        prototype = _prototypes.get(key)
+    if prototype is None:
+        prototype = _build_prototype(source, level, size_pt, bold)
+        with _lock:
+            if len(_prototypes) >= PROTOTYPE_CACHE_SIZE:
+                _prototypes.clear()
+            _prototypes[key] = prototype
+    return prototype
+
+
+def paragraph_xml(prototype: Tuple[str, str, str], text: str) -> str:
+    """雛形に text を入れた a:p の文字列（改行は a:br、ランの書式は各行で同じ）"""
+    head, run, tail = prototype
+    lines = _LINE_BREAK.split(_INVALID_CHARS.sub('', text))
+    runs = '<a:br/>'.join(run.replace(_SENTINEL, escape(line)) for line in lines)
+    return head + runs + tail
+
+
+# ============================================================================
+# Patches
+# ============================================================================
+class TextPatches:
+    """テキストフレームの書き換えを集め、apply() でまとめて差し替える"""
+
+    def __init__(self):
+        self._patches: List[Tuple[object, List[str]]] = []
+
+    def __len__(self):
+        return len(self._patches)
+
+    def replace_paragraphs(self, shape, paragraphs: Sequence[Paragraph]):
+        """
+        テキストフレームの段落を paragraphs で置き換える
+        各段落の書式は、元のテキストフレームの同じレベルの段落を雛形にする
+        """
+        txBody = shape.text_frame._txBody
+        xml = []
+        for text, level, size_pt, bold in paragraphs:
+            source = source_paragraph(txBody, level or 0)
+            xml.append(paragraph_xml(paragraph_prototype(source, level, size_pt, bold), text))
+        self._patches.append((txBody, xml))
+
+    def extend(self, other: 'TextPatches'):
+        """other に集めた書き換えを加える（other は空になる）"""
+        self._patches.extend(other._patches)
+        other._patches = []
+
+    def retitle(self, slide, title: str) -> bool:
+        """タイトルを1段落の title に置き換える（最初の段落・ランの書式を引き継ぐ）"""
+        try:
+            shape = slide.shapes.title
+        except Exception:
+            return False
+        if shape is None or not shape.has_text_frame:
+            return False
+        self.replace_paragraphs(shape, [(title, None, None, None)])
+        return True
+
+    def apply(self) -> int:
+        """集めた書き換えを1回のXML解析で作り、各テキストフレームの段落と差し替える"""
+        if not self._patches:
+            return 0
+        bodies = "".join(f"<a:txBody>{''.join(xml)}</a:txBody>" for _, xml in self._patches)
+        root = parse_xml(f'<patches {nsdecls("a")}>{bodies}</patches>')
+        for (txBody, _), new_body in zip(self._patches, root):
+            for p in txBody.findall(qn('a:p')):
+                txBody.remove(p)
+            txBody.extend(list(new_body))
+        applied = len(self._patches)
+        self._patches = []
+        return applied